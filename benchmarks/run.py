@@ -0,0 +1,194 @@
+from __future__ import annotations
+import os, json, time, shutil, platform, tempfile, tracemalloc
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional
+import typer
+from rich import print
+
+from benchmarks import synthetic
+from src.ste.coverage_map import build_maps
+from src.ste.line_index import build_line_index_db
+from src.ste.storage import load_history, save_history
+from src.ste.path_index import build_path_index, save_path_index
+from src.ste.agent import _affected_tests, _affected_tests_scan, rank_with_explanations
+from src.ste.report import write_report
+from src.ste.replay import commit_cases, parse_sweep, replay
+from src.ste.config import settings
+
+app = typer.Typer(help="STE pipeline benchmarks on synthetic repositories")
+
+STAGES = ["build_maps_db", "build_maps_json", "line_index", "save_history", "load_history", "load_history_select",
+          "path_index", "affected_index", "affected_scan", "rank_greedy", "rank_ratio", "rank_knapsack", "write_report",
+          "replay"]
+OPTIONAL_STAGES = ["build_maps_json", "affected_scan", "replay"]  # slow/huge at the larger sizes; opt in with --stages
+REPLAY_SWEEP = ["budget_tests=25,100", "strategy=greedy,ratio", "weight_fail_rate=0.5,2"]  # 8 configs over every run's commit
+DEFAULT_STAGES = [s for s in STAGES if s not in OPTIONAL_STAGES]
+MIN_SECONDS_DELTA = 0.05   # ignore regressions smaller than this (timer noise)
+MIN_MB_DELTA = 1.0
+
+def _stages(ctx: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+    root, state = ctx["root"], ctx["state"]
+    rank = lambda strategy: rank_with_explanations(ctx["history"], ctx["changed"], 0, 60, index=ctx.get("index"),
+                                                   strategy=strategy, solver_time_limit=1.0)
+    return {
+        "build_maps_db": lambda: build_maps(ctx["db_dir"], root, backend="db"),
+        "build_maps_json": lambda: build_maps(ctx["json_dir"], root, backend="json"),
+        "line_index": lambda: build_line_index_db(ctx["db_dir"], root),
+        "save_history": lambda: save_history(state, ctx["history"]),
+        "load_history": lambda: load_history(state),
+        "load_history_select": lambda: load_history(state, maps=False, runs=False),
+        "path_index": lambda: ctx.__setitem__("index", build_path_index(ctx["history"])),
+        "affected_index": lambda: _affected_tests(ctx["history"], ctx["changed"], ctx["index"]),
+        "affected_scan": lambda: _affected_tests_scan(ctx["history"], ctx["changed"]),
+        "rank_greedy": lambda: ctx.__setitem__("ranked", rank("greedy")),
+        "rank_ratio": lambda: rank("ratio"),
+        "rank_knapsack": lambda: rank("knapsack"),
+        "write_report": lambda: write_report(state, ctx["report"], selection={"selected": ctx["ranked"][0]},
+                                             explanations=ctx["ranked"][1].materialized()),
+        "replay": lambda: replay(state, ctx["cases"], parse_sweep(REPLAY_SWEEP, settings)),
+    }
+
+def _prepare(shape: synthetic.Shape, stages: List[str], work: str) -> Dict[str, Any]:
+    root = os.path.join(work, "repo")
+    ctx: Dict[str, Any] = {"shape": shape, "root": root, "state": os.path.join(work, "state"),
+                           "report": os.path.join(work, "report"), "db_dir": os.path.join(work, "cov_db"),
+                           "json_dir": os.path.join(work, "cov_json"), "changed": synthetic.diff(shape)}
+    setup: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    if {"build_maps_db", "line_index"} & set(stages):
+        os.makedirs(ctx["db_dir"], exist_ok=True)
+        synthetic.write_coverage_db(shape, root, os.path.join(ctx["db_dir"], ".coverage"))
+        setup["coverage_db"] = time.perf_counter() - t0
+    if "build_maps_json" in stages:
+        t0 = time.perf_counter()
+        os.makedirs(ctx["json_dir"], exist_ok=True)
+        synthetic.write_coverage_json(shape, root, os.path.join(ctx["json_dir"], "coverage.json"))
+        setup["coverage_json"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ctx["history"] = synthetic.history(shape, root)
+    setup["history"] = time.perf_counter() - t0
+    ctx["setup"] = setup
+    return ctx
+
+def _run_pass(ctx: Dict[str, Any], stages: List[str], memory: bool) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for name in [s for s in STAGES if s in stages]:
+        if name in ("affected_index", "rank_greedy", "rank_ratio", "rank_knapsack") and "index" not in ctx:
+            ctx["index"] = build_path_index(ctx["history"])  # dependency of a selected stage
+        if name == "write_report" and "ranked" not in ctx:
+            ctx["ranked"] = rank_with_explanations(ctx["history"], ctx["changed"], 0, 60, index=ctx.get("index"))
+        if name in ("load_history", "load_history_select", "write_report") and not os.path.exists(os.path.join(ctx["state"], "history.db")):
+            save_history(ctx["state"], ctx["history"])
+        if name == "replay" and "cases" not in ctx:
+            shape, hist = ctx["shape"], ctx["history"]
+            commits = [synthetic.commit(i) for i in range(shape.runs)]
+            ctx["cases"] = commit_cases(hist.runs, commits, {c: synthetic.commit_diff(shape, i) for i, c in enumerate(commits)})
+        if name == "replay" and not os.path.exists(os.path.join(ctx["state"], "path_index.json")):
+            save_history(ctx["state"], ctx["history"])
+            version = load_history(ctx["state"], maps=False, runs=False).maps_version
+            save_path_index(ctx["state"], build_path_index(ctx["history"]), version)  # workers load it instead of the maps
+        if name == "save_history" and os.path.exists(ctx["state"]):
+            shutil.rmtree(ctx["state"])  # time a full first save every time
+        fn = _stages(ctx)[name]
+        if memory:
+            tracemalloc.start()
+            fn()
+            out[name] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        else:
+            t0 = time.perf_counter()
+            fn()
+            out[name] = time.perf_counter() - t0
+    return out
+
+def run_benchmarks(shape: synthetic.Shape, stages: List[str], repeat: int = 1, memory: bool = True) -> Dict[str, Any]:
+    """Wall time (best of `repeat`) and peak traced memory per stage."""
+    work = tempfile.mkdtemp(prefix="ste_bench_")
+    try:
+        ctx = _prepare(shape, stages, work)
+        seconds: Dict[str, float] = {}
+        for _ in range(max(1, repeat)):
+            for k, v in _run_pass(ctx, stages, memory=False).items():
+                seconds[k] = min(v, seconds.get(k, v))
+        peaks = _run_pass(ctx, stages, memory=True) if memory else {}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        "params": asdict(shape),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "setup_seconds": {k: round(v, 3) for k, v in ctx["setup"].items()},
+        "stages": {k: {"seconds": round(v, 4), **({"peak_mb": round(peaks[k], 2)} if k in peaks else {})}
+                   for k, v in seconds.items()},
+    }
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Stages that got slower (or hungrier) than baseline * (1 + threshold), beyond the noise floors."""
+    if result.get("params") != baseline.get("params"):
+        print("[yellow]Baseline was recorded with different parameters; comparing anyway.[/yellow]")
+    regressions = []
+    for name, cur in result["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        for key, floor in (("seconds", MIN_SECONDS_DELTA), ("peak_mb", MIN_MB_DELTA)):
+            if key in cur and key in base and cur[key] > base[key] * (1 + threshold) and cur[key] - base[key] > floor:
+                regressions.append(f"{name}: {key} {base[key]} -> {cur[key]} (+{(cur[key] / base[key] - 1) * 100:.0f}%)")
+    return regressions
+
+def _print(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    base = (baseline or {}).get("stages", {})
+    print(f"[bold]{result['params']['tests']} tests, {result['params']['files']} files, "
+          f"{result['params']['files_per_test']} files/test[/bold]  (setup {result['setup_seconds']})")
+    for name, cur in result["stages"].items():
+        line = f"  {name:<20} {cur['seconds']:>9.3f}s"
+        if "peak_mb" in cur:
+            line += f" {cur['peak_mb']:>9.1f} MB"
+        if name in base:
+            line += f"   baseline {base[name]['seconds']:.3f}s"
+            if "peak_mb" in base[name]:
+                line += f" / {base[name]['peak_mb']:.1f} MB"
+        print(line)
+
+@app.command()
+def main(size: str = typer.Option("1k", "--size", help=f"{' | '.join(synthetic.SIZES)}"),
+         density: str = typer.Option("sparse", "--density", help="sparse | dense"),
+         tests: Optional[int] = typer.Option(None, "--tests", help="Override the preset test count"),
+         files: Optional[int] = typer.Option(None, "--files", help="Override the preset file count"),
+         stages: Optional[str] = typer.Option(None, "--stages", help=f"Comma list (default: all but {', '.join(OPTIONAL_STAGES)})"),
+         repeat: int = typer.Option(1, "--repeat", help="Timing passes; the best one is kept"),
+         memory: bool = typer.Option(True, "--memory/--no-memory", help="Extra tracemalloc pass for peak memory"),
+         out: Optional[str] = typer.Option(None, "--out", help="Write results JSON here"),
+         baseline: Optional[str] = typer.Option(None, "--baseline", help="Compare against a stored results JSON"),
+         threshold: float = typer.Option(0.25, "--threshold", help="Allowed relative regression per stage")):
+    """Generate a synthetic repo, time each pipeline stage, optionally compare with a baseline."""
+    if size not in synthetic.SIZES or density not in synthetic.DENSITY:
+        print(f"[red]Unknown size/density; sizes: {', '.join(synthetic.SIZES)}, densities: {', '.join(synthetic.DENSITY)}.[/red]")
+        raise typer.Exit(code=2)
+    shape = synthetic.shape(size, density)
+    if tests: shape.tests = tests
+    if files: shape.files = files
+    selected = stages.split(",") if stages else DEFAULT_STAGES
+    unknown = set(selected) - set(STAGES)
+    if unknown:
+        print(f"[red]Unknown stage(s): {', '.join(sorted(unknown))}.[/red]")
+        raise typer.Exit(code=2)
+
+    result = run_benchmarks(shape, selected, repeat=repeat, memory=memory)
+    base = json.loads(open(baseline, "r", encoding="utf-8").read()) if baseline else None
+    _print(result, base)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[green]Wrote {out}[/green]")
+    if base is not None:
+        regressions = compare(result, base, threshold)
+        if regressions:
+            print(f"[red]{len(regressions)} regression(s) beyond {threshold:.0%}:[/red]")
+            for r in regressions:
+                print(f"  - {r}")
+            raise typer.Exit(code=1)
+        print(f"[green]No stage regressed beyond {threshold:.0%}.[/green]")
+
+if __name__ == "__main__":
+    app()
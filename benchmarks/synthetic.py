@@ -0,0 +1,155 @@
+from __future__ import annotations
+import os, json, random
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from src.ste.storage import History, TestStats
+from src.ste.durations import observe
+
+@dataclass
+class Shape:
+    """Size of a synthetic repository."""
+    tests: int
+    files: int
+    files_per_test: int   # sparse ~5, dense ~200
+    lines_per_file: int = 20
+    test_files: int = 0   # tests are spread over this many test modules (default: tests // 20)
+    changed: int = 20     # files in the synthetic diff
+    runs: int = 50        # run records in history
+    seed: int = 0
+
+SIZES = {
+    "1k": (1_000, 10_000),
+    "20k": (20_000, 30_000),
+    "200k": (200_000, 100_000),
+}
+DENSITY = {"sparse": 5, "dense": 200}
+
+def shape(size: str, density: str = "sparse", **overrides) -> Shape:
+    tests, files = SIZES[size]
+    return Shape(tests=tests, files=files, files_per_test=DENSITY[density], **overrides)
+
+def source_files(s: Shape, root: str) -> List[str]:
+    return [os.path.join(root, f"pkg{i % 100}", f"mod{i}.py") for i in range(s.files)]
+
+def nodeids(s: Shape) -> List[str]:
+    n_mod = s.test_files or max(1, s.tests // 20)
+    return [f"tests/test_{t % n_mod}.py::test_{t}" for t in range(s.tests)]
+
+def test_edges(s: Shape, root: str) -> Dict[str, List[str]]:
+    """nodeid -> absolute source files it executes; a few hot files are touched by many tests."""
+    rnd = random.Random(s.seed)
+    files = source_files(s, root)
+    hot = files[: max(1, s.files // 100)]
+    out: Dict[str, List[str]] = {}
+    for nid in nodeids(s):
+        k = min(s.files_per_test, s.files)
+        picked = set(rnd.sample(files, k))
+        picked.add(rnd.choice(hot))
+        out[nid] = sorted(picked)
+    return out
+
+def write_project(s: Shape, root: str, funcs_per_file: int = 4, loop: int = 50) -> List[str]:
+    """
+    A runnable pytest project with the shape's edges: pkg*/mod*.py with `funcs_per_file` small
+    loop functions each, tests/test_*.py whose tests call one function in each of their files.
+    Returns the nodeids. Keep it small (a few thousand tests); every test really runs.
+    """
+    rnd = random.Random(s.seed + 5)
+    body = "".join(f"def f{j}(x):\n    total = 0\n    for i in range({loop}):\n        total += (x * i + {j}) % 7\n"
+                   f"    return total\n\n" for j in range(funcs_per_file))
+    for i in range(s.files):
+        pkg = os.path.join(root, f"pkg{i % 100}")
+        if i < 100:
+            os.makedirs(pkg, exist_ok=True)
+            open(os.path.join(pkg, "__init__.py"), "w").close()
+        with open(os.path.join(pkg, f"mod{i}.py"), "w", encoding="utf-8") as f:
+            f.write(body)
+    os.makedirs(os.path.join(root, "tests"), exist_ok=True)
+    with open(os.path.join(root, "pytest.ini"), "w", encoding="utf-8") as f:
+        f.write("[pytest]\n")
+    by_module: Dict[str, List[Tuple[str, List[str]]]] = {}
+    for nid, files in test_edges(s, root).items():
+        module, name = nid.split("::")
+        mods = [os.path.relpath(f, root)[:-3].replace(os.sep, ".") for f in files]
+        by_module.setdefault(module, []).append((name, mods))
+    for module, tests in by_module.items():
+        imports = sorted({m for _, mods in tests for m in mods})
+        lines = [f"import {m}" for m in imports] + [""]
+        for name, mods in tests:
+            lines.append(f"def {name}():")
+            lines.extend(f"    assert {m}.f{rnd.randrange(funcs_per_file)}({rnd.randint(1, 9)}) >= 0" for m in mods)
+            lines.append("")
+        with open(os.path.join(root, module), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    return nodeids(s)
+
+def write_coverage_db(s: Shape, root: str, path: str) -> str:
+    """coverage.py SQLite data with one `nodeid|run` context per test, as pytest-cov writes it."""
+    from coverage import CoverageData
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(s.seed + 1)
+    data = CoverageData(basename=path)
+    for nid, files in test_edges(s, root).items():
+        data.set_context(f"{nid}|run")
+        data.add_lines({f: rnd.sample(range(1, 400), s.lines_per_file) for f in files})
+    data.write()
+    return path
+
+def write_coverage_json(s: Shape, root: str, path: str) -> str:
+    """coverage.py JSON (format 3) with per-line contexts."""
+    rnd = random.Random(s.seed + 1)
+    files: Dict[str, Dict[str, List[str]]] = {}
+    for nid, fs in test_edges(s, root).items():
+        for f in fs:
+            ctx = files.setdefault(f, {})
+            for ln in rnd.sample(range(1, 400), s.lines_per_file):
+                ctx.setdefault(str(ln), []).append(f"{nid}|run")
+    data = {"meta": {"format": 3, "show_contexts": True}, "files": {f: {"contexts": c} for f, c in files.items()}}
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+    return path
+
+def history(s: Shape, root: str) -> History:
+    """History with maps, stats (incl. duration samples) and run records."""
+    rnd = random.Random(s.seed + 2)
+    h = History(tests={}, coverage_map={}, test_to_files={}, runs=[])
+    for nid, files in test_edges(s, root).items():
+        rel = [os.path.relpath(f, root).replace("\\", "/") for f in files]
+        h.test_to_files[nid] = rel
+        for f in rel:
+            h.coverage_map.setdefault(f, []).append(nid)
+        st = TestStats(nodeid=nid, runs=20, fails=rnd.choice((0, 0, 0, 1, 3)))
+        st.flaky = int(0 < st.fails < st.runs)
+        mu = rnd.uniform(-5, 0)
+        for _ in range(20):
+            d = rnd.lognormvariate(mu, 0.5)
+            st.avg_duration += (d - st.avg_duration) / st.runs
+            observe(st, d)
+        h.tests[nid] = st
+    faults = random.Random(s.seed + 6)
+    for i in range(s.runs):
+        failed = rnd.randint(0, 5)
+        # failures come from tests of the commit's own diff, so replayed selections can catch them
+        mapped = sorted({t for f in commit_diff(s, i) for t in h.coverage_map.get(f, ())})
+        h.runs.append({"time": 1_700_000_000 + i, "project": "synthetic", "count": s.tests, "failed": failed,
+                       "failures": sorted(faults.sample(mapped, min(failed, len(mapped)))), "commit": commit(i)})
+    return h
+
+def commit(i: int) -> str:
+    return f"{i:040x}"
+
+def commit_diff(s: Shape, i: int) -> List[str]:
+    """Changed files of the i-th synthetic commit (the one of run record i)."""
+    rnd = random.Random(s.seed * 100_003 + i + 7)
+    return [f"pkg{j % 100}/mod{j}.py" for j in rnd.sample(range(s.files), min(rnd.randint(1, 5), s.files))]
+
+def diff(s: Shape) -> List[str]:
+    """Changed files: mostly mapped sources, plus a couple nobody covers."""
+    rnd = random.Random(s.seed + 3)
+    picked = rnd.sample(range(s.files), min(s.changed, s.files))
+    return [f"pkg{i % 100}/mod{i}.py" for i in picked] + ["docs/notes.md", "pkg0/new_module.py"]
+
+def hunks(s: Shape) -> Dict[str, List[Tuple[int, int]]]:
+    rnd = random.Random(s.seed + 4)
+    return {f: [(a, a + rnd.randint(0, 5)) for a in rnd.sample(range(1, 400), 3)] for f in diff(s)}
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import os, sys, json, time, shutil, platform, tempfile, subprocess
+from typing import Dict, List, Optional
+import typer
+from rich import print
+
+from benchmarks import synthetic
+from src.ste.coverage_map import TRACE_FILE
+
+app = typer.Typer(help="Per-test mapping overhead: coverage.py contexts vs the STE tracer, on real pytest runs")
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["plain", "coverage", "trace"]
+EXAMPLE = os.path.join(REPO, "examples", "payments")
+
+def _cmd(python: str, mode: str, source: str) -> List[str]:
+    cmd = [python, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-p", "src.ste.pytest_plugin"]
+    if mode == "coverage":
+        cmd += [f"--cov={source}", "--cov-branch", "--cov-context=test", "--cov-report="]
+    elif mode == "trace":
+        cmd += ["-p", "src.ste.trace_plugin"]
+    return cmd + [source]
+
+def _time(python: str, mode: str, root: str, source: str, work: str, repeat: int) -> Dict[str, float]:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = REPO + os.pathsep + root
+    env["STATE_DIR"] = os.path.join(work, "state")
+    env["COVERAGE_FILE"] = os.path.join(work, ".coverage")
+    env["STE_TRACE_OUT"] = os.path.join(work, TRACE_FILE)
+    env["STE_TRACE_SOURCE"] = source
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        code = subprocess.call(_cmd(python, mode, source), cwd=root, env=env, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - t0)
+        if code not in (0, 1):
+            raise RuntimeError(f"{mode} run exited with {code}")
+    return {"seconds": round(best, 3)}
+
+def _mapped(work: str) -> int:
+    path = os.path.join(work, TRACE_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return len(json.load(f)["tests"])
+
+def run_project(python: str, name: str, root: str, source: str, modes: List[str], repeat: int) -> Dict[str, Dict]:
+    out: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory(prefix="ste-tracer-") as work:
+        for mode in modes:
+            out[mode] = _time(python, mode, root, source, work, repeat)
+            if mode == "trace":
+                out[mode]["mapped_tests"] = _mapped(work)
+    if "plain" in out:
+        for mode in out:
+            out[mode]["overhead"] = round(out[mode]["seconds"] / max(out["plain"]["seconds"], 1e-9), 2)
+    print(f"[bold]{name}[/bold] " + "  ".join(f"{m}={r['seconds']:.2f}s" + (f" (x{r['overhead']})" if "overhead" in r else "")
+                                             for m, r in out.items()))
+    return out
+
+@app.command()
+def main(tests: int = typer.Option(2000, "--tests", help="Synthetic tests (each really runs)"),
+         files: int = typer.Option(500, "--files", help="Synthetic source files"),
+         density: str = typer.Option("sparse", "--density", help="sparse | dense"),
+         modes: str = typer.Option(",".join(MODES), "--modes", help=f"Comma list of {' | '.join(MODES)}"),
+         example: bool = typer.Option(True, "--example/--no-example", help="Also time examples/payments"),
+         python: str = typer.Option(sys.executable, "--python", help="Interpreter to run pytest with (3.12+ uses sys.monitoring)"),
+         repeat: int = typer.Option(3, "--repeat", help="Runs per mode; the fastest is kept"),
+         out: Optional[str] = typer.Option(None, "--out", help="Write results JSON here")):
+    """Write a runnable synthetic project and time pytest plain, under coverage contexts and under the tracer."""
+    wanted = [m.strip() for m in modes.split(",") if m.strip()]
+    if not set(wanted) <= set(MODES) or density not in synthetic.DENSITY:
+        print(f"[red]Unknown mode/density; modes: {', '.join(MODES)}, densities: {', '.join(synthetic.DENSITY)}.[/red]")
+        raise typer.Exit(code=2)
+    version = subprocess.check_output([python, "-c", "import platform; print(platform.python_version())"], text=True).strip()
+    shape = synthetic.Shape(tests=tests, files=files, files_per_test=synthetic.DENSITY[density])
+    result = {"python": version, "machine": platform.machine(), "shape": {"tests": tests, "files": files, "density": density},
+              "projects": {}}
+    print(f"[cyan]Python {version}, tracer: {'sys.monitoring' if tuple(map(int, version.split('.')[:2])) >= (3, 12) else 'settrace'}[/cyan]")
+    work = tempfile.mkdtemp(prefix="ste-project-")
+    try:
+        root = os.path.join(work, "repo")
+        synthetic.write_project(shape, root)
+        result["projects"]["synthetic"] = run_project(python, "synthetic", root, root, wanted, repeat)
+        if example:
+            result["projects"]["payments"] = run_project(python, "payments", REPO, EXAMPLE, wanted, repeat)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[green]Wrote {out}[/green]")
+
+if __name__ == "__main__":
+    app()
@@ -1,113 +1,470 @@
 
 import os, json, time
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Set
 import typer
 from rich import print
 
 from src.ste.config import settings
-from src.ste.runner import run_pytest_with_coverage, run_selected_tests
-from src.ste.storage import load_history, save_history, load_last_pytest_report, TestStats
-from src.ste.coverage_map import build_maps
-from src.ste.git_diff import changed_files
-from src.ste.agent import rank_with_explanations
+from src.ste.runner import run_pytest_with_coverage, run_pytest_with_tracer, run_selected_tests, run_shards, shard_env
+from src.ste.sharding import partition, merge_reports, write_merged_report, clear_fragments
+from src.ste.storage import load_history, load_runs, load_meta, save_history, load_last_pytest_report, history_path, TestStats
+from src.ste.selection_cache import selection_key, cache_get, cache_put, cache_stats
+from src.ste.result_cache import record_results, cached_passes
+from src.ste.coverage_map import build_maps, merge_maps, trace_maps, BACKENDS
+from src.ste.git_diff import changes, renamed, changed_files, changed_hunks, head_commit, merge_base, ancestors, commits_in_range
+from src.ste.selector import Snapshot, rank, compute_selection, apply_renames
+from src.ste.server import OVERRIDES as SERVER_OVERRIDES, serve as serve_selections, server_url, call
+from src.ste.replay import SWEEP_KEYS, parse_sweep, commit_cases, label, replay
+from src.ste.baseline import open_store, publish, find_bundle, restore, installed, forget_installed, store_server
+from src.ste.knapsack import STRATEGIES
 from src.ste.report import write_report
-from src.ste.coverage_map import build_maps
-from src.ste.probe import probe_maps
+from src.ste.probe import probe_maps, collect_nodeids
+from src.ste.daemon import serve
+from src.ste.static_map import MAPPERS, static_maps, union_maps
+from src.ste.durations import ESTIMATES, observe, observe_overhead, split_overhead
+from src.ste.timing import phase_seconds, profiled, reset, span
+from src.ste.path_index import build_path_index, save_path_index
+from src.ste.line_index import GRANULARITIES, INDEX_FILE as LINE_INDEX_FILE, build_line_index_from_state, merge_line_index, save_line_index, load_line_index
 
 app = typer.Typer(help="Selective Test Execution (STE) CLI w/ Dev Assistant Agent")
+BASELINE_MODES = ("auto", "fetch", "local")
+RUN_FAILURES_KEPT = 1000  # a collection error failing the whole suite should not bloat every history load
 
-@app.command()
-def record_run(project: Optional[str] = typer.Option(None, "--project", help="Path to tests folder"),
-               pytest_opts: Optional[str] = typer.Option(None, "--pytest-opts", help="Extra pytest opts")):
-    cfg = settings
-    if project: cfg.project_path = project
-    if pytest_opts: cfg.pytest_opts = pytest_opts
+@app.callback()
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, "--profile", help="cProfile the command; pstats go to <state>/profile_<command>.pstats")):
+    """Phase timings of every command land in latest.json (`timings`) and on its run record (`phases`)."""
+    reset(ctx.invoked_subcommand)
+    if profile:
+        prof = profiled(os.path.join(settings.state_dir, f"profile_{ctx.invoked_subcommand}.pstats"))
+        prof.__enter__()
+        ctx.call_on_close(lambda: prof.__exit__(None, None, None))
 
-    code = run_pytest_with_coverage(cfg.project_path, cfg.state_dir, cfg.pytest_opts)
-    if code not in (0, 5):
-        print(f"[yellow]pytest exit code: {code}[/yellow]")
+def _record(cfg, ran_targets: Optional[List[str]], incremental: bool) -> None:
+    """
+    Fold the last coverage (or tracer) run + pytest report into history.
+    Full mode replaces the maps; incremental mode re-maps only the tests that ran.
+    """
+    rpt = load_last_pytest_report(cfg.state_dir)
+    tests = rpt.get("tests", {})
+    ran = set(tests)
 
-    file_to_tests, test_to_files = build_maps(cfg.state_dir, os.getcwd())
+    if cfg.mapper == "trace":
+        file_to_tests, test_to_files = trace_maps(cfg.state_dir)
+    else:
+        file_to_tests, test_to_files = build_maps(cfg.state_dir, os.getcwd(), backend=cfg.coverage_backend)
     hist = load_history(cfg.state_dir)
-    if not file_to_tests:  # contexts missing/empty? fall back to per-test probe
-       print("[yellow]No per-test contexts detected in coverage.json; running per-test probe (one pass) ...[/yellow]")
-       file_to_tests, test_to_files = probe_maps(cfg.project_path, cfg.state_dir, os.getcwd())
+    line_index_path = os.path.join(cfg.state_dir, LINE_INDEX_FILE)
+    if cfg.mapper == "trace":
+        if os.path.exists(line_index_path):
+            os.remove(line_index_path)  # the tracer records files, not lines
+    elif not file_to_tests:  # contexts missing/empty? fall back to per-test probe
+       print("[yellow]No per-test contexts detected in coverage data; running per-test probe (one pass) ...[/yellow]")
+       with span("probe") as s:
+           file_to_tests, test_to_files = probe_maps(cfg.project_path, cfg.state_dir, os.getcwd(), jobs=cfg.probe_jobs,
+                                                     targets=ran_targets)
+           s["counts"].update(files=len(file_to_tests), tests=len(test_to_files))
+       if os.path.exists(line_index_path):
+           os.remove(line_index_path)  # no contexts -> no line-level data
+    else:
+       with span("line_index") as s:
+           line_index = build_line_index_from_state(cfg.state_dir, os.getcwd(), cfg.coverage_backend)
+           if incremental:
+               line_index = merge_line_index(load_line_index(cfg.state_dir), line_index, ran)
+           save_line_index(cfg.state_dir, line_index)
+           s["counts"]["files"] = len(line_index.files)
+    if cfg.mapper == "union":
+        with span("union_maps"):
+            file_to_tests, test_to_files = union_maps(file_to_tests, test_to_files, cfg.project_path, cfg.state_dir,
+                                                      os.getcwd(), known_tests=hist.test_to_files if incremental else ())
 
-    hist.coverage_map = file_to_tests
-    hist.test_to_files = test_to_files
+    commit = head_commit()
+    if incremental:
+        hist.coverage_map, hist.test_to_files = merge_maps(hist.coverage_map, hist.test_to_files, test_to_files, ran)
+        hist.mapped_at.update({t: commit for t in ran | set(test_to_files)})
+    else:
+        hist.coverage_map = file_to_tests
+        hist.test_to_files = test_to_files
+        hist.mapped_at = {t: commit for t in test_to_files}
 
-    hist = load_history(cfg.state_dir)
-    hist.coverage_map = file_to_tests
-    hist.test_to_files = test_to_files
+    _fold_report(cfg, hist, tests, commit, incremental=incremental, **_order_metrics(rpt))
+    if not incremental:
+        _drop_missing(hist, ran | set(test_to_files))
+    save_history(cfg.state_dir, hist)
+    _record_results(cfg, tests, hist.test_to_files)
+    with span("path_index"):
+        save_path_index(cfg.state_dir, build_path_index(hist), hist.maps_version)
+    write_report(cfg.state_dir, cfg.report_dir, selection=None, explanations=None)
 
-    rpt = load_last_pytest_report(cfg.state_dir)
-    tests = rpt.get("tests", {})
-    for nodeid, info in tests.items():
-        st = hist.tests.get(nodeid)
-        if st is None:
-            st = TestStats(nodeid=nodeid, runs=0, fails=0, flaky=0, avg_duration=0.0)
-            hist.tests[nodeid] = st
-        st.runs += 1
-        if info.get("outcome") == "failed":
-            st.fails += 1
-        if st.fails > 0 and st.runs - st.fails > 0:
-            st.flaky = 1
-        dur = float(info.get("duration", 0.0) or 0.0)
-        st.avg_duration = st.avg_duration + (dur - st.avg_duration) / max(st.runs, 1)
+def _record_static(cfg) -> None:
+    """Replace the maps with the static import graph; nothing is executed, so no outcomes are recorded."""
+    t0 = time.perf_counter()
+    hist = load_history(cfg.state_dir, runs=False)
+    with span("static_maps") as s:
+        file_to_tests, test_to_files = static_maps(cfg.project_path, cfg.state_dir, os.getcwd())
+        s["counts"].update(files=len(file_to_tests), tests=len(test_to_files))
+    commit = head_commit()
+    hist.coverage_map, hist.test_to_files = file_to_tests, test_to_files
+    hist.mapped_at = {t: commit for t in test_to_files}
+    for t in test_to_files:
+        hist.tests.setdefault(t, TestStats(nodeid=t))  # known to the ranker, with no runs yet
+    line_index_path = os.path.join(cfg.state_dir, LINE_INDEX_FILE)
+    if os.path.exists(line_index_path):
+        os.remove(line_index_path)  # no line-level data
+    save_history(cfg.state_dir, hist)
+    save_path_index(cfg.state_dir, build_path_index(hist), hist.maps_version)
+    write_report(cfg.state_dir, cfg.report_dir, selection=None, explanations=None)
+    print(f"[green]Static import graph: {len(test_to_files)} tests, {len(file_to_tests)} files "
+          f"in {time.perf_counter() - t0:.2f}s.[/green]")
+
+def _fold_report(cfg, hist, tests, commit: str, **run_fields) -> None:
+    """Update per-test stats from a pytest report and append a run record."""
+    with span("fold_report", tests=len(tests)):
+        samples, overhead = split_overhead(tests, hist.file_overhead)
+        for f, seconds in overhead.items():
+            observe_overhead(hist.file_overhead, f, seconds)
+        for nodeid, info in tests.items():
+            st = hist.tests.get(nodeid)
+            if st is None:
+                st = TestStats(nodeid=nodeid, runs=0, fails=0, flaky=0, avg_duration=0.0)
+                hist.tests[nodeid] = st
+            st.runs += 1
+            if info.get("outcome") == "failed":
+                st.fails += 1
+            if st.fails > 0 and st.runs - st.fails > 0:
+                st.flaky = 1
+            st.avg_duration = st.avg_duration + (samples[nodeid] - st.avg_duration) / max(st.runs, 1)
+            observe(st, samples[nodeid])
 
     hist.runs.append({
         "time": int(time.time()),
         "project": cfg.project_path,
         "count": len(tests),
-        "failed": sum(1 for t in tests.values() if t.get("outcome") == "failed")
+        "failed": sum(1 for t in tests.values() if t.get("outcome") == "failed"),
+        "failures": _failures(tests),
+        "commit": commit,
+        "phases": phase_seconds(),
+        **run_fields,
     })
 
-    save_history(cfg.state_dir, hist)
-    write_report(cfg.state_dir, cfg.report_dir, selection=None, explanations=None)
+def _drop_missing(hist, present: Set[str]) -> None:
+    """After a full run: forget stats and fixture overhead of tests (and test files) that no longer exist."""
+    for nodeid in [t for t in hist.tests if t not in present]:
+        del hist.tests[nodeid]
+    files = {t.split("::", 1)[0] for t in hist.tests}
+    hist.file_overhead = {f: s for f, s in hist.file_overhead.items() if f in files}
+
+def _failures(tests) -> List[str]:
+    """Failed nodeids of a run, kept on its record so `replay` can score selections against them."""
+    return sorted(t for t, info in tests.items() if info.get("outcome") == "failed")[:RUN_FAILURES_KEPT]
+
+def _record_results(cfg, tests, test_to_files=None) -> None:
+    """Content digests of the passing tests (result cache); maps are loaded only if not passed in."""
+    if not cfg.result_cache or not tests:
+        return
+    if test_to_files is None:
+        test_to_files = load_history(cfg.state_dir, runs=False).test_to_files
+    stored, dropped = record_results(cfg.state_dir, tests, test_to_files, cfg.pytest_opts, cfg.project_path)
+    print(f"[green]Result cache: {stored} passing test(s) stored, {dropped} dropped.[/green]")
+
+def _publish_baseline(cfg) -> None:
+    """After record-run: publish the state as HEAD's baseline bundle (BASELINE_STORE)."""
+    store = open_store(cfg.baseline_store)
+    commit = head_commit()
+    if store is None or not commit:
+        forget_installed(cfg.state_dir)
+        return
+    stats = publish(store, cfg.state_dir, commit, cfg)
+    print(f"[green]Published baseline {commit[:12]}: {stats['chunks']} chunk(s), {stats['uploaded']} new "
+          f"({stats['uploaded_bytes'] / 1e6:.1f} MB compressed).[/green]")
+
+def _fetch_baseline(cfg, mode: str) -> Optional[str]:
+    """
+    Restore the bundle of the nearest ancestor of merge-base(base, head) that has one and return its
+    commit: the bundled maps describe that commit's code, so it becomes the diff base.
+    """
+    store = open_store(cfg.baseline_store)
+    if store is None or mode == "local":
+        return None
+    if mode == "auto" and os.path.exists(history_path(cfg.state_dir)):
+        return None
+    start = merge_base(cfg.base_ref, cfg.head_ref) or head_commit(cfg.head_ref)
+    with span("baseline_lookup"):
+        found = find_bundle(store, ancestors(start, cfg.baseline_depth), cfg) if start else None
+    if found is None:
+        print(f"[yellow]No baseline bundle within {cfg.baseline_depth} commits of {start[:12] or cfg.base_ref}; using local state.[/yellow]")
+        return None
+    commit, manifest = found
+    mine = installed(cfg.state_dir)
+    if mine.get("commit") == commit and mine.get("config") == manifest["config"] and os.path.exists(history_path(cfg.state_dir)):
+        print(f"[green]Baseline {commit[:12]} already restored.[/green]")
+        return commit
+    try:
+        stats = restore(store, cfg.state_dir, manifest, cfg)
+    except RuntimeError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+    print(f"[green]Restored baseline {commit[:12]} ({stats['files']} file(s), {stats['bytes'] / 1e6:.1f} MB).[/green]")
+    return commit
+
+def _run_mapped(cfg, targets: Optional[List[str]] = None) -> int:
+    """pytest under whatever records the maps: the STE tracer for --mapper trace, else coverage."""
+    if cfg.mapper == "trace":
+        return run_pytest_with_tracer(cfg.project_path, cfg.state_dir, cfg.pytest_opts, targets)
+    return run_pytest_with_coverage(cfg.project_path, cfg.state_dir, cfg.pytest_opts,
+                                    export_json=cfg.coverage_backend == "json", targets=targets)
+
+def _check_backend(cfg) -> None:
+    if cfg.coverage_backend not in BACKENDS:
+        print(f"[red]Unknown coverage backend {cfg.coverage_backend!r}; expected one of {', '.join(BACKENDS)}.[/red]")
+        raise typer.Exit(code=2)
+
+@app.command()
+def record_run(project: Optional[str] = typer.Option(None, "--project", help="Path to tests folder"),
+               pytest_opts: Optional[str] = typer.Option(None, "--pytest-opts", help="Extra pytest opts"),
+               jobs: Optional[int] = typer.Option(None, "--jobs", help="Parallel probe workers (default: CPU count)"),
+               coverage_backend: Optional[str] = typer.Option(None, "--coverage-backend", help="auto | db | json"),
+               incremental: bool = typer.Option(False, "--incremental", help="Merge edges of the tests that ran instead of replacing the map"),
+               mapper: Optional[str] = typer.Option(None, "--mapper", help="coverage | static (no execution) | union | trace (STE tracer, no coverage.py)")):
+    cfg = settings
+    if project: cfg.project_path = project
+    if pytest_opts: cfg.pytest_opts = pytest_opts
+    if jobs is not None: cfg.probe_jobs = jobs
+    if coverage_backend: cfg.coverage_backend = coverage_backend
+    if mapper: cfg.mapper = mapper
+    _check_backend(cfg)
+    if cfg.mapper not in MAPPERS:
+        print(f"[red]Unknown mapper {cfg.mapper!r}; expected one of {', '.join(MAPPERS)}.[/red]")
+        raise typer.Exit(code=2)
+    if cfg.mapper == "static":
+        _record_static(cfg)
+        _publish_baseline(cfg)
+        return
+
+    code = _run_mapped(cfg)
+    if code not in (0, 5):
+        print(f"[yellow]pytest exit code: {code}[/yellow]")
+
+    _record(cfg, None, incremental)
     print("[green]Recorded run, updated coverage map and history.[/green]")
+    _publish_baseline(cfg)
+
+def _diff(cfg, granularity: str, worktree: bool):
+    """(changed paths, old -> new renames, hunks below file granularity) since the merge-base of base and head (or the working tree)."""
+    with span("git_diff") as s:
+        diff = changes(cfg.base_ref, cfg.head_ref, worktree)
+        hunks = changed_hunks(cfg.base_ref, cfg.head_ref, worktree) if granularity != "file" else None
+        s["counts"]["files"] = len(diff)
+    return [c.path for c in diff], renamed(diff), hunks
+
+def _select_via_server(cfg, granularity: str, no_cache: bool, worktree: bool):
+    """(changed files, renames, result, cache info) from a running `serve`, or None to select locally."""
+    url = server_url(cfg)
+    if not url:
+        return None
+    files, moves, hunks = _diff(cfg, granularity, worktree)
+    req = {"changed_files": files, "renames": moves, "hunks": hunks, "granularity": granularity, "no_cache": no_cache,
+           "state_dir": os.path.abspath(cfg.state_dir), **{k: getattr(cfg, k) for k in SERVER_OVERRIDES}}
+    try:
+        with span("selection_server"):
+            result = call(url, "POST", "/select", req)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"[yellow]Selection server {url} not usable ({e}); selecting locally.[/yellow]")
+        return None
+    print(f"[green]Served by {url} in {result['server_seconds'] * 1000:.0f} ms.[/green]")
+    return files, moves, result, {"hit": result["cache_hit"], "enabled": not no_cache, "server": url, **result["cache"]}
 
 @app.command()
 def select(project: Optional[str] = typer.Option(None, "--project"),
            base: Optional[str] = typer.Option(None, "--base"),
            head: Optional[str] = typer.Option(None, "--head"),
            budget_tests: Optional[int] = typer.Option(None, "--budget-tests"),
-           budget_time_seconds: Optional[int] = typer.Option(None, "--budget-time-seconds")):
+           budget_time_seconds: Optional[int] = typer.Option(None, "--budget-time-seconds"),
+           granularity: str = typer.Option("file", "--granularity", help="file | line | function"),
+           strategy: Optional[str] = typer.Option(None, "--strategy", help="greedy | ratio | knapsack"),
+           no_cache: bool = typer.Option(False, "--no-cache", help="Recompute even if an identical selection is cached"),
+           duration_estimate: Optional[str] = typer.Option(None, "--duration-estimate", help="mean | ewma | p50 | p90 (time budget planning)"),
+           baseline: str = typer.Option("auto", "--baseline", help="auto (fetch a bundle only without local history) | fetch | local"),
+           no_server: bool = typer.Option(False, "--no-server", help="Rank locally even if a selection server is reachable"),
+           worktree: bool = typer.Option(False, "--worktree", help="Diff the working tree (uncommitted and untracked files) instead of --head")):
     cfg = settings
+    if duration_estimate: cfg.duration_estimate = duration_estimate
+    if cfg.duration_estimate not in ESTIMATES:
+        print(f"[red]Unknown duration estimate {cfg.duration_estimate!r}; expected one of {', '.join(ESTIMATES)}.[/red]")
+        raise typer.Exit(code=2)
+    if strategy: cfg.strategy = strategy
+    if cfg.strategy not in STRATEGIES:
+        print(f"[red]Unknown strategy {cfg.strategy!r}; expected one of {', '.join(STRATEGIES)}.[/red]")
+        raise typer.Exit(code=2)
+    if granularity not in GRANULARITIES:
+        print(f"[red]Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}.[/red]")
+        raise typer.Exit(code=2)
     if project: cfg.project_path = project
     if base: cfg.base_ref = base
     if head: cfg.head_ref = head
     if budget_tests is not None: cfg.budget_tests = budget_tests
     if budget_time_seconds is not None: cfg.budget_time_seconds = budget_time_seconds
+    if baseline not in BASELINE_MODES:
+        print(f"[red]Unknown baseline mode {baseline!r}; expected one of {', '.join(BASELINE_MODES)}.[/red]")
+        raise typer.Exit(code=2)
+    served = None if no_server or baseline == "fetch" else _select_via_server(cfg, granularity, no_cache, worktree)
+    if served is not None:
+        files, moves, result, cache = served
+    else:
+        bundle = _fetch_baseline(cfg, baseline)
+        if bundle: cfg.base_ref = bundle
 
-    hist = load_history(cfg.state_dir)
-    files = changed_files(cfg.base_ref, cfg.head_ref)
-
-    selected, explanations = rank_with_explanations(hist, files, cfg.budget_tests, cfg.budget_time_seconds)
+        files, moves, hunks = _diff(cfg, granularity, worktree)
+        with span("cache_lookup"):
+            key = selection_key(load_meta(cfg.state_dir), files, hunks, cfg, granularity, moves)
+            cached = None if no_cache else cache_get(cfg.state_dir, key)
+        result = cached
+        if result is None:
+            result = compute_selection(cfg, Snapshot(cfg.state_dir).renamed(moves), files, hunks, granularity)
+            if not no_cache:
+                cache_put(cfg.state_dir, key, result)
+        cache = {"hit": cached is not None, "enabled": not no_cache, **cache_stats(cfg.state_dir)}
+    if moves:
+        print(f"[green]{len(moves)} renamed/moved file(s) matched under their new paths "
+              f"(`remap` stores that in the history).[/green]")
+    if result["granularity"] != granularity:
+        print("[yellow]No line index in state (record-run without per-test contexts); using file granularity.[/yellow]")
+    selected, explanations = result["selected"], result["explanations"]
 
     sel = {
         "base": cfg.base_ref,
         "head": cfg.head_ref,
+        "worktree": worktree,
         "project": cfg.project_path,
         "changed_files": files,
+        "renames": moves,
+        "granularity": result["granularity"],
+        "strategy": cfg.strategy,
         "selected": selected,
+        "ranked": result.get("ranked", len(explanations)),
+        "priority": result["priority"],
         "budget_tests": cfg.budget_tests,
         "budget_time_seconds": cfg.budget_time_seconds,
+        "duration_estimate": cfg.duration_estimate,
+        "planned_seconds": result["planned_seconds"],
+        "cached_pass": cached_passes(cfg.state_dir, selected, cfg.pytest_opts, cfg.project_path) if cfg.result_cache else [],
+        "cache": cache,
     }
     Path(cfg.state_dir).mkdir(parents=True, exist_ok=True)
     Path(os.path.join(cfg.state_dir, "selection.json")).write_text(json.dumps(sel, indent=2), encoding="utf-8")
     write_report(cfg.state_dir, cfg.report_dir, selection=sel, explanations=explanations)
 
-    print(f"[green]Selected {len(selected)} tests.[/green]")
+    print(f"[green]Selected {len(selected)} tests{' (cached)' if cache['hit'] else ''}, "
+          f"planned {result['planned_seconds']:.1f}s ({cfg.duration_estimate}).[/green]")
+    if sel["cached_pass"]:
+        print(f"[green]{len(sel['cached_pass'])} of them passed before with unchanged dependencies "
+              f"(run-selected --skip-cached skips them).[/green]")
     if selected:
         for t in selected[:10]:
             print("  -", t)
         if len(selected) > 10:
             print(f"  ... and {len(selected)-10} more")
 
+@app.command()
+def remap(base: Optional[str] = typer.Option(None, "--base"),
+          head: Optional[str] = typer.Option(None, "--head")):
+    """
+    Store the committed renames/moves between base and head in the history (edges, test nodeids, path and
+    line index), so selections stop translating them per request; nothing is re-recorded.
+    """
+    cfg = settings
+    if base: cfg.base_ref = base
+    if head: cfg.head_ref = head
+    moves = renamed(changes(cfg.base_ref, cfg.head_ref))
+    if not moves:
+        print(f"[yellow]No renamed or moved files between {cfg.base_ref} and {cfg.head_ref}.[/yellow]")
+        return
+    moved = apply_renames(cfg.state_dir, moves)
+    print(f"[green]{len(moves)} renamed/moved file(s); {moved} path(s)/nodeid(s) remapped in {cfg.state_dir}.[/green]")
+
+@app.command()
+def explain(nodeids: List[str] = typer.Argument(..., help="Test nodeids to explain")):
+    """
+    Explain tests the report left out (it carries the selected tests and the top EXPLAIN_TOP_EXCLUDED
+    excluded ones): re-ranks with the inputs recorded in selection.json.
+    """
+    cfg = settings
+    path = os.path.join(cfg.state_dir, "selection.json")
+    if not os.path.exists(path):
+        print("[red]No selection.json in state; run `select` first.[/red]")
+        raise typer.Exit(code=2)
+    sel = json.loads(Path(path).read_text(encoding="utf-8"))
+    cfg.project_path, cfg.base_ref, cfg.head_ref = sel["project"], sel["base"], sel["head"]
+    cfg.budget_tests, cfg.budget_time_seconds = sel["budget_tests"], sel["budget_time_seconds"]
+    cfg.strategy, cfg.duration_estimate = sel["strategy"], sel.get("duration_estimate", cfg.duration_estimate)
+    granularity = sel.get("granularity", "file")
+    hunks = changed_hunks(cfg.base_ref, cfg.head_ref, sel.get("worktree", False)) if granularity != "file" else None
+    _, explanations, _, _ = rank(cfg, Snapshot(cfg.state_dir).renamed(sel.get("renames", {})), sel["changed_files"], hunks, granularity)
+    missing = 0
+    for nodeid in nodeids:
+        if nodeid not in explanations:
+            print(f"[yellow]{nodeid}: not in history[/yellow]")
+            missing += 1
+            continue
+        print(f"[bold]{nodeid}[/bold]")
+        print(json.dumps(explanations[nodeid], indent=2))
+    if missing:
+        raise typer.Exit(code=1)
+
+@app.command("replay")
+def replay_cmd(commits: str = typer.Option(..., "--commits", help="Commit range to replay, e.g. main~100..main"),
+               sweep: List[str] = typer.Option([], "--sweep", help=f"key=v1,v2 (repeatable; the grid is their product): {', '.join(SWEEP_KEYS)}"),
+               jobs: Optional[int] = typer.Option(None, "--jobs", help="Worker processes (default: CPU count)"),
+               out: Optional[str] = typer.Option(None, "--out", help="Write per-config and per-commit results JSON here")):
+    """
+    Re-run selection for every commit in a range under each config of a sweep, against the stored
+    history, and score it against the failures recorded for those commits.
+    """
+    cfg = settings
+    try:
+        configs = parse_sweep(sweep, cfg)
+    except ValueError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+    shas = commits_in_range(commits)
+    if not shas:
+        print(f"[red]No commits in {commits!r}.[/red]")
+        raise typer.Exit(code=2)
+    if not os.path.exists(history_path(cfg.state_dir)):
+        print("[red]No history in state; run `record-run` first.[/red]")
+        raise typer.Exit(code=2)
+    runs = load_runs(cfg.state_dir)
+    if not any("failures" in r for r in runs):
+        print("[yellow]No run record lists its failures (recorded before replay support); fault recall is unavailable.[/yellow]")
+    with span("replay_diffs", commits=len(shas)):
+        cases = commit_cases(runs, shas, {c: changed_files(f"{c}^", c) for c in shas})
+    t0 = time.perf_counter()
+    with span("replay", commits=len(cases), configs=len(configs)):
+        results = replay(cfg.state_dir, cases, configs, jobs=cfg.probe_jobs if jobs is None else jobs,
+                         solver_time_limit=cfg.solver_time_limit)
+    varied = [k for k in SWEEP_KEYS if len({c[k] for c in configs}) > 1]
+    pct = lambda v: "-" if v is None else f"{v * 100:.1f}%"
+    for r in results:
+        sm = r["summary"]
+        print(f"  {label(r['config'], varied)}: recall {pct(sm['fault_recall'])} ({sm['caught']}/{sm['faults']}), "
+              f"failing commits caught {pct(sm['commits_detected'])}, selected {pct(sm['selected_fraction'])}, "
+              f"time saved {pct(sm['time_saved_fraction'])}")
+    print(f"[green]Replayed {len(cases)} commit(s) x {len(configs)} config(s) in {time.perf_counter() - t0:.1f}s.[/green]")
+    if out:
+        Path(out).write_text(json.dumps({"commits": commits, "results": results}, indent=1), encoding="utf-8")
+        print(f"[green]Wrote {out}[/green]")
+
 @app.command()
 def run_selected(project: Optional[str] = typer.Option(None, "--project"),
-                 pytest_opts: Optional[str] = typer.Option(None, "--pytest-opts")):
+                 pytest_opts: Optional[str] = typer.Option(None, "--pytest-opts"),
+                 record: bool = typer.Option(False, "--record", help="Run under coverage and merge the selected tests' edges into history (incremental)"),
+                 shards: int = typer.Option(1, "--shards", help="Split the selection into N duration-balanced shards (multi-node CI)"),
+                 shard_index: Optional[int] = typer.Option(None, "--shard-index", help="Which shard this node runs (0-based)"),
+                 workers: int = typer.Option(1, "--workers", help="Run N duration-balanced shards in local processes"),
+                 order: bool = typer.Option(False, "--order", help="Run likely-failing tests first (failure probability per second)"),
+                 fail_fast: bool = typer.Option(False, "--fail-fast", help="Stop at the first failure (pytest -x)"),
+                 skip_cached: bool = typer.Option(False, "--skip-cached", help="Skip tests whose last pass had the same file/config digest")):
     cfg = settings
     if project: cfg.project_path = project
     if pytest_opts: cfg.pytest_opts = pytest_opts
@@ -118,9 +475,159 @@ def run_selected(project: Optional[str] = typer.Option(None, "--project"),
         raise typer.Exit(code=2)
     sel = json.loads(Path(sel_path).read_text(encoding="utf-8"))
     selected = sel.get("selected", [])
-    code = run_selected_tests(cfg.project_path, selected, cfg.pytest_opts)
+    if skip_cached:
+        hits = set(cached_passes(cfg.state_dir, selected, cfg.pytest_opts, cfg.project_path))
+        selected = [t for t in selected if t not in hits]
+        sel["skipped_cached"] = sorted(hits)
+        print(f"[green]Skipping {len(hits)} cached-pass test(s); {len(selected)} left to run.[/green]")
+        if not selected:
+            raise typer.Exit(code=0)  # an empty selection would mean "run everything"
+    if record and (shards > 1 or workers > 1):
+        print("[red]--record cannot be combined with --shards/--workers; record shards with merge-reports --record.[/red]")
+        raise typer.Exit(code=2)
+
+    if shards > 1 or workers > 1:
+        if shards > 1 and (shard_index is None or not 0 <= shard_index < shards):
+            print(f"[red]--shards {shards} needs --shard-index in [0, {shards - 1}].[/red]")
+            raise typer.Exit(code=2)
+        if not selected:
+            # an empty selection means "run everything": shard the full suite rather than run nothing
+            selected = collect_nodeids(cfg.project_path)
+            if not selected:
+                print(f"[red]Empty selection and no tests collected under {cfg.project_path}; nothing to shard.[/red]")
+                raise typer.Exit(code=2)
+            print(f"[yellow]Empty selection; sharding the full suite ({len(selected)} tests).[/yellow]")
+        hist = load_history(cfg.state_dir, maps=False, runs=False)
+        plan = partition(selected, hist.tests, shards if shards > 1 else workers)
+        if shards > 1:
+            shard = plan[shard_index]
+            print(f"[green]Shard {shard_index}/{shards}: {len(shard.tests)} tests, predicted {shard.predicted_seconds:.1f}s[/green]")
+            if not shard.tests:
+                raise typer.Exit(code=0)
+            code = run_selected_tests(cfg.project_path, shard.tests, cfg.pytest_opts, shard_env(shard), order, fail_fast)
+            raise typer.Exit(code=code)
+        clear_fragments(cfg.state_dir)
+        code = run_shards(cfg.project_path, plan, cfg.pytest_opts, order, fail_fast)
+        merged, summary = merge_reports(cfg.state_dir)
+        write_merged_report(cfg.state_dir, merged)
+        _print_shards(summary)
+        raise typer.Exit(code=code)
+
+    if not record:
+        code = run_selected_tests(cfg.project_path, selected, cfg.pytest_opts, order=order, fail_fast=fail_fast)
+        _log_selected_run(cfg, sel)
+        raise typer.Exit(code=code)
+
+    _check_backend(cfg)
+    code = _run_mapped(cfg, selected or None)
+    _record(cfg, selected or None, incremental=True)
+    print("[green]Merged selected tests into coverage map and history.[/green]")
     raise typer.Exit(code=code)
 
+def _log_selected_run(cfg, sel) -> None:
+    """Append a run record (no stat updates) so ordering and timing metrics show up in history."""
+    rpt = load_last_pytest_report(cfg.state_dir)
+    tests = rpt.get("tests", {})
+    actual = round(rpt.get("finished_at", 0.0) - rpt.get("started_at", 0.0), 3)
+    hist = load_history(cfg.state_dir, maps=False, runs=False)
+    hist.runs.append({
+        "time": int(time.time()),
+        "project": cfg.project_path,
+        "count": len(tests),
+        "failed": sum(1 for t in tests.values() if t.get("outcome") == "failed"),
+        "failures": _failures(tests),
+        "commit": head_commit(),
+        "kind": "selected",
+        "phases": phase_seconds(),
+        "predicted_seconds": sel.get("planned_seconds"),
+        "actual_seconds": actual,
+        "cached_pass": len(sel.get("skipped_cached", [])),
+        **_order_metrics(rpt),
+    })
+    if "startup_saved_seconds" in rpt:
+        hist.runs[-1]["startup_saved_seconds"] = rpt["startup_saved_seconds"]
+    save_history(cfg.state_dir, hist, stats=False)
+    _record_results(cfg, tests)
+    if sel.get("planned_seconds") is not None:
+        print(f"[green]Wall time: predicted {sel['planned_seconds']:.2f}s ({sel.get('duration_estimate', 'mean')}), actual {actual:.2f}s[/green]")
+    if rpt.get("apfd") is not None:
+        print(f"[green]Order: {rpt.get('order')}, time to first failure {rpt.get('time_to_first_failure')}s, APFD {rpt['apfd']}[/green]")
+
+def _order_metrics(rpt) -> dict:
+    return {
+        "order": rpt.get("order", "default"),
+        "time_to_first_failure": rpt.get("time_to_first_failure"),
+        "apfd": rpt.get("apfd"),
+    }
+
+def _print_shards(summary) -> None:
+    for s in summary:
+        print(f"  shard {s['index']}: {s['count']} tests, predicted {s['predicted_seconds'] or 0:.2f}s, actual {s['actual_seconds']:.2f}s")
+    if summary:
+        print(f"[green]Makespan: predicted {max(s['predicted_seconds'] or 0 for s in summary):.2f}s, "
+              f"actual {max(s['actual_seconds'] for s in summary):.2f}s[/green]")
+
+@app.command("merge-reports")
+def merge_reports_cmd(record: bool = typer.Option(False, "--record", help="Fold the merged outcomes/durations into history")):
+    """Combine shard report fragments in the state dir into last_pytest_report.json."""
+    cfg = settings
+    with span("merge_reports"):
+        merged, summary = merge_reports(cfg.state_dir)
+    if not summary:
+        print("[red]No shard report fragments found.[/red]")
+        raise typer.Exit(code=2)
+    path = write_merged_report(cfg.state_dir, merged)
+    _print_shards(summary)
+    if record:
+        hist = load_history(cfg.state_dir, maps=False, runs=False)
+        _fold_report(cfg, hist, merged["tests"], head_commit(), shards=summary, **_order_metrics(merged))
+        save_history(cfg.state_dir, hist)
+        _record_results(cfg, merged["tests"])
+        write_report(cfg.state_dir, cfg.report_dir, selection=None, explanations=None)
+    print(f"[green]Merged {len(summary)} shard report(s) into {path}[/green]")
+
+@app.command()
+def daemon(project: Optional[str] = typer.Option(None, "--project", help="Path to project under test")):
+    """
+    Keep a warm interpreter with pytest and the project imported; run-selected and the probe's
+    collection are forked from it while it is up (Unix only). Stop with Ctrl+C.
+    """
+    cfg = settings
+    if project: cfg.project_path = project
+    try:
+        serve(cfg.project_path, cfg.state_dir)
+    except RuntimeError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+
+@app.command("serve")
+def serve_cmd(port: Optional[int] = typer.Option(None, "--port", help="Listen on TCP host:port instead of <state>/ste_serve.sock"),
+              host: str = typer.Option("127.0.0.1", "--host"),
+              reload_interval: float = typer.Option(1.0, "--reload-interval", help="Seconds between checks for a changed state dir")):
+    """
+    Keep history and the path index loaded and answer selection requests (POST /select, GET /metrics,
+    GET /healthz); `select` uses it when it is reachable (SELECTION_SERVER or the default socket).
+    """
+    try:
+        serve_selections(settings, host, port, reload_interval)
+    except RuntimeError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+
+@app.command("baseline-server")
+def baseline_server(root: str = typer.Option(..., "--dir", help="Directory holding the bundles"),
+                    host: str = typer.Option("127.0.0.1", "--host"),
+                    port: int = typer.Option(8765, "--port")):
+    """Serve a directory as an HTTP baseline store (GET/HEAD/PUT), e.g. BASELINE_STORE=http://127.0.0.1:8765."""
+    server = store_server(root, host, port)
+    print(f"[green]Baseline store {root} at http://{host}:{server.server_port} (Ctrl+C to stop)[/green]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 @app.command()
 def report():
     cfg = settings
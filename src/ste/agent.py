@@ -1,10 +1,15 @@
 
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, List, Tuple, Set
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Set
 from .storage import History, TestStats
 from .config import settings
-import os
+from .path_index import PathIndex, build_path_index
+from .line_index import LineIndex
+from .knapsack import knapsack, ratio_fill
+from .timing import count, span, timed
+import heapq, os
 
 @dataclass
 class Weights:
@@ -13,17 +18,196 @@ class Weights:
     flaky_rate: float = settings.weight_flaky_rate
     runtime: float = settings.weight_runtime
 
-def _normalize_runtime(stats: Dict[str, TestStats]) -> Dict[str, float]:
-    times = [s.avg_duration for s in stats.values() if s.avg_duration > 0]
+try:
+    import numpy as np
+except ImportError:  # numpy is in requirements.txt; without it the pure-Python columns give identical results, slower
+    np = None
+
+# why a test was left out; the reason text is only rendered when an explanation is asked for
+_NONE, _COUNT_BUDGET, _TIME_BUDGET, _STRATEGY = 0, 1, 2, 3
+
+def _features(tests: List[str], stats: List[TestStats], affected: Set[str]):
+    """Per-test columns (affected, fail_rate, flaky_rate, runtime_norm): numpy arrays when available, else lists."""
+    n = len(tests)
+    if np is not None:
+        aff = np.fromiter((t in affected for t in tests), bool, n)
+        runs, fails, flaky, avg = np.array([(s.runs, s.fails, s.flaky, s.avg_duration) for s in stats], float).reshape(n, 4).T
+        fail = np.divide(fails, runs, out=np.zeros(n), where=runs > 0)
+        flaky = np.divide(flaky, runs, out=np.zeros(n), where=runs > 0)
+        pos = avg > 0
+        rt = np.zeros(n)
+        if pos.any():
+            mn, mx = avg[pos].min(), avg[pos].max()
+            rt[pos] = (avg[pos] - mn) / max(mx - mn, 1e-6)
+        return aff, fail, flaky, rt
+    aff = [t in affected for t in tests]
+    fail = [s.fail_rate for s in stats]
+    flaky = [s.flaky_rate for s in stats]
+    times = [s.avg_duration for s in stats if s.avg_duration > 0]
     if not times:
-        return {k: 0.0 for k in stats.keys()}
+        return aff, fail, flaky, [0.0] * n
     mn, mx = min(times), max(times)
     span = max(mx - mn, 1e-6)
-    return {k: (s.avg_duration - mn) / span if s.avg_duration > 0 else 0.0 for k, s in stats.items()}
+    return aff, fail, flaky, [(s.avg_duration - mn) / span if s.avg_duration > 0 else 0.0 for s in stats]
+
+def _scores(w: Weights, aff, fail, flaky, rt):
+    if np is not None:
+        return w.affected * aff + w.fail_rate * fail + w.flaky_rate * flaky + w.runtime * rt
+    return [w.affected * (1.0 if a else 0.0) + w.fail_rate * f + w.flaky_rate * k + w.runtime * r
+            for a, f, k, r in zip(aff, fail, flaky, rt)]
+
+def _rank_order(aff, scores, k: int = 0) -> List[int]:
+    """
+    Affected first, then by descending score; ties keep history order (stable).
+    `k` > 0: only the first k of that order, without sorting the rest.
+    """
+    n = len(scores)
+    if np is not None:
+        return _top_k(aff, scores, k) if 0 < k < n else np.lexsort((-scores, ~aff)).tolist()
+    key = lambda i: (not aff[i], -scores[i])
+    return heapq.nsmallest(k, range(n), key=key) if 0 < k < n else sorted(range(n), key=key)
+
+def _top_k(aff, scores, k: int) -> List[int]:
+    """First k of the rank order: argpartition finds the k-th key, only the tests up to it (ties too) get sorted."""
+    first, rest = np.flatnonzero(aff), np.flatnonzero(~aff)
+    if k <= len(first):
+        head, pool, need = first[:0], first, k
+    else:
+        head, pool, need = first, rest, k - len(first)
+    neg = -scores[pool]
+    cut = neg[np.argpartition(neg, need - 1)[need - 1]]
+    cand = np.concatenate((head, pool[neg <= cut]))  # ascending ids, so the stable sort keeps history order on ties
+    return cand[np.lexsort((-scores[cand], ~aff[cand]))][:k].tolist()
+
+class Explanations(Mapping):
+    """
+    nodeid -> explanation dict for every ranked test, rendered on access from the ranking columns.
+    `materialized()` is what gets cached and reported: the selected tests plus the top of the excluded list.
+    """
+
+    def __init__(self, tests: List[str], aff, fail, flaky, rt, scores, order: List[int], included: bytearray,
+                 codes: bytearray, weights: Weights, strategy: str, why: str):
+        self.tests, self.order, self.included, self.codes = tests, order, included, codes
+        self._aff, self._scores = aff, scores  # to extend a partial `order` (count budget only) when asked
+        self._cols = tuple(c.tolist() if np is not None else c for c in (aff, fail, flaky, rt, scores))
+        self._weights = {"affected": weights.affected, "fail_rate": weights.fail_rate,
+                         "flaky_rate": weights.flaky_rate, "runtime": weights.runtime}
+        self.strategy, self.why = strategy, why
+        self._ids: Optional[Dict[str, int]] = None
+
+    def __getitem__(self, nodeid: str) -> Dict:
+        if self._ids is None:
+            self._ids = {t: i for i, t in enumerate(self.tests)}
+        return self.explain(self._ids[nodeid])
 
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tests)
 
+    def __len__(self) -> int:
+        return len(self.tests)
 
-def _affected_tests(h: History, changed_files: List[str]) -> Set[str]:
+    def ranked(self, m: int) -> List[int]:
+        """
+        The first m test ids in rank order. `order` can hold only the selected head (a count budget
+        needs no more); it is extended when more is asked for. Included tests always come first then.
+        """
+        if len(self.order) < min(m, len(self.tests)):
+            self.order = _rank_order(self._aff, self._scores, m)
+        return self.order if len(self.order) == len(self.tests) else self.order[:m]
+
+    def explain(self, i: int) -> Dict:
+        aff, fail, flaky, rt, scores = self._cols
+        affected, included = aff[i], bool(self.included[i])
+        return {
+            "affected": affected,
+            "fail_rate": round(fail[i], 3),
+            "flaky_rate": round(flaky[i], 3),
+            "runtime_norm": round(rt[i], 3),
+            "weights": dict(self._weights),
+            "score": round(scores[i], 4),
+            "included": included,
+            "reason": self._reason(self.codes[i], affected, included),
+        }
+
+    def _reason(self, code: int, affected: bool, included: bool) -> str:
+        if included:
+            return "Included: directly affected by changed files." if affected else "Included: high risk score within remaining budget."
+        if code == _COUNT_BUDGET:
+            return "Excluded due to test-count budget (greedy)."
+        if code == _TIME_BUDGET:
+            return "Excluded due to time budget (greedy)."
+        if code == _STRATEGY:
+            if affected:
+                return f"Would be included (affected) but excluded by {self.strategy} strategy: {self.why}."
+            return f"Excluded by {self.strategy} strategy: {self.why}."
+        if affected:
+            return "Would be included (affected) but excluded by budgets."
+        return "Deprioritized: not affected and lower score than budget cutoff."
+
+    def materialized(self, top_excluded: int = settings.explain_top_excluded) -> Dict[str, Dict]:
+        """Selected tests, then the first `top_excluded` excluded ones in rank order (0 = all)."""
+        out: Dict[str, Dict] = {}
+        left = top_excluded or len(self.tests)
+        for i in self.ranked(self.included.count(1) + left):
+            if self.included[i]:
+                out[self.tests[i]] = self.explain(i)
+            elif left > 0:
+                out[self.tests[i]] = self.explain(i)
+                left -= 1
+        return out
+
+AFFECTED_FAIL_PRIOR = 0.2   # assumed failure probability added by touching a changed file
+MIN_DURATION = 0.01         # seconds; keeps instant tests from dividing by zero
+
+def failure_priorities(h: History, tests: List[str], affected: Set[str]) -> Dict[str, float]:
+    """Estimated failure probability per second, used to run likely-failing tests first."""
+    out: Dict[str, float] = {}
+    for t in tests:
+        s = h.tests.get(t, TestStats(nodeid=t))
+        p = 1.0 - (1.0 - s.fail_rate) * (1.0 - (AFFECTED_FAIL_PRIOR if t in affected else 0.0))
+        out[t] = round(p / max(s.avg_duration, MIN_DURATION), 6)
+    return out
+
+def _test_file(nodeid: str) -> str:
+    return nodeid.split("::", 1)[0]
+
+def _trim_to_budget(chosen: Set[int], ordered: List[str], scores: List[float], durs: List[float],
+                    overhead: Dict[str, float], budget_seconds: float) -> Set[int]:
+    """Drop the lowest-risk-per-second picks until durations plus once-per-file overhead fit."""
+    chosen = set(chosen)
+    count: Dict[str, int] = {}
+    for i in chosen:
+        count[_test_file(ordered[i])] = count.get(_test_file(ordered[i]), 0) + 1
+    total = sum(durs[i] for i in chosen) + sum(overhead.get(f, 0.0) for f in count)
+
+    def saving(i: int) -> float:
+        f = _test_file(ordered[i])
+        return durs[i] + (overhead.get(f, 0.0) if count[f] == 1 else 0.0)
+
+    while total > budget_seconds and len(chosen) > 1:
+        i = min(chosen, key=lambda i: (scores[i] / saving(i) if saving(i) > 0 else float("inf"), -i))
+        total -= saving(i)
+        count[_test_file(ordered[i])] -= 1
+        if not count[_test_file(ordered[i])]:
+            del count[_test_file(ordered[i])]
+        chosen.discard(i)
+    return chosen
+
+def _affected_tests(h: History, changed_files: List[str], index: Optional[PathIndex] = None) -> Set[str]:
+    if index is None:
+        index = build_path_index(h)
+    return index.affected(changed_files)
+
+def affected_for_hunks(h: History, hunks: Dict[str, List[Tuple[int, int]]], line_index: LineIndex,
+                       granularity: str, index: Optional[PathIndex] = None) -> Set[str]:
+    """Line/function-level affected set; files the line index doesn't cover fall back to file matching."""
+    affected, unknown = line_index.affected(hunks, granularity)
+    if unknown:
+        affected |= _affected_tests(h, unknown, index)
+    return affected
+
+def _affected_tests_scan(h: History, changed_files: List[str]) -> Set[str]:
+    """Reference full scan over the maps; kept to cross-check PathIndex."""
     def norm(p: str) -> str:
         return p.replace("\\", "/")
 
@@ -49,71 +233,92 @@ def _affected_tests(h: History, changed_files: List[str]) -> Set[str]:
 
     return affected
 
-def rank_with_explanations(h: History, changed_files: List[str], budget_tests: int, budget_seconds: int) -> Tuple[List[str], Dict[str, Dict]]:
+@timed("rank")
+def rank_with_explanations(h: History, changed_files: List[str], budget_tests: int, budget_seconds: int,
+                           index: Optional[PathIndex] = None,
+                           affected: Optional[Set[str]] = None,
+                           strategy: str = "greedy",
+                           solver_time_limit: float = settings.solver_time_limit,
+                           durations: Optional[Dict[str, float]] = None,
+                           file_overhead: Optional[Dict[str, float]] = None,
+                           weights: Optional[Weights] = None,
+                           columns: Optional[tuple] = None) -> Tuple[List[str], Explanations]:
+    """
+    `durations` (default: avg_duration) are the per-test planning times, e.g. p90 from durations.estimate_all;
+    `file_overhead` is module/class fixture time charged once per test file that gets selected;
+    `weights` default to the WEIGHT_* settings; `columns` are _features() of this history and `affected`,
+    when one diff is ranked under several weights/budgets.
+    Scores are computed column-wise (numpy if installed); explanations are rendered lazily, see Explanations.
+    """
     all_tests = list(h.tests.keys())
-    if not all_tests:
-        return [], {}
+    stats = list(h.tests.values())
+    dur = [s.avg_duration for s in stats] if durations is None else [durations.get(t, 0.0) for t in all_tests]
+    overhead = file_overhead or {}
 
-    affected = _affected_tests(h, changed_files)
-    w = Weights()
-    norm_rt = _normalize_runtime(h.tests)
+    if affected is None:
+        with span("affected", changed=len(changed_files)):
+            affected = _affected_tests(h, changed_files, index)
+    w = weights or Weights()
+    aff, fail, flaky, rt = columns if columns is not None else _features(all_tests, stats, affected)
+    scores = _scores(w, aff, fail, flaky, rt)
+    n = len(all_tests)
+    # a count budget alone needs just the top of the ranking
+    top_k = budget_tests if strategy == "greedy" and budget_tests and not budget_seconds and budget_tests < n else 0
+    order = _rank_order(aff, scores, top_k)
 
-    expl: Dict[str, Dict] = {}
-    scores: Dict[str, float] = {}
-    for t in all_tests:
-        s = h.tests.get(t, TestStats(nodeid=t))
-        contrib = {
-            "affected": 1.0 if t in affected else 0.0,
-            "fail_rate": s.fail_rate,
-            "flaky_rate": s.flaky_rate,
-            "runtime_norm": norm_rt.get(t, 0.0),
-        }
-        score = (
-            w.affected * contrib["affected"] +
-            w.fail_rate * contrib["fail_rate"] +
-            w.flaky_rate * contrib["flaky_rate"] +
-            w.runtime * contrib["runtime_norm"]
-        )
-        scores[t] = score
-        expl[t] = {
-            "affected": bool(t in affected),
-            "fail_rate": round(contrib["fail_rate"], 3),
-            "flaky_rate": round(contrib["flaky_rate"], 3),
-            "runtime_norm": round(contrib["runtime_norm"], 3),
-            "weights": {"affected": w.affected, "fail_rate": w.fail_rate, "flaky_rate": w.flaky_rate, "runtime": w.runtime},
-            "score": round(score, 4),
-            "included": False,
-            "reason": "",
-        }
-
-    ordered = sorted(all_tests, key=lambda t: (t not in affected, -scores[t]))
-
-    selected: List[str] = []
-    elapsed = 0.0
-    for t in ordered:
-        if budget_tests and len(selected) >= budget_tests:
-            expl[t]["included"] = False
-            expl[t]["reason"] = "Excluded due to test-count budget."
-            continue
-        if budget_seconds:
-            dur = h.tests.get(t).avg_duration if t in h.tests else 0.0
-            if elapsed + dur > budget_seconds and len(selected) > 0:
-                expl[t]["included"] = False
-                expl[t]["reason"] = "Excluded due to time budget."
-                continue
-            elapsed += dur
-        selected.append(t)
-        expl[t]["included"] = True
-        if t in affected:
-            expl[t]["reason"] = "Included: directly affected by changed files."
+    included, codes = bytearray(n), bytearray(n)
+    picked: List[int] = []
+    why = ""
+    if top_k:
+        codes = bytearray([_COUNT_BUDGET]) * n
+        picked = list(order)
+        for i in picked:
+            codes[i] = _NONE
+    elif strategy == "greedy":
+        elapsed = 0.0
+        paid: Set[str] = set()
+        for k, i in enumerate(order):
+            if budget_tests and len(picked) >= budget_tests:
+                for j in order[k:]:
+                    codes[j] = _COUNT_BUDGET
+                break
+            if budget_seconds:
+                t = all_tests[i]
+                f = _test_file(t) if overhead else ""
+                d = dur[i] + (overhead.get(f, 0.0) if overhead and f not in paid else 0.0)
+                if elapsed + d > budget_seconds and picked:
+                    codes[i] = _TIME_BUDGET
+                    continue
+                elapsed += d
+                paid.add(f)
+            picked.append(i)
+    else:
+        ordered = [all_tests[i] for i in order]
+        sc = scores[order].tolist() if np is not None else [scores[i] for i in order]
+        base = durs = [dur[i] for i in order]
+        if overhead:
+            # file overhead is shared by the file's candidates; the exact cost is enforced after solving
+            files = [_test_file(t) for t in ordered]
+            per_file: Dict[str, int] = {}
+            for f in files:
+                per_file[f] = per_file.get(f, 0) + 1
+            durs = [d + overhead.get(f, 0.0) / per_file[f] for d, f in zip(base, files)]
+        if strategy == "ratio":
+            chosen = ratio_fill(sc, durs, budget_tests, budget_seconds)
+            why = "lower risk per second than the tests that fit the budgets"
         else:
-            expl[t]["reason"] = "Included: high risk score within remaining budget."
-
-    for t in all_tests:
-        if not expl[t]["included"] and not expl[t]["reason"]:
-            if t in affected:
-                expl[t]["reason"] = "Would be included (affected) but excluded by budgets."
+            chosen = knapsack(sc, durs, budget_tests, budget_seconds, solver_time_limit)
+            why = "not in the highest total-risk set that fits the budgets"
+        if budget_seconds and overhead:
+            chosen = _trim_to_budget(chosen, ordered, sc, base, overhead, budget_seconds)
+        for pos, i in enumerate(order):
+            if pos in chosen:
+                picked.append(i)
             else:
-                expl[t]["reason"] = "Deprioritized: not affected and lower score than budget cutoff."
+                codes[i] = _STRATEGY
 
-    return selected, expl
+    for i in picked:
+        included[i] = 1
+    selected = [all_tests[i] for i in picked]
+    count(tests=n, affected=len(affected), selected=len(selected), strategy=strategy)
+    return selected, Explanations(all_tests, aff, fail, flaky, rt, scores, order, included, codes, w, strategy, why)
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import os, json, time, zlib, sqlite3, hashlib
+import urllib.request, urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Tuple
+from .storage import HISTORY_DB, ensure_dir, history_path
+from .path_index import INDEX_FILE as PATH_INDEX_FILE
+from .line_index import INDEX_FILE as LINE_INDEX_FILE
+from .static_map import CACHE_FILE as STATIC_CACHE_FILE
+from .timing import span
+
+BUNDLE_FORMAT = 1
+CHUNK_SIZE = 128 * 1024   # a multiple of SQLite's page size, so unchanged pages of history.db give identical chunks
+STATE_FILE = "baseline.json"  # which bundle the state dir was restored from / published as
+BUNDLED = (HISTORY_DB, PATH_INDEX_FILE, LINE_INDEX_FILE, STATIC_CACHE_FILE)
+
+class DirStore:
+    """Bundle store in a local directory (or a CI cache path): chunks/<ab>/<sha256>, bundles/<key>.json."""
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def get(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        ensure_dir(os.path.dirname(path))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+class HttpStore:
+    """Same layout over plain HTTP: GET/HEAD/PUT <url>/<name>; BASELINE_STORE_TOKEN is sent as a bearer token."""
+    def __init__(self, url: str, token: str = ""):
+        self.url, self.token = url.rstrip("/"), token
+
+    def _request(self, method: str, name: str, data: Optional[bytes] = None) -> Optional[bytes]:
+        req = urllib.request.Request(f"{self.url}/{name}", data=data, method=method)
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def has(self, name: str) -> bool:
+        return self._request("HEAD", name) is not None
+
+    def get(self, name: str) -> Optional[bytes]:
+        return self._request("GET", name)
+
+    def put(self, name: str, data: bytes) -> None:
+        self._request("PUT", name, data)
+
+def open_store(spec: str):
+    """BASELINE_STORE: an http(s):// URL or a directory; empty disables bundles."""
+    if not spec:
+        return None
+    if spec.startswith(("http://", "https://")):
+        return HttpStore(spec, os.getenv("BASELINE_STORE_TOKEN", ""))
+    return DirStore(spec)
+
+def config_digest(cfg) -> str:
+    """Tool and config version part of a bundle key: state from another layout or mapper is not reused."""
+    parts = {"format": BUNDLE_FORMAT, "project": cfg.project_path, "mapper": cfg.mapper}
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:12]
+
+def bundle_name(commit: str, cfg) -> str:
+    return f"bundles/{commit}-{config_digest(cfg)}.json"
+
+def _chunk_name(cid: str) -> str:
+    return f"chunks/{cid[:2]}/{cid}"
+
+def _snapshot_db(state_dir: str, out: str) -> None:
+    """Consistent copy of history.db (WAL included) via the backup API; page layout is kept, so chunks dedupe."""
+    src = sqlite3.connect(history_path(state_dir))
+    dst = sqlite3.connect(out)
+    try:
+        src.backup(dst)
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+def publish(store, state_dir: str, commit: str, cfg) -> Dict[str, int]:
+    """Upload the state dir as a bundle for `commit`; chunks the store already has are skipped."""
+    files: Dict[str, Dict] = {}
+    stats = {"files": 0, "bytes": 0, "chunks": 0, "uploaded": 0, "uploaded_bytes": 0}
+    with span("baseline_publish") as s:
+        snap = os.path.join(state_dir, f".{HISTORY_DB}.snapshot")
+        _snapshot_db(state_dir, snap)
+        try:
+            for name in BUNDLED:
+                path = snap if name == HISTORY_DB else os.path.join(state_dir, name)
+                if not os.path.exists(path):
+                    continue
+                digest, chunks, size = hashlib.sha256(), [], 0
+                with open(path, "rb") as f:
+                    while True:
+                        block = f.read(CHUNK_SIZE)
+                        if not block:
+                            break
+                        digest.update(block)
+                        size += len(block)
+                        cid = hashlib.sha256(block).hexdigest()
+                        chunks.append(cid)
+                        stats["chunks"] += 1
+                        if not store.has(_chunk_name(cid)):
+                            data = zlib.compress(block, 6)
+                            store.put(_chunk_name(cid), data)
+                            stats["uploaded"] += 1
+                            stats["uploaded_bytes"] += len(data)
+                files[name] = {"size": size, "sha256": digest.hexdigest(), "chunks": chunks}
+                stats["files"] += 1
+                stats["bytes"] += size
+        finally:
+            os.remove(snap)
+        manifest = {"format": BUNDLE_FORMAT, "commit": commit, "config": config_digest(cfg),
+                    "created_at": int(time.time()), "chunk_size": CHUNK_SIZE, "files": files}
+        store.put(bundle_name(commit, cfg), json.dumps(manifest, indent=1).encode())  # last: the bundle is complete
+        _write_state(state_dir, commit, cfg)
+        s["counts"].update(stats)
+    return stats
+
+def find_bundle(store, commits: Iterable[str], cfg) -> Optional[Tuple[str, Dict]]:
+    """First of `commits` (nearest first) that has a bundle for this config: (commit, manifest)."""
+    for commit in commits:
+        data = store.get(bundle_name(commit, cfg))
+        if data is not None:
+            return commit, json.loads(data)
+    return None
+
+def restore(store, state_dir: str, manifest: Dict, cfg) -> Dict[str, int]:
+    """Replace the bundled state files with the bundle's; each file is verified before it is swapped in."""
+    ensure_dir(state_dir)
+    stats = {"files": 0, "bytes": 0, "chunks": 0}
+    with span("baseline_restore") as s:
+        for name in BUNDLED:
+            path = os.path.join(state_dir, name)
+            meta = manifest["files"].get(name)
+            if meta is None:
+                if os.path.exists(path):
+                    os.remove(path)  # e.g. no line index in the baseline: a stale local one must not be used
+                continue
+            tmp = f"{path}.{os.getpid()}.tmp"
+            digest, missing = hashlib.sha256(), None
+            with open(tmp, "wb") as f:
+                for cid in meta["chunks"]:
+                    data = store.get(_chunk_name(cid))
+                    if data is None:
+                        missing = cid
+                        break
+                    block = zlib.decompress(data)
+                    digest.update(block)
+                    f.write(block)
+                    stats["chunks"] += 1
+            if missing or digest.hexdigest() != meta["sha256"]:
+                os.remove(tmp)
+                problem = f"is missing chunk {missing}" if missing else f"has a corrupt {name}"
+                raise RuntimeError(f"baseline bundle for {manifest['commit'][:12]} {problem}")
+            if name == HISTORY_DB:
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            os.replace(tmp, path)
+            stats["files"] += 1
+            stats["bytes"] += meta["size"]
+        _write_state(state_dir, manifest["commit"], cfg)
+        s["counts"].update(stats)
+    return stats
+
+def installed(state_dir: str) -> Dict[str, str]:
+    p = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(p):
+        return {}
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def forget_installed(state_dir: str) -> None:
+    """The state dir no longer matches a bundle (recorded locally without publishing)."""
+    p = os.path.join(state_dir, STATE_FILE)
+    if os.path.exists(p):
+        os.remove(p)
+
+def _write_state(state_dir: str, commit: str, cfg) -> None:
+    with open(os.path.join(state_dir, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump({"commit": commit, "config": config_digest(cfg)}, f)
+
+class _StoreHandler(BaseHTTPRequestHandler):
+    """GET/HEAD/PUT on a DirStore; enough of an HTTP store for local use and tests."""
+    store: DirStore
+
+    def _name(self) -> Optional[str]:
+        name = self.path.split("?", 1)[0].lstrip("/")
+        parts = name.split("/")
+        return name if parts[0] in ("chunks", "bundles") and ".." not in parts else None
+
+    def _send(self, code: int, data: bytes = b"", body: bool = True) -> None:
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body and data:
+            self.wfile.write(data)
+
+    def do_GET(self, body: bool = True) -> None:
+        name = self._name()
+        data = self.store.get(name) if name else None
+        if data is None:
+            return self._send(404)
+        self._send(200, data, body)
+
+    def do_HEAD(self) -> None:
+        self.do_GET(body=False)
+
+    def do_PUT(self) -> None:
+        name = self._name()
+        if name is None:
+            return self._send(400)
+        self.store.put(name, self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self._send(201)
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+def store_server(root: str, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """HTTP stand-in for a bundle store, serving `root`; port 0 picks a free one (server.server_port)."""
+    handler = type("StoreHandler", (_StoreHandler,), {"store": DirStore(root)})
+    return ThreadingHTTPServer((host, port), handler)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import sys, base64
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+class StringTable:
+    """Interned strings: dense ids in insertion order, both directions."""
+    __slots__ = ("names", "ids")
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = list(names)
+        self.ids: Dict[str, int] = {s: i for i, s in enumerate(self.names)}
+
+    def intern(self, s: str) -> int:
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.names)
+            self.names.append(s)
+        return i
+
+    def get(self, s: str) -> Optional[int]:
+        return self.ids.get(s)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+class CSR:
+    """
+    Compressed sparse rows: row i's column ids are targets[offsets[i]:offsets[i + 1]],
+    two flat uint32 arrays instead of a list of Python int lists (4 bytes per edge).
+    """
+    __slots__ = ("offsets", "targets")
+
+    def __init__(self, offsets: Optional[array] = None, targets: Optional[array] = None):
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self.targets = targets if targets is not None else array("I")
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[int]]) -> CSR:
+        m = cls()
+        for row in rows:
+            m.targets.extend(row)
+            m.offsets.append(len(m.targets))
+        return m
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row(self, i: int) -> array:
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def union(self, rows: Iterable[int]) -> Set[int]:
+        """Column ids present in any of `rows` (the affected-set operation)."""
+        out: Set[int] = set()
+        o, t = self.offsets, self.targets
+        for r in rows:
+            out.update(t[o[r]:o[r + 1]])
+        return out
+
+    def transpose(self, n_cols: int) -> CSR:
+        """Column -> rows, by counting sort; rows come out sorted within each column."""
+        counts = array("I", bytes(4 * (n_cols + 1)))
+        for c in self.targets:
+            counts[c + 1] += 1
+        for c in range(n_cols):
+            counts[c + 1] += counts[c]
+        offsets = array("I", counts)
+        targets = array("I", bytes(4 * len(self.targets)))
+        o = self.offsets
+        for r in range(len(self)):
+            for c in self.targets[o[r]:o[r + 1]]:
+                targets[counts[c]] = r
+                counts[c] += 1
+        return CSR(offsets, targets)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.offsets) + len(self.targets)) * self.targets.itemsize
+
+    def to_json(self) -> Dict[str, str]:
+        return {"offsets": _b64(self.offsets), "targets": _b64(self.targets)}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, str]) -> CSR:
+        return cls(_unb64(data["offsets"]), _unb64(data["targets"]))
+
+def _b64(a: array) -> str:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return base64.b64encode(a.tobytes()).decode("ascii")
+
+def _unb64(s: str) -> array:
+    a = array("I")
+    a.frombytes(base64.b64decode(s))
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+class MapView(Mapping):
+    """Read-only `key -> [values]` over interned ids; what History.coverage_map / test_to_files hand out."""
+    __slots__ = ("keys_", "values_", "csr")
+
+    def __init__(self, keys: StringTable, values: StringTable, csr: CSR):
+        self.keys_, self.values_, self.csr = keys, values, csr
+
+    def __getitem__(self, key: str) -> List[str]:
+        i = self.keys_.ids.get(key)
+        if i is None:
+            raise KeyError(key)
+        names = self.values_.names
+        return [names[j] for j in self.csr.row(i)]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.keys_.ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys_.names)
+
+    def __len__(self) -> int:
+        return len(self.keys_.names)
+
+class CompactMaps:
+    """Both directions of the file <-> test relation: two string tables and two CSR matrices."""
+    __slots__ = ("paths", "tests", "by_file", "by_test")
+
+    def __init__(self, paths: StringTable, tests: StringTable, by_file: CSR, by_test: CSR):
+        self.paths, self.tests, self.by_file, self.by_test = paths, tests, by_file, by_test
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Tuple[str, str]]) -> CompactMaps:
+        """(file, nodeid) pairs sorted by file, e.g. straight from the edges table's primary key."""
+        paths, tests, by_file = StringTable(), StringTable(), CSR()
+        last = None
+        for f, nodeid in edges:
+            if f != last:
+                if last is not None:
+                    by_file.offsets.append(len(by_file.targets))
+                paths.intern(f)
+                last = f
+            by_file.targets.append(tests.intern(nodeid))
+        if last is not None:
+            by_file.offsets.append(len(by_file.targets))
+        return cls(paths, tests, by_file, by_file.transpose(len(tests)))
+
+    @property
+    def coverage_map(self) -> MapView:
+        return MapView(self.paths, self.tests, self.by_file)
+
+    @property
+    def test_to_files(self) -> MapView:
+        return MapView(self.tests, self.paths, self.by_test)
@@ -12,6 +12,19 @@ class Settings:
     base_ref: str = os.getenv("BASE_BRANCH", "HEAD~1")
     head_ref: str = os.getenv("HEAD_REF", "HEAD")
     pytest_opts: str = os.getenv("PYTEST_OPTS", "")
+    strategy: str = os.getenv("STRATEGY", "greedy")  # greedy | ratio | knapsack
+    solver_time_limit: float = float(os.getenv("SOLVER_TIME_LIMIT", "1.0"))
+    coverage_backend: str = os.getenv("COVERAGE_BACKEND", "auto")  # auto | db | json
+    probe_jobs: int = int(os.getenv("PROBE_JOBS", "0"))  # 0 = CPU count
+    mapper: str = os.getenv("MAPPER", "coverage")  # coverage | static | union | trace
+    duration_estimate: str = os.getenv("DURATION_ESTIMATE", "mean")  # mean | ewma | p50 | p90
+    report_page_size: int = int(os.getenv("REPORT_PAGE_SIZE", "1000"))  # rows per dashboard page
+    report_gzip: bool = os.getenv("REPORT_GZIP", "0") == "1"
+    result_cache: bool = os.getenv("RESULT_CACHE", "1") == "1"  # store content digests of passing tests
+    baseline_store: str = os.getenv("BASELINE_STORE", "")  # directory or http(s):// URL for baseline bundles
+    baseline_depth: int = int(os.getenv("BASELINE_DEPTH", "50"))  # ancestors of the merge-base searched for a bundle
+    selection_server: str = os.getenv("SELECTION_SERVER", "")  # http://host:port or unix:/path (default: state/ste_serve.sock if present)
+    explain_top_excluded: int = int(os.getenv("EXPLAIN_TOP_EXCLUDED", "1000"))  # excluded tests explained in the report (0 = all)
 
     # Agent weights
     weight_affected: float = float(os.getenv("WEIGHT_AFFECTED", "1.0"))
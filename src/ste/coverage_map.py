@@ -1,14 +1,84 @@
 from __future__ import annotations
-from typing import Dict, List, Set, Tuple
-import os
+from typing import Dict, Iterator, List, Set, Tuple
+import os, json
 from .storage import load_coverage_json
+from .timing import count, timed
 
-def build_maps(state_dir: str, project_root: str) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+COVERAGE_DB = ".coverage"
+TRACE_FILE = "trace_map.json"   # written by trace_plugin
+BACKENDS = ("auto", "db", "json")
+
+def coverage_db_path(state_dir: str) -> str:
+    return os.path.join(state_dir, COVERAGE_DB)
+
+@timed("build_maps")
+def build_maps(state_dir: str, project_root: str, backend: str = "auto") -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
     """
     Build:
       file_to_tests: file -> [pytest nodeids]
       test_to_files: pytest nodeid -> [files]
 
+    backend:
+      db    read state/.coverage through coverage.CoverageData, one file at a time
+      json  parse state/coverage.json (compatibility fallback)
+      auto  db when state/.coverage exists, else json
+    """
+    if backend == "json" or (backend == "auto" and not os.path.exists(coverage_db_path(state_dir))):
+        file_to_tests, test_to_files = _build_maps_json(state_dir, project_root)
+        count(files=len(file_to_tests), tests=len(test_to_files), backend="json")
+        return file_to_tests, test_to_files
+
+    file_to_tests: Dict[str, Set[str]] = {}
+    test_to_files: Dict[str, Set[str]] = {}
+    for rel, line_ctxs in iter_coverage_db(state_dir, project_root):
+        ctx_names: Set[str] = set()
+        for ctxs in line_ctxs.values():
+            ctx_names.update(ctxs)
+        for ctx_name in ctx_names:
+            nodeid = _extract_nodeid(ctx_name)
+            if not nodeid:
+                continue
+            file_to_tests.setdefault(rel, set()).add(nodeid)
+            test_to_files.setdefault(nodeid, set()).add(rel)
+
+    count(files=len(file_to_tests), tests=len(test_to_files), backend="db")
+    return (
+        {k: sorted(v) for k, v in file_to_tests.items()},
+        {k: sorted(v) for k, v in test_to_files.items()},
+    )
+
+@timed("build_maps")
+def trace_maps(state_dir: str) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """Maps from the STE tracer's output (record-run --mapper trace); paths are already relative."""
+    path = os.path.join(state_dir, TRACE_FILE)
+    if not os.path.exists(path):
+        return {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    test_to_files: Dict[str, List[str]] = {t: fs for t, fs in data.get("tests", {}).items() if fs}
+    file_to_tests: Dict[str, List[str]] = {}
+    for nodeid, files in test_to_files.items():
+        for f in files:
+            file_to_tests.setdefault(f, []).append(nodeid)
+    count(files=len(file_to_tests), tests=len(test_to_files), backend=data.get("tracer", "trace"))
+    return {k: sorted(v) for k, v in file_to_tests.items()}, test_to_files
+
+def iter_coverage_db(state_dir: str, project_root: str) -> Iterator[Tuple[str, Dict[int, List[str]]]]:
+    """
+    Stream (relative path, {line: [contexts]}) per measured file straight from the
+    coverage SQLite database, so only one file's contexts are in memory at a time.
+    """
+    db = coverage_db_path(state_dir)
+    if not os.path.exists(db):
+        return
+    from coverage import CoverageData  # optional at import time; only the db backend needs it
+    data = CoverageData(basename=db)
+    data.read()
+    for fpath in sorted(data.measured_files()):
+        yield _relpath_norm(fpath, project_root), data.contexts_by_lineno(fpath)
+
+def _build_maps_json(state_dir: str, project_root: str) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
     Robust across coverage.py JSON variants:
     - contexts at file level
     - contexts nested under functions/classes
@@ -51,24 +121,62 @@ def build_maps(state_dir: str, project_root: str) -> Tuple[Dict[str, List[str]],
         {k: sorted(v) for k, v in test_to_files.items()},
     )
 
+def merge_maps(coverage_map: Dict[str, List[str]], test_to_files: Dict[str, List[str]],
+               new_test_to_files: Dict[str, List[str]], ran: Set[str]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    Incremental update: every test in `ran` gets exactly the files it touched in the
+    new measurement (stale edges dropped); edges of tests that did not run are kept.
+    """
+    file_to_tests: Dict[str, Set[str]] = {k: set(v) for k, v in coverage_map.items()}
+    merged: Dict[str, List[str]] = dict(test_to_files)
+    for nodeid in ran | set(new_test_to_files):
+        for f in merged.pop(nodeid, []):
+            tests = file_to_tests.get(f)
+            if tests is not None:
+                tests.discard(nodeid)
+        files = new_test_to_files.get(nodeid)
+        if files:
+            merged[nodeid] = sorted(files)
+            for f in files:
+                file_to_tests.setdefault(f, set()).add(nodeid)
+    return (
+        {k: sorted(v) for k, v in file_to_tests.items() if v},
+        merged,
+    )
+
 def _collect_context_names(ctx, out: Set[str]) -> None:
-    """Accept dict({ctx: ...}) or list([ctx, ...]) and add context names to out."""
+    """
+    Accept dict({ctx: ...}), coverage.py's line-keyed dict({"12": [ctx, ...]})
+    or list([ctx, ...]) and add context names to out.
+    """
     if not ctx:
         return
     if isinstance(ctx, dict):
-        out.update(ctx.keys())
+        for k, v in ctx.items():
+            if str(k).isdigit() and isinstance(v, list):
+                out.update(str(x) for x in v)
+            else:
+                out.add(k)
     elif isinstance(ctx, list):
         out.update([str(x) for x in ctx])
 
+_PHASES = ("setup", "run", "teardown")
+
 def _extract_nodeid(ctx_name: str) -> str | None:
     """
     Accepts:
       - "test_function: tests/test_x.py::test_y"
       - "tests/test_x.py::test_y"
+      - "tests/test_x.py::test_y|run" (pytest-cov --cov-context=test; setup/teardown phases too)
       - Windows paths are fine.
+    Only a trailing |setup, |run or |teardown is a phase: parametrize ids may contain "|" themselves.
     """
-    tail = ctx_name.split(":", 1)[-1].strip()
-    return tail if "::" in tail else None
+    name, sep, phase = ctx_name.rpartition("|")
+    name = (name if sep and phase.strip() in _PHASES else ctx_name).strip()
+    head, sep, tail = name.partition(": ")
+    if sep and "::" in tail:
+        name = tail.strip()
+    return name if "::" in name else None
 
 def _relpath_norm(path: str, root: str) -> str:
     try:
@@ -0,0 +1,203 @@
+from __future__ import annotations
+import os, io, gc, sys, json, time, signal, socket, socketserver
+from typing import Dict, List, Optional, Tuple
+
+SOCKET_NAME = "ste_daemon.sock"
+_TRAILER = b"\n\x00ste-daemon "  # precedes the JSON result after the child's output
+_KEEP = ("src.ste", "src.cli")    # our own code stays loaded across reloads
+
+def socket_path(state_dir: str) -> str:
+    return os.path.join(state_dir, SOCKET_NAME)
+
+class _CollectTimer:
+    """Preload-time cost of collecting (importing) each test module."""
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.started: Dict[str, Tuple[str, float]] = {}
+
+    def pytest_collectstart(self, collector):
+        import pytest
+        if isinstance(collector, pytest.Module):
+            self.started[collector.nodeid] = (str(collector.path), time.perf_counter())
+
+    def pytest_collectreport(self, report):
+        if report.nodeid in self.started:
+            path, t0 = self.started.pop(report.nodeid)
+            self.seconds[path] = time.perf_counter() - t0
+
+class _Timer:
+    """
+    Estimates the startup a cold process would have paid for this run (pytest import plus
+    collecting the modules it ran, as measured at preload) minus the child's own collection,
+    and stamps it into the STE report.
+    """
+    def __init__(self, import_seconds: float, module_seconds: Dict[str, float]):
+        self.import_seconds = import_seconds
+        self.module_seconds = module_seconds
+        self.saved = 0.0
+
+    def pytest_sessionstart(self, session):
+        self.t0 = time.perf_counter()
+
+    def pytest_collection_finish(self, session):
+        cold = self.import_seconds + sum(self.module_seconds.get(str(p), 0.0) for p in {it.path for it in session.items})
+        self.saved = round(max(0.0, cold - (time.perf_counter() - self.t0)), 3)
+        plugin = sys.modules.get("src.ste.pytest_plugin")
+        if plugin is not None:
+            plugin.RUN["startup_saved_seconds"] = self.saved
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # runs in a forked child: the interpreter, pytest and the project are already imported
+        req = json.loads(self.rfile.readline())
+        os.chdir(req.get("cwd") or os.getcwd())
+        os.environ.clear()
+        os.environ.update(req.get("env") or {})
+        for name in [m for m in sys.modules if m.startswith("src.ste.") and m.endswith("plugin")]:
+            del sys.modules[name]  # plugins keep per-session module state; re-import fresh
+        sys.stdout.flush()
+        sys.stderr.flush()
+        fd = self.request.fileno()
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        import pytest
+        timer = _Timer(self.server.import_seconds, self.server.module_seconds)
+        try:
+            code = int(pytest.main(req["argv"], plugins=[timer]))
+        except SystemExit as e:
+            code = int(e.code or 0)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        result = {"exit": code, "startup_saved_seconds": timer.saved}
+        self.wfile.write(_TRAILER + json.dumps(result).encode() + b"\n")
+
+class DaemonServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    Keeps pytest and the project's modules imported; every request is served by a
+    forked copy-on-write child. Project modules whose source changed since they were
+    imported are dropped and the project is re-collected before the next fork.
+    """
+    def __init__(self, path: str, project_path: str):
+        self.project_path = project_path
+        self.root = os.getcwd()
+        self.import_seconds: Optional[float] = None
+        self.cold_seconds = 0.0
+        self.collect_seconds = 0.0
+        self.module_seconds: Dict[str, float] = {}
+        self.mtimes: Dict[str, float] = {}
+        self.preload()
+        super().__init__(path, _Handler)
+
+    def preload(self) -> None:
+        t0 = time.perf_counter()
+        import pytest
+        imported = time.perf_counter()
+        if self.import_seconds is None:
+            self.import_seconds = imported - t0
+        timer = _CollectTimer()
+        null = open(os.devnull, "w")
+        out, err = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = null
+        try:
+            pytest.main(["-q", "--collect-only", "-p", "no:cacheprovider", self.project_path], plugins=[timer])
+        finally:
+            sys.stdout, sys.stderr = out, err
+            null.close()
+        self.collect_seconds = time.perf_counter() - imported
+        # what a cold `python -m pytest` pays before its first test: pytest import + collection
+        self.cold_seconds = self.import_seconds + self.collect_seconds
+        self.module_seconds = timer.seconds
+        self.mtimes = {f: _mtime(f) for f in self._project_files().values()}
+        gc.collect()
+        gc.freeze()  # keep preloaded objects out of the children's GC passes so their pages stay shared
+
+    def _project_files(self) -> Dict[str, str]:
+        out = {}
+        for name, mod in list(sys.modules.items()):
+            f = getattr(mod, "__file__", None)
+            if f and not name.startswith(_KEEP) and os.path.abspath(f).startswith(self.root + os.sep):
+                out[name] = f
+        return out
+
+    def stale(self) -> List[str]:
+        return [f for f, m in self.mtimes.items() if _mtime(f) != m]
+
+    def verify_request(self, request, client_address) -> bool:
+        # runs in the daemon before forking
+        changed = self.stale()
+        if changed:
+            print(f"[daemon] {len(changed)} imported module(s) changed; reloading project", flush=True)
+            gc.unfreeze()
+            for name in self._project_files():
+                del sys.modules[name]
+            self.preload()
+            print(f"[daemon] reloaded in {self.collect_seconds:.2f}s", flush=True)
+        return True
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return -1.0
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(project_path: str, state_dir: str) -> None:
+    if not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("the STE daemon needs fork() and Unix sockets")
+    os.makedirs(state_dir, exist_ok=True)
+    path = socket_path(state_dir)
+    if os.path.exists(path):
+        os.remove(path)
+    server = DaemonServer(path, project_path)
+    signal.signal(signal.SIGTERM, _stop)
+    print(f"[daemon] preloaded {project_path} ({len(server.mtimes)} modules, cold start ~{server.cold_seconds:.2f}s); "
+          f"listening on {path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[daemon] stopped", flush=True)
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_in_daemon(state_dir: str, argv: List[str], env: Dict[str, str],
+                  out: Optional[io.BufferedIOBase] = None) -> Optional[Tuple[int, float]]:
+    """
+    Run `pytest <argv>` in a forked child of a running daemon, streaming its output to `out`
+    (default: our stdout). Returns (exit code, startup seconds saved), or None if no daemon is up.
+    """
+    path = socket_path(state_dir)
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    out = out or sys.stdout.buffer
+    sys.stdout.flush()
+    with sock:
+        sock.sendall(json.dumps({"argv": argv, "env": env, "cwd": os.getcwd()}).encode() + b"\n")
+        pending = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            pending += chunk
+            # hold back enough bytes to never split the trailer
+            if len(pending) > 4096:
+                out.write(pending[:-1024])
+                out.flush()
+                pending = pending[-1024:]
+    head, sep, tail = pending.rpartition(_TRAILER)
+    if not sep:
+        out.write(pending)
+        return 1, 0.0  # child died before reporting
+    out.write(head)
+    out.flush()
+    result = json.loads(tail)
+    return result["exit"], result.get("startup_saved_seconds", 0.0)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .storage import TestStats
+
+ESTIMATES = ("mean", "ewma", "p50", "p90")
+WINDOW = 32        # most recent duration samples kept per test
+EWMA_ALPHA = 0.3   # weight of the newest sample
+
+def observe(st: TestStats, seconds: float) -> None:
+    """Fold one duration sample into the EWMA and the fixed-size sample window."""
+    st.ewma_duration = seconds if not st.samples else st.ewma_duration + EWMA_ALPHA * (seconds - st.ewma_duration)
+    st.samples.append(seconds)
+    if len(st.samples) > WINDOW:
+        del st.samples[:len(st.samples) - WINDOW]
+
+def quantile(samples: List[float], q: float) -> float:
+    """Linear-interpolated quantile of a small sample list."""
+    if not samples:
+        return 0.0
+    xs = sorted(samples)
+    pos = q * (len(xs) - 1)
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+def estimate(st: TestStats, mode: str) -> float:
+    """Planning duration of one test; falls back to the running mean for tests without samples."""
+    if mode == "mean" or not st.samples:
+        return st.avg_duration
+    if mode == "ewma":
+        return st.ewma_duration
+    return quantile(st.samples, 0.9 if mode == "p90" else 0.5)
+
+def estimate_all(tests: Dict[str, TestStats], mode: str) -> Dict[str, float]:
+    return {t: estimate(s, mode) for t, s in tests.items()}
+
+def observe_overhead(overhead: Dict[str, float], path: str, seconds: float) -> None:
+    overhead[path] = seconds if path not in overhead else overhead[path] + EWMA_ALPHA * (seconds - overhead[path])
+
+def _file_of(nodeid: str) -> str:
+    return nodeid.split("::", 1)[0]
+
+def split_overhead(tests: Dict[str, Dict[str, Any]],
+                   known: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    Split a report's setup/teardown time into a per-test part and a per-file part.
+    The cheapest setup and the cheapest teardown in a file are what every test pays (function-scoped
+    fixtures); module/class-scoped work lands on the file's first setup and last teardown, so the file
+    pays the largest setup and teardown excess once. A lone test cannot tell the two apart: the file's
+    `known` overhead is taken out of it, or, with none known yet, the file is recorded with none.
+    Returns (per-test duration samples incl. their share, per-file overhead seconds).
+    """
+    known = known or {}
+    by_file: Dict[str, List[Tuple[str, float, float]]] = {}
+    for nodeid, info in tests.items():
+        setup, teardown = float(info.get("setup", 0.0) or 0.0), float(info.get("teardown", 0.0) or 0.0)
+        by_file.setdefault(_file_of(nodeid), []).append((nodeid, setup, teardown))
+    samples: Dict[str, float] = {}
+    overhead: Dict[str, float] = {}
+    for f, entries in by_file.items():
+        setups, teardowns = [s for _, s, _ in entries], [t for _, _, t in entries]
+        if len(entries) > 1:
+            base = min(setups) + min(teardowns)
+            overhead[f] = (max(setups) - min(setups)) + (max(teardowns) - min(teardowns))
+        elif f in known:
+            base = max(setups[0] + teardowns[0] - known[f], 0.0)
+        else:
+            base = setups[0] + teardowns[0]
+            overhead[f] = 0.0
+        for nodeid, _, _ in entries:
+            samples[nodeid] = float(tests[nodeid].get("duration", 0.0) or 0.0) + base
+    return samples, overhead
+
+def planned_seconds(selected: Iterable[str], durations: Dict[str, float], overhead: Dict[str, float]) -> float:
+    """Serial wall-time estimate: test durations plus each touched file's overhead once."""
+    selected = list(selected)
+    return sum(durations.get(t, 0.0) for t in selected) + sum(overhead.get(f, 0.0) for f in {_file_of(t) for t in selected})
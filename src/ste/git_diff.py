@@ -1,11 +1,138 @@
-
+import re
 import subprocess
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+@dataclass
+class Change:
+    status: str         # git's letter: A, M, D, T, R (renamed) or C (copied); U for untracked working-tree files
+    path: str           # path after the change (the removed path for D)
+    old_path: str = ""  # source of an R/C
+
+def _diff_args(base: str, head: str, worktree: bool) -> List[str]:
+    """Diff from the merge-base of base and head to head, or to the working tree (uncommitted changes included)."""
+    if worktree:
+        return [merge_base(base, head) or base]
+    return [f"{base}...{head}"]
+
+def changes(base: str, head: str, worktree: bool = False) -> List[Change]:
+    """`git diff --name-status -z -M` since the merge-base; with `worktree`, untracked files count as added."""
+    try:
+        out = subprocess.check_output(["git", "diff", "--name-status", "-z", "-M", *_diff_args(base, head, worktree)], text=True)
+    except Exception:
+        return []
+    fields = out.split("\0")
+    result: List[Change] = []
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i][0]
+        if status in "RC":
+            result.append(Change(status, fields[i + 2], fields[i + 1]))
+            i += 3
+        else:
+            result.append(Change(status, fields[i + 1]))
+            i += 2
+    if worktree:
+        result.extend(Change("U", p) for p in _untracked())
+    return result
 
-def changed_files(base: str, head: str) -> List[str]:
+def _untracked() -> List[str]:
     try:
-        out = subprocess.check_output(["git", "diff", "--name-only", f"{base}..{head}"], text=True)
-        files = [l.strip() for l in out.splitlines() if l.strip()]
-        return files
+        out = subprocess.check_output(["git", "ls-files", "--others", "--exclude-standard", "--full-name", "-z", ":/"], text=True)
+        return [p for p in out.split("\0") if p]
     except Exception:
         return []
+
+def renamed(changes: List[Change]) -> Dict[str, str]:
+    """old path -> new path of the renamed/moved files (copies keep their source, so they are not remapped)."""
+    return {c.old_path: c.path for c in changes if c.status == "R"}
+
+def changed_files(base: str, head: str, worktree: bool = False) -> List[str]:
+    """Paths touched between the merge-base of base and head (renames under their new path)."""
+    return [c.path for c in changes(base, head, worktree)]
+
+def head_commit(ref: str = "HEAD") -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", ref], text=True).strip()
+    except Exception:
+        return ""
+
+def merge_base(a: str, b: str) -> str:
+    try:
+        return subprocess.check_output(["git", "merge-base", a, b], text=True).strip()
+    except Exception:
+        return ""
+
+def ancestors(ref: str, limit: int) -> List[str]:
+    """`ref` and its ancestors, nearest first (first-parent order not enforced)."""
+    try:
+        out = subprocess.check_output(["git", "rev-list", f"--max-count={limit}", ref], text=True)
+        return [l.strip() for l in out.splitlines() if l.strip()]
+    except Exception:
+        return []
+
+def commits_in_range(spec: str) -> List[str]:
+    """Commits of a rev-list range such as `A..B`, oldest first."""
+    try:
+        out = subprocess.check_output(["git", "rev-list", "--reverse", spec], text=True)
+        return [l.strip() for l in out.splitlines() if l.strip()]
+    except Exception:
+        return []
+
+def changed_hunks(base: str, head: str, worktree: bool = False) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Changed line ranges per file from `git diff -U0 -M`, on the *old* (base) side,
+    since that is the code the recorded coverage describes.
+    Ranges are inclusive (start, end). Pure insertions map to the two lines
+    surrounding the insertion point. Files without hunks (new/binary/mode-only)
+    map to an empty list, meaning "whole file". A renamed file is keyed by its
+    new path: selection remaps the recorded coverage to it first (selector.apply_renames).
+    """
+    try:
+        out = subprocess.check_output(["git", "diff", "-U0", "-M", "--no-color", *_diff_args(base, head, worktree)], text=True)
+    except Exception:
+        return {}
+    hunks = parse_hunks(out)
+    if worktree:
+        for p in _untracked():
+            hunks.setdefault(p, [])
+    return hunks
+
+def parse_hunks(diff_text: str) -> Dict[str, List[Tuple[int, int]]]:
+    hunks: Dict[str, List[Tuple[int, int]]] = {}
+    old_path = None
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith("diff --git "):
+            old_path = current = None
+        elif line.startswith("rename to "):
+            hunks.setdefault(line[len("rename to "):].strip(), [])  # a pure move has no hunks: whole file
+        elif line.startswith("--- "):
+            p = line[4:].strip()
+            old_path = None if p == "/dev/null" else _strip_prefix(p)
+        elif line.startswith("+++ "):
+            p = line[4:].strip()
+            new_path = None if p == "/dev/null" else _strip_prefix(p)
+            current = new_path or old_path
+            if current:
+                hunks.setdefault(current, [])
+            if old_path is None:
+                current = None  # new file: no baseline lines to intersect
+        elif current and line.startswith("@@"):
+            m = _HUNK.match(line)
+            if not m:
+                continue
+            start = int(m.group(1))
+            count = int(m.group(2)) if m.group(2) is not None else 1
+            if count == 0:
+                hunks[current].append((max(start, 1), start + 1))
+            else:
+                hunks[current].append((start, start + count - 1))
+    return hunks
+
+def _strip_prefix(p: str) -> str:
+    if p.startswith(("a/", "b/")):
+        return p[2:]
+    return p
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import sys, time
+from typing import List, Sequence, Set
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STRATEGIES = ("greedy", "ratio", "knapsack")
+CORE_WIDTH = 500  # items on each side of the break item that the exact solver may flip
+
+class _Timeout(Exception):
+    pass
+
+def _ratio_order(scores: Sequence[float], durs: Sequence[float]) -> List[int]:
+    if np is not None:
+        s, d = np.asarray(scores, dtype=float), np.asarray(durs, dtype=float)
+        key = np.divide(-s, d, out=np.full(len(s), -np.inf), where=d > 0)
+        return np.lexsort((-s, key)).tolist()
+    return sorted(range(len(scores)), key=lambda i: (-(scores[i] / durs[i]) if durs[i] > 0 else float("-inf"), -scores[i], i))
+
+def ratio_fill(scores: Sequence[float], durs: Sequence[float], budget_tests: int, budget_seconds: float,
+               order: List[int] | None = None, taken: Set[int] | None = None) -> Set[int]:
+    """Admit tests by score per second, skipping (not stopping at) those that no longer fit."""
+    chosen: Set[int] = set(taken or ())
+    elapsed = sum(durs[i] for i in chosen)
+    for i in order if order is not None else _ratio_order(scores, durs):
+        if i in chosen:
+            continue
+        if budget_tests and len(chosen) >= budget_tests:
+            break
+        if budget_seconds and elapsed + durs[i] > budget_seconds:
+            continue
+        chosen.add(i)
+        elapsed += durs[i]
+    return chosen
+
+def knapsack(scores: Sequence[float], durs: Sequence[float], budget_tests: int, budget_seconds: float,
+             time_limit: float = 1.0) -> Set[int]:
+    """
+    Maximize total score subject to sum(duration) <= budget_seconds and count <= budget_tests.
+
+    Items are ordered by score per second; everything well before the greedy break item is
+    fixed in, everything well after is fixed out, and a depth-first branch-and-bound (with
+    the fractional-knapsack bound) solves the core in between. The solver stops after
+    `time_limit` seconds and keeps the best solution found, which is never worse than ratio_fill.
+    """
+    n = len(scores)
+    if not budget_seconds:
+        top = sorted(range(n), key=lambda i: (-scores[i], i))
+        return set(top[:budget_tests] if budget_tests else top)
+
+    order = _ratio_order(scores, durs)
+    incumbent = ratio_fill(scores, durs, budget_tests, budget_seconds, order)
+
+    # break item: first one the plain prefix fill cannot admit
+    elapsed, brk = 0.0, n
+    for pos, i in enumerate(order):
+        if (budget_tests and pos >= budget_tests) or elapsed + durs[i] > budget_seconds:
+            brk = pos
+            break
+        elapsed += durs[i]
+    lo, hi = max(0, brk - CORE_WIDTH), min(n, brk + CORE_WIDTH)
+    fixed = order[:lo]
+    core = order[lo:hi]
+    rem0 = budget_seconds - sum(durs[i] for i in fixed)
+    cnt0 = (budget_tests - len(fixed)) if budget_tests else len(core)
+    s = [scores[i] for i in core]
+    d = [durs[i] for i in core]
+    m = len(core)
+
+    best_val = sum(scores[i] for i in incumbent)
+    best: List[int] | None = None
+    cur: List[int] = []
+    base = sum(scores[i] for i in fixed)
+    deadline = time.perf_counter() + time_limit
+    nodes = 0
+
+    def bound(j: int, val: float, rem: float) -> float:
+        # fractional relaxation of the time budget; the count budget is relaxed away
+        while j < m:
+            if d[j] <= rem:
+                val += s[j]
+                rem -= d[j]
+            else:
+                return val + s[j] * rem / d[j]
+            j += 1
+        return val
+
+    def dfs(j: int, val: float, rem: float, cnt: int) -> None:
+        nonlocal best_val, best, nodes
+        if val > best_val + 1e-12:
+            best_val, best = val, list(cur)
+        if j == m or cnt == 0 or bound(j, val, rem) <= best_val + 1e-12:
+            return
+        nodes += 1
+        if nodes & 1023 == 0 and time.perf_counter() > deadline:
+            raise _Timeout()
+        if d[j] <= rem:
+            cur.append(j)
+            dfs(j + 1, val + s[j], rem - d[j], cnt - 1)
+            cur.pop()
+        dfs(j + 1, val, rem, cnt)
+
+    if rem0 >= 0 and cnt0 >= 0:
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, m + 200))
+        try:
+            dfs(0, base, rem0, cnt0)
+        except _Timeout:
+            pass
+        finally:
+            sys.setrecursionlimit(limit)
+
+    chosen = incumbent if best is None else set(fixed) | {core[j] for j in best}
+    # zero-gain tests that still fit cost nothing against the objective
+    return ratio_fill(scores, durs, budget_tests, budget_seconds, order, taken=chosen)
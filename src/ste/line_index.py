@@ -0,0 +1,245 @@
+from __future__ import annotations
+import os, ast, json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .storage import ensure_dir, load_coverage_json, remap_nodeid, remap_path
+from .coverage_map import _collect_context_names, _extract_nodeid, _relpath_norm, coverage_db_path, iter_coverage_db
+
+INDEX_FILE = "line_index.json"
+GRANULARITIES = ("file", "line", "function")
+
+@dataclass
+class FileLines:
+    lines: Dict[int, List[int]] = field(default_factory=dict)   # line -> [test ids]
+    functions: List[Tuple[str, int, int, List[int]]] = field(default_factory=list)  # (name, first, last, [test ids])
+    tests: List[int] = field(default_factory=list)               # every test touching the file
+
+@dataclass
+class LineIndex:
+    """
+    Per-line and per-function test index built from coverage contexts,
+    used by `select --granularity=line|function`.
+    """
+    tests: List[str] = field(default_factory=list)
+    files: Dict[str, FileLines] = field(default_factory=dict)
+
+    def affected(self, hunks: Dict[str, List[Tuple[int, int]]], granularity: str) -> Tuple[Set[str], List[str]]:
+        """
+        Intersect changed ranges with the index.
+        Returns (affected nodeids, changed files the index does not know about),
+        the latter to be resolved at file granularity by the caller.
+        """
+        ids: Set[int] = set()
+        unknown: List[str] = []
+        for path, ranges in hunks.items():
+            fl = self.files.get(path.replace("\\", "/"))
+            if fl is None:
+                unknown.append(path)
+                continue
+            if not ranges:
+                ids.update(fl.tests)
+                continue
+            for start, end in ranges:
+                ids.update(_tests_for_range(fl, start, end, granularity))
+        return {self.tests[i] for i in ids}, unknown
+
+def _enclosing_function(fl: FileLines, line: int):
+    best = None
+    for fn in fl.functions:
+        if fn[1] <= line <= fn[2] and (best is None or fn[2] - fn[1] < best[2] - best[1]):
+            best = fn
+    return best
+
+def _tests_for_range(fl: FileLines, start: int, end: int, granularity: str) -> Set[int]:
+    """
+    line:     tests that executed any changed line; a hunk touching no executed line
+              (e.g. a new statement) widens to its enclosing function.
+    function: tests that executed the enclosing function(s).
+    Lines outside every function (imports, module constants) widen to the whole file.
+    """
+    out: Set[int] = set()
+    if granularity == "line":
+        for ln in range(start, end + 1):
+            out.update(fl.lines.get(ln, ()))
+        if out:
+            return out
+    for ln in range(start, end + 1):
+        fn = _enclosing_function(fl, ln)
+        if fn is None:
+            return set(fl.tests)
+        out.update(fn[3])
+    return out
+
+class _TestIds:
+    def __init__(self, idx: LineIndex):
+        self.idx = idx
+        self.ids: Dict[str, int] = {}
+
+    def __call__(self, ctx_name: str) -> Optional[int]:
+        nodeid = _extract_nodeid(ctx_name)
+        if not nodeid:
+            return None
+        i = self.ids.get(nodeid)
+        if i is None:
+            i = self.ids[nodeid] = len(self.idx.tests)
+            self.idx.tests.append(nodeid)
+        return i
+
+def _file_lines(line_ctxs, regions: List[Tuple[str, int, int]], tid: _TestIds) -> FileLines:
+    fl = FileLines()
+    for ln, ctxs in line_ctxs.items():
+        names: Set[str] = set()
+        _collect_context_names(ctxs, names)
+        ids = {i for i in (tid(n) for n in names) if i is not None}
+        if ids:
+            fl.lines[int(ln)] = sorted(ids)
+    for name, first, last in regions:
+        ids = set()
+        for ln in range(first, last + 1):
+            ids.update(fl.lines.get(ln, ()))
+        fl.functions.append((name, first, last, sorted(ids)))
+    fl.tests = sorted({i for ids in fl.lines.values() for i in ids})
+    return fl
+
+def build_line_index_from_state(state_dir: str, project_root: str, backend: str = "auto") -> LineIndex:
+    """Same backend choice as coverage_map.build_maps."""
+    if backend == "json" or (backend == "auto" and not os.path.exists(coverage_db_path(state_dir))):
+        return build_line_index(load_coverage_json(state_dir), project_root)
+    return build_line_index_db(state_dir, project_root)
+
+def build_line_index(data: Dict[str, Any], project_root: str) -> LineIndex:
+    """Build from coverage.py JSON (format 3) exported with show_contexts=True."""
+    idx = LineIndex()
+    tid = _TestIds(idx)
+    for fpath, fdata in (data.get("files") or {}).items():
+        regions = []
+        for name, fn in (fdata.get("functions") or {}).items():
+            if not name:
+                continue  # module-level region
+            body = list(fn.get("executed_lines") or []) + list(fn.get("missing_lines") or []) + list(fn.get("excluded_lines") or [])
+            if body:
+                regions.append((name, min(body), max(body)))
+        fl = _file_lines(fdata.get("contexts") or {}, regions, tid)
+        if fl.tests:
+            idx.files[_relpath_norm(fpath, project_root)] = fl
+    return idx
+
+def build_line_index_db(state_dir: str, project_root: str) -> LineIndex:
+    """Build from the coverage SQLite database; function regions come from parsing the sources."""
+    idx = LineIndex()
+    tid = _TestIds(idx)
+    for rel, line_ctxs in iter_coverage_db(state_dir, project_root):
+        fl = _file_lines(line_ctxs, _function_regions(os.path.join(project_root, rel)), tid)
+        if fl.tests:
+            idx.files[rel] = fl
+    return idx
+
+def _function_regions(path: str) -> List[Tuple[str, int, int]]:
+    """(qualname, first body line, last line) for every def, matching coverage's function regions."""
+    try:
+        tree = ast.parse(open(path, "r", encoding="utf-8").read())
+    except Exception:
+        return []
+    out: List[Tuple[str, int, int]] = []
+
+    def walk(node, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                out.append((name, child.body[0].lineno, child.end_lineno or child.body[-1].lineno))
+                walk(child, name + ".")
+            elif isinstance(child, ast.ClassDef):
+                walk(child, prefix + child.name + ".")
+            else:
+                walk(child, prefix)
+
+    walk(tree, "")
+    return out
+
+def merge_line_index(old: Optional[LineIndex], new: LineIndex, ran: Set[str]) -> LineIndex:
+    """Replace the lines of tests in `ran` with their new measurement, keeping everyone else's."""
+    if old is None:
+        return new
+    merged = LineIndex()
+    tid = _TestIds(merged)
+    files: Dict[str, Dict[int, Set[str]]] = {}
+    regions: Dict[str, List[Tuple[str, int, int]]] = {}
+    for src, drop in ((old, ran), (new, set())):
+        for path, fl in src.files.items():
+            lines = files.setdefault(path, {})
+            for ln, ids in fl.lines.items():
+                lines.setdefault(ln, set()).update(n for n in (src.tests[i] for i in ids) if n not in drop)
+            regions[path] = [fn[:3] for fn in fl.functions]
+    for path, lines in files.items():
+        fl = _file_lines({ln: sorted(ns) for ln, ns in lines.items()}, regions.get(path, []), tid)  # nodeids are valid context names
+        if fl.tests:
+            merged.files[path] = fl
+    return merged
+
+def save_line_index(state_dir: str, idx: LineIndex) -> str:
+    ensure_dir(state_dir)
+    out = os.path.join(state_dir, INDEX_FILE)
+    data = {
+        "version": 1,
+        "tests": idx.tests,
+        "files": {
+            p: {
+                "lines": _encode_lines(fl.lines),
+                "functions": [list(fn) for fn in fl.functions],
+            }
+            for p, fl in idx.files.items()
+        },
+    }
+    open(out, "w", encoding="utf-8").write(json.dumps(data, separators=(",", ":")))
+    return out
+
+def load_line_index(state_dir: str) -> Optional[LineIndex]:
+    p = os.path.join(state_dir, INDEX_FILE)
+    if not os.path.exists(p):
+        return None
+    data = json.loads(open(p, "r", encoding="utf-8").read())
+    if data.get("version") != 1:
+        return None
+    idx = LineIndex(tests=data.get("tests", []))
+    for path, fd in (data.get("files") or {}).items():
+        lines = _decode_lines(fd.get("lines", []))
+        idx.files[path] = FileLines(
+            lines=lines,
+            functions=[(n, a, b, ids) for n, a, b, ids in fd.get("functions", [])],
+            tests=sorted({i for ids in lines.values() for i in ids}),
+        )
+    return idx
+
+def renamed_line_index(idx: LineIndex, renames: Dict[str, str]) -> LineIndex:
+    """A copy with renamed files and the nodeids of tests in renamed test files under their new paths."""
+    return LineIndex(tests=[remap_nodeid(t, renames) for t in idx.tests],
+                     files={remap_path(p, renames): fl for p, fl in idx.files.items()})
+
+def remap_line_index(state_dir: str, renames: Dict[str, str]) -> int:
+    """Rewrite the stored index under the renames; returns how many files and tests moved (0: file left as is)."""
+    idx = load_line_index(state_dir)
+    if idx is None:
+        return 0
+    new = renamed_line_index(idx, renames)
+    moved = len(set(new.files) - set(idx.files)) + sum(1 for a, b in zip(idx.tests, new.tests) if a != b)
+    if moved:
+        save_line_index(state_dir, new)
+    return moved
+
+def _encode_lines(lines: Dict[int, List[int]]) -> List[list]:
+    """Runs of consecutive lines sharing the same test set: [[first, last, [ids]], ...]."""
+    runs: List[list] = []
+    for ln in sorted(lines):
+        ids = lines[ln]
+        if runs and runs[-1][1] == ln - 1 and runs[-1][2] == ids:
+            runs[-1][1] = ln
+        else:
+            runs.append([ln, ln, ids])
+    return runs
+
+def _decode_lines(runs: List[list]) -> Dict[int, List[int]]:
+    out: Dict[int, List[int]] = {}
+    for first, last, ids in runs:
+        for ln in range(first, last + 1):
+            out[ln] = ids
+    return out
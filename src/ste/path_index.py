@@ -0,0 +1,105 @@
+from __future__ import annotations
+import os, json
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+from .storage import History, ensure_dir, remap_nodeid, remap_path
+from .compact import CSR, MapView, StringTable
+
+INDEX_FILE = "path_index.json"
+
+def _norm(p: str) -> str:
+    return p.replace("\\", "/")
+
+@dataclass
+class PathIndex:
+    """
+    Prebuilt changed-file -> test lookup over the coverage map:
+      basenames: basename -> [path ids]; exact and suffix ("endswith('/' + f)") matches are in f's bucket
+      edges:     path id -> test ids (compact.CSR: two uint32 arrays)
+    """
+    tests: List[str] = field(default_factory=list)
+    paths: List[str] = field(default_factory=list)
+    edges: CSR = field(default_factory=CSR)
+    basenames: Dict[str, List[int]] = field(default_factory=dict)
+
+    def match_paths(self, changed_files: Iterable[str]) -> Set[int]:
+        """Path ids matched by the same heuristics as the legacy scan (exact, suffix, basename)."""
+        hits: Set[int] = set()
+        for f in changed_files:
+            f = _norm(f)
+            # exact and suffix matches share f's basename, so its bucket already holds all three kinds
+            hits.update(self.basenames.get(os.path.basename(f), ()))
+        return hits
+
+    def affected_ids(self, changed_files: Iterable[str]) -> Set[int]:
+        return self.edges.union(self.match_paths(changed_files))
+
+    def affected(self, changed_files: Iterable[str]) -> Set[str]:
+        tests = self.tests
+        return {tests[t] for t in self.affected_ids(changed_files)}
+
+def _lookups(idx: PathIndex) -> PathIndex:
+    idx.basenames.clear()
+    for i, p in enumerate(idx.paths):
+        idx.basenames.setdefault(os.path.basename(p), []).append(i)
+    return idx
+
+def build_path_index(h: History) -> PathIndex:
+    """Build the index from both map directions, so it matches whatever the legacy scan would see."""
+    idx = PathIndex()
+    cm, tf = h.coverage_map, h.test_to_files
+    if isinstance(cm, MapView) and isinstance(tf, MapView) and cm.keys_ is tf.values_ and cm.values_ is tf.keys_:
+        # both directions of one CompactMaps (loaded from history.db): reuse its tables and arrays
+        idx.tests, idx.paths, idx.edges = cm.values_.names, [_norm(p) for p in cm.keys_.names], cm.csr
+    else:
+        test_ids = StringTable()
+        path_ids = StringTable()
+        edges: Dict[int, Set[int]] = {}
+        for path, nodeids in h.coverage_map.items():
+            edges.setdefault(path_ids.intern(_norm(path)), set()).update(test_ids.intern(n) for n in nodeids)
+        for nodeid, files in h.test_to_files.items():
+            t = test_ids.intern(nodeid)
+            for path in files:
+                edges.setdefault(path_ids.intern(_norm(path)), set()).add(t)
+        idx.tests, idx.paths = test_ids.names, path_ids.names
+        idx.edges = CSR.from_rows(sorted(edges[i]) for i in range(len(idx.paths)))
+    return _lookups(idx)
+
+def save_path_index(state_dir: str, idx: PathIndex, maps_version: int = 0) -> str:
+    ensure_dir(state_dir)
+    out = os.path.join(state_dir, INDEX_FILE)
+    data = {
+        "version": 2,
+        "maps_version": maps_version,
+        "tests": idx.tests,
+        "paths": idx.paths,
+        "edges": idx.edges.to_json(),
+    }
+    open(out, "w", encoding="utf-8").write(json.dumps(data, separators=(",", ":")))
+    return out
+
+def load_path_index(state_dir: str, maps_version: int) -> Optional[PathIndex]:
+    """
+    Return the persisted index, or None if it is missing or was built from another
+    version of the maps (callers then build one in memory from the loaded History).
+    """
+    p = os.path.join(state_dir, INDEX_FILE)
+    if not os.path.exists(p):
+        return None
+    data = json.loads(open(p, "r", encoding="utf-8").read())
+    if data.get("version") != 2 or data.get("maps_version") != maps_version:
+        return None
+    return _lookups(PathIndex(tests=data.get("tests", []), paths=data.get("paths", []), edges=CSR.from_json(data["edges"])))
+
+def renamed_index(idx: PathIndex, renames: Dict[str, str]) -> PathIndex:
+    """A copy with renamed files, and the nodeids of tests in renamed test files, under their new paths (edges shared)."""
+    return _lookups(PathIndex(tests=[remap_nodeid(t, renames) for t in idx.tests],
+                              paths=[remap_path(p, renames) for p in idx.paths], edges=idx.edges))
+
+def remap_path_index(state_dir: str, renames: Dict[str, str], maps_version: int, new_version: int) -> bool:
+    """Rename paths in the stored index built for `maps_version` and re-stamp it, instead of rebuilding from the maps."""
+    idx = load_path_index(state_dir, maps_version)
+    if idx is None:
+        return False
+    save_path_index(state_dir, renamed_index(idx, renames), new_version)
+    return True
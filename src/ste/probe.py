@@ -1,7 +1,9 @@
 # src/ste/probe.py
 from __future__ import annotations
-import os, sys, subprocess, json, uuid
-from typing import Dict, List, Set, Tuple
+import os, io, sys, subprocess, json, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from .daemon import run_in_daemon
 
 def _norm_rel(path: str, root: str) -> str:
     try:
@@ -10,12 +12,16 @@ def _norm_rel(path: str, root: str) -> str:
         rel = path
     return rel.replace("\\", "/")
 
-def _list_nodeids(project_path: str, env) -> List[str]:
+def _list_nodeids(targets: List[str], env) -> List[str]:
     """
     Collect pytest nodeids (path::test_name) reliably.
     """
-    cmd = [sys.executable, "-m", "pytest", "-q", "--collect-only", project_path]
-    out = subprocess.check_output(cmd, env=env, text=True, stderr=subprocess.STDOUT)
+    cmd = [sys.executable, "-m", "pytest", "-q", "--collect-only", *targets]
+    buf = io.BytesIO()
+    if run_in_daemon(env.get("STATE_DIR", "state"), cmd[3:], dict(env), out=buf) is not None:
+        out = buf.getvalue().decode("utf-8", "replace")
+    else:
+        out = subprocess.check_output(cmd, env=env, text=True, stderr=subprocess.STDOUT)
     nodeids: List[str] = []
     for line in out.splitlines():
         s = line.strip()
@@ -24,35 +30,57 @@ def _list_nodeids(project_path: str, env) -> List[str]:
             nodeids.append(s)
     return nodeids
 
-def _measure_files_for_test(project_path: str, nodeid: str, state_dir: str, env) -> Set[str]:
+def collect_nodeids(project_path: str) -> List[str]:
+    """Every nodeid pytest collects under `project_path` (the full suite); [] if collection fails."""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.getcwd() + os.pathsep + env.get("PYTHONPATH", "")
+    try:
+        return _list_nodeids([project_path], env)
+    except subprocess.CalledProcessError:
+        return []
+
+def _chunk_by_file(nodeids: List[str], jobs: int) -> List[List[str]]:
     """
-    Run a SINGLE test under coverage and read the JSON report to know which files
-    that test executed. This does NOT depend on contexts.
+    Split nodeids into `jobs` chunks balanced by test count (largest file first),
+    keeping each file's tests in one chunk so its imports are paid once.
     """
-    os.makedirs(state_dir, exist_ok=True)
-    json_path = os.path.join(state_dir, f"probe_{uuid.uuid4().hex}.json")
-    cmd = [
-        sys.executable, "-m", "pytest", "-q",
-        "-p", "src.ste.pytest_plugin",
-        f"--cov={project_path}", "--cov-branch",
-        f"--cov-report=json:{json_path}",
-        nodeid,
-    ]
-    subprocess.call(cmd, env=env)
+    per_file: Dict[str, List[str]] = {}
+    for nid in nodeids:
+        per_file.setdefault(nid.split("::", 1)[0], []).append(nid)
+    chunks: List[List[str]] = [[] for _ in range(max(1, min(jobs, len(per_file))))]
+    loads = [0] * len(chunks)
+    for f, nids in sorted(per_file.items(), key=lambda kv: -len(kv[1])):
+        i = loads.index(min(loads))
+        chunks[i].extend(nids)
+        loads[i] += len(nids)
+    return [c for c in chunks if c]
+
+def _probe_chunk(project_path: str, nodeids: List[str], tmp_dir: str, idx: int, env) -> Dict[str, List[str]]:
+    """
+    Run one chunk's tests (their files are collected, other tests deselected) in a single
+    pytest session; the probe plugin switches coverage contexts per test and writes nodeid -> files.
+    """
+    out = os.path.join(tmp_dir, f"probe_{idx}.json")
+    sel = os.path.join(tmp_dir, f"probe_{idx}.txt")
+    with open(sel, "w", encoding="utf-8") as f:
+        f.write("\n".join(nodeids))  # a file, not argv: no ARG_MAX limit
+    wenv = dict(env, STE_PROBE_OUT=out, STE_PROBE_SOURCE=project_path, STE_PROBE_NODEIDS=sel)
+    test_files = list(dict.fromkeys(nid.split("::", 1)[0] for nid in nodeids))
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "src.ste.probe_plugin", *test_files]
+    subprocess.call(cmd, env=wenv, stdout=subprocess.DEVNULL)
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(out, "r", encoding="utf-8") as f:
+            return json.load(f).get("tests", {})
     except Exception:
-        return set()
-
-    files: Set[str] = set()
-    for fpath in (data.get("files") or {}).keys():
-        files.add(fpath)
-    return files
+        return {}
 
-def probe_maps(project_path: str, state_dir: str, project_root: str) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+def probe_maps(project_path: str, state_dir: str, project_root: str, jobs: int = 0,
+               targets: Optional[List[str]] = None) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
     """
-    Build coverage maps by running each test once and mapping the executed files.
+    Build coverage maps without relying on pytest-cov contexts, for the tests
+    collected from `targets` (default: the whole project).
+    Tests are split into `jobs` chunks (default: CPU count); each chunk runs in one
+    pytest process with per-test context switching, and results are merged.
     This is a fallback used when contexts are unavailable/empty.
     """
     env = os.environ.copy()
@@ -62,13 +90,23 @@ def probe_maps(project_path: str, state_dir: str, project_root: str) -> Tuple[Di
     file_to_tests: Dict[str, Set[str]] = {}
     test_to_files: Dict[str, Set[str]] = {}
 
-    nodeids = _list_nodeids(project_path, env)
-    for nid in nodeids:
-        files = _measure_files_for_test(project_path, nid, state_dir, env)
-        for f in files:
-            rel = _norm_rel(f, project_root)
-            file_to_tests.setdefault(rel, set()).add(nid)
-            test_to_files.setdefault(nid, set()).add(rel)
+    nodeids = _list_nodeids(targets or [project_path], env)
+    chunks = _chunk_by_file(nodeids, jobs or os.cpu_count() or 1)
+    collected = set(nodeids)
+
+    with tempfile.TemporaryDirectory(prefix="ste_probe_", dir=state_dir) as tmp_dir:
+        with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as pool:
+            futures = [pool.submit(_probe_chunk, project_path, c, tmp_dir, i, env) for i, c in enumerate(chunks)]
+            results = [fut.result() for fut in futures]
+
+    for result in results:
+        for nid, files in result.items():
+            if nid not in collected:
+                continue
+            for f in files:
+                rel = _norm_rel(f, project_root)
+                file_to_tests.setdefault(rel, set()).add(nid)
+                test_to_files.setdefault(nid, set()).add(rel)
 
     return (
         {k: sorted(v) for k, v in file_to_tests.items()},
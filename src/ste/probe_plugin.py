@@ -0,0 +1,99 @@
+# src/ste/probe_plugin.py
+"""
+pytest plugin used by probe workers: one coverage session per pytest process,
+switching the dynamic context per test instead of spawning a process per test.
+
+Env:
+  STE_PROBE_SOURCE   path passed to coverage as source
+  STE_PROBE_OUT      JSON file to write {"tests": {nodeid: [files]}} to
+  STE_PROBE_NODEIDS  optional file with one nodeid per line: only these tests run
+"""
+from __future__ import annotations
+import os, json
+import pytest
+
+_COV = None
+_MODULE_CTX = "|collect"
+
+def _start() -> None:
+    global _COV
+    if _COV is not None:
+        return
+    import coverage
+    src = os.environ.get("STE_PROBE_SOURCE")
+    _COV = coverage.Coverage(data_file=None, source=[src] if src else None, config_file=False)
+    _COV.start()
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_load_initial_conftests(early_config, parser, args):
+    # before the root conftest.py and the plugins it pulls in are imported
+    _start()
+
+def pytest_sessionstart(session):
+    _start()
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_make_collect_report(collector):
+    # imports triggered while collecting a test module are attributed to its tests
+    if _COV is not None and isinstance(collector, pytest.Module):
+        _COV.switch_context(collector.nodeid + _MODULE_CTX)
+    yield
+
+def pytest_collection_modifyitems(session, config, items):
+    path = os.environ.get("STE_PROBE_NODEIDS")
+    if not path:
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        wanted = {l for l in f.read().splitlines() if l.strip()}
+    keep, drop = [], []
+    for it in items:
+        (keep if it.nodeid in wanted else drop).append(it)
+    if drop:
+        config.hook.pytest_deselected(items=drop)
+        items[:] = keep
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    if _COV is not None:
+        _COV.switch_context(item.nodeid)
+    yield
+
+def pytest_sessionfinish(session, exitstatus):
+    if _COV is None:
+        return
+    _COV.stop()
+    data = _COV.get_data()
+    by_ctx = {}
+    for fpath in data.measured_files():
+        for ctxs in (data.contexts_by_lineno(fpath) or {}).values():
+            for ctx in ctxs:
+                by_ctx.setdefault(ctx, set()).add(fpath)
+
+    # Lines run outside any test (conftest.py and plugin imports, session setup) and modules imported while
+    # collecting a test module can be needed by every test of this process: a shared module is imported,
+    # and measured, only by the first test module that imports it. A test module's own file stays with its tests.
+    root = str(session.config.rootpath)
+    shared = set(by_ctx.get("", set()))
+    own = {}
+    for ctx, files in by_ctx.items():
+        if ctx.endswith(_MODULE_CTX):
+            module = ctx[:-len(_MODULE_CTX)]
+            path = os.path.realpath(os.path.join(root, module))
+            own[module] = {f for f in files if os.path.realpath(f) == path}
+            shared |= files - own[module]
+
+    tests = {}
+    for ctx, files in by_ctx.items():
+        if not ctx or ctx.endswith(_MODULE_CTX):
+            continue
+        module = ctx.split("::", 1)[0]
+        tests[ctx] = sorted(files | shared | own.get(module, set()))
+    for item in session.items:
+        # a test that ran no measured line still depends on what its process imported
+        if item.nodeid not in tests:
+            tests[item.nodeid] = sorted(shared | own.get(item.nodeid.split("::", 1)[0], set()))
+
+    out = os.environ.get("STE_PROBE_OUT")
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"tests": tests}, f)
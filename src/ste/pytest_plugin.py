@@ -1,6 +1,8 @@
 
 from __future__ import annotations
 import os, json, time, pathlib
+from typing import Set
+from .sharding import apfd
 
 STATE_DIR = os.environ.get("STATE_DIR", "state")
 pathlib.Path(STATE_DIR).mkdir(parents=True, exist_ok=True)
@@ -9,18 +11,100 @@ RUN = {
     "tests": {},
     "started_at": time.time(),
 }
+if os.environ.get("STE_SHARD_INDEX"):
+    RUN["shard_index"] = int(os.environ["STE_SHARD_INDEX"])
+    RUN["predicted_seconds"] = float(os.environ.get("STE_SHARD_PREDICTED", "0") or 0)
 
-def pytest_runtest_logreport(report):
-    if report.when != "call":
+def pytest_addoption(parser):
+    group = parser.getgroup("ste")
+    group.addoption("--ste-order", action="store_true", default=False,
+                    help="Run tests by estimated failure probability per second (selection.json 'priority').")
+    group.addoption("--ste-selection", default=None, metavar="PATH",
+                    help="Only collect/run these nodeids: selection.json ('selected') or one nodeid per line.")
+
+def load_selection(path: str) -> Set[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return set(json.loads(text).get("selected", []))
+    return {l for l in text.splitlines() if l.strip()}
+
+def pytest_configure(config):
+    path = config.getoption("--ste-selection", None)
+    if not path:
+        return
+    selected = load_selection(path)
+    files = {n.split("::", 1)[0] for n in selected}
+    dirs = {""}
+    for f in files:
+        parts = f.split("/")[:-1]
+        dirs.update("/".join(parts[:i]) for i in range(1, len(parts) + 1))
+    config._ste_selection = (selected, files, dirs)
+
+def pytest_ignore_collect(collection_path, config):
+    """Prune directories and files that hold no selected test, before anything is imported."""
+    sel = getattr(config, "_ste_selection", None)
+    if sel is None:
+        return None
+    _, files, dirs = sel
+    try:
+        rel = collection_path.relative_to(config.rootpath).as_posix()
+    except ValueError:
+        return None
+    if collection_path.is_dir():
+        return None if rel in dirs or rel == "." else True
+    if collection_path.suffix == ".py" and rel not in files:
+        return True
+    return None
+
+def pytest_collection_modifyitems(session, config, items):
+    sel = getattr(config, "_ste_selection", None)
+    if sel is not None:
+        selected = sel[0]
+        keep, drop = [], []
+        for it in items:
+            # a bare function id selects all of its parametrizations
+            (keep if it.nodeid in selected or it.nodeid.split("[", 1)[0] in selected else drop).append(it)
+        if drop:
+            config.hook.pytest_deselected(items=drop)
+            items[:] = keep
+    if not config.getoption("--ste-order"):
         return
+    p = os.path.join(STATE_DIR, "selection.json")
+    priority = {}
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8") as f:
+            priority = json.load(f).get("priority", {})
+    # stable: unknown tests keep their relative order after the ranked ones
+    items.sort(key=lambda it: -priority.get(it.nodeid, -1.0))
+    RUN["order"] = "risk"
+
+def pytest_runtest_logstart(nodeid, location):
+    RUN.setdefault("first_test_at", time.time())
+
+_SETUP: dict = {}  # nodeid -> setup seconds, until the call phase creates the entry
+
+def pytest_runtest_logreport(report):
     node = report.nodeid
+    if report.when == "setup":
+        _SETUP[node] = getattr(report, "duration", 0.0)
+        return
+    if report.when == "teardown":
+        if node in RUN["tests"]:
+            RUN["tests"][node]["teardown"] = getattr(report, "duration", 0.0)
+        return
     entry = RUN["tests"].setdefault(node, {"outcome": None, "duration": 0.0})
     entry["outcome"] = report.outcome
     entry["duration"] = getattr(report, "duration", 0.0)
+    entry["setup"] = _SETUP.pop(node, 0.0)
+    if report.outcome == "failed" and "time_to_first_failure" not in RUN:
+        RUN["time_to_first_failure"] = round(time.time() - RUN.get("first_test_at", RUN["started_at"]), 3)
 
 def pytest_sessionfinish(session, exitstatus):
     RUN["exitstatus"] = exitstatus
     RUN["finished_at"] = time.time()
-    out = os.path.join(STATE_DIR, "last_pytest_report.json")
+    RUN.setdefault("order", "default")
+    RUN["apfd"] = apfd([t["outcome"] for t in RUN["tests"].values()])
+    out = os.path.join(STATE_DIR, os.environ.get("STE_REPORT_FILE", "last_pytest_report.json"))
     with open(out, "w", encoding="utf-8") as f:
         json.dump(RUN, f, indent=2)
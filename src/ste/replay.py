@@ -0,0 +1,168 @@
+from __future__ import annotations
+import os, itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, List, Sequence
+from .storage import History, load_history, load_maps
+from .path_index import build_path_index, load_path_index
+from .durations import ESTIMATES, estimate_all, planned_seconds
+from .knapsack import STRATEGIES
+from .agent import Weights, _features, rank_with_explanations
+from . import timing
+
+# Settings fields a replay sweep can vary (`--sweep key=v1,v2`)
+SWEEP_KEYS = ("budget_tests", "budget_time_seconds", "strategy", "duration_estimate",
+              "weight_affected", "weight_fail_rate", "weight_flaky_rate", "weight_runtime")
+CHOICES = {"strategy": STRATEGIES, "duration_estimate": ESTIMATES}
+
+def parse_sweep(specs: Sequence[str], cfg) -> List[Dict[str, Any]]:
+    """Cartesian product of `key=v1,v2,...` specs; values are typed like the current settings field and checked."""
+    axes: Dict[str, List[Any]] = {}
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        key = key.strip().lower().replace("-", "_")
+        if key not in SWEEP_KEYS or not values:
+            raise ValueError(f"bad sweep {spec!r}; expected key=v1,v2 with key one of {', '.join(SWEEP_KEYS)}")
+        kind = type(getattr(cfg, key))
+        try:
+            axes[key] = [kind(v.strip()) for v in values.split(",") if v.strip()]
+        except ValueError:
+            raise ValueError(f"bad sweep {spec!r}; {key} takes {kind.__name__} values")
+        unknown = [v for v in axes[key] if key in CHOICES and v not in CHOICES[key]]
+        if unknown:
+            raise ValueError(f"bad sweep {spec!r}; unknown {key} {', '.join(map(str, unknown))} "
+                             f"(expected one of {', '.join(CHOICES[key])})")
+    base = {k: getattr(cfg, k) for k in SWEEP_KEYS}
+    return [dict(base, **dict(zip(axes, combo))) for combo in itertools.product(*axes.values())]
+
+def label(config: Dict[str, Any], varied: Sequence[str]) -> str:
+    return " ".join(f"{k}={config[k]}" for k in varied) or "current settings"
+
+def commit_cases(runs: List[Dict[str, Any]], commits: List[str], changed: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """
+    One case per commit: its changed files, the failures recorded for it (the faults a selection should
+    catch), and the failure counts recorded from its first run on, which the replay subtracts from the
+    stored stats so a test's own failure does not raise its score (history "as it stood then").
+    Run records without a `failures` list (older history) contribute no faults.
+    """
+    position = {c: i for i, c in enumerate(commits)}
+    first_run: Dict[int, int] = {}
+    faults: Dict[str, set] = {}
+    for r, run in enumerate(runs):
+        i = position.get(run.get("commit", ""))
+        if i is not None:
+            first_run.setdefault(i, r)
+            faults.setdefault(commits[i], set()).update(run.get("failures", ()))
+    cases = []
+    later: Dict[str, int] = {}
+    start = len(runs)
+    for i in reversed(range(len(commits))):   # a commit without runs takes the first run of a later one
+        first = min(start, first_run.get(i, start))
+        for run in runs[first:start]:
+            for t in run.get("failures", ()):
+                later[t] = later.get(t, 0) + 1
+        start = first
+        cases.append({"commit": commits[i], "changed": changed.get(commits[i], []),
+                      "faults": sorted(faults.get(commits[i], ())), "later_fails": dict(later)})
+    return cases[::-1]
+
+_WORKER: Dict[str, Any] = {}
+
+def _init_worker(state_dir: str, configs: List[Dict[str, Any]], solver_time_limit: float, pooled: bool = True) -> None:
+    """Load history, maps and the path index once per process; every commit chunk of that worker reuses them."""
+    hist = load_history(state_dir, runs=False, maps=False)
+    index = load_path_index(state_dir, hist.maps_version)
+    if index is None:
+        index = build_path_index(load_maps(state_dir, hist))
+    modes = {c["duration_estimate"] for c in configs}
+    durations = {m: estimate_all(hist.tests, m) for m in modes}
+    _WORKER.update(hist=hist, index=index, configs=configs, solver_time_limit=solver_time_limit, durations=durations,
+                   weights=[Weights(c["weight_affected"], c["weight_fail_rate"], c["weight_flaky_rate"], c["weight_runtime"])
+                            for c in configs],
+                   pooled=pooled)
+
+def _as_of(tests: Dict[str, Any], later_fails: Dict[str, int]) -> Dict[str, Any]:
+    """Replacement stats for the tests whose recorded failures happened at or after the replayed commit."""
+    out = {}
+    for t, n in later_fails.items():
+        st = tests.get(t)
+        if st is not None:
+            fails = max(st.fails - n, 0)
+            out[t] = replace(st, fails=fails, flaky=st.flaky if fails else 0)
+    return out
+
+def _replay_cases(cases: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Rank each case under every config: affected set and feature columns are computed once per case. Rows per config."""
+    if _WORKER["pooled"]:
+        timing.reset("replay")   # spans would otherwise pile up across chunks in a long-lived worker
+    hist: History = _WORKER["hist"]
+    configs = _WORKER["configs"]
+    rows: List[List[Dict[str, Any]]] = [[] for _ in configs]
+    for case in cases:
+        patched = _as_of(hist.tests, case["later_fails"])
+        saved = {t: hist.tests[t] for t in patched}
+        hist.tests.update(patched)
+        try:
+            affected = _WORKER["index"].affected(case["changed"])
+            columns = _features(list(hist.tests), list(hist.tests.values()), affected)
+            for k, config in enumerate(configs):
+                durations = _WORKER["durations"][config["duration_estimate"]]
+                selected, _ = rank_with_explanations(hist, case["changed"], config["budget_tests"], config["budget_time_seconds"],
+                                                     affected=affected, strategy=config["strategy"],
+                                                     solver_time_limit=_WORKER["solver_time_limit"], durations=durations,
+                                                     file_overhead=hist.file_overhead, weights=_WORKER["weights"][k],
+                                                     columns=columns)
+                chosen = set(selected)
+                rows[k].append({"commit": case["commit"], "selected": len(selected), "faults": len(case["faults"]),
+                                "caught": sum(1 for t in case["faults"] if t in chosen),
+                                "planned_seconds": round(planned_seconds(selected, durations, hist.file_overhead), 6)})
+        finally:
+            hist.tests.update(saved)
+    return rows
+
+def summarize(rows: List[Dict[str, Any]], tests: int, full_seconds: float) -> Dict[str, Any]:
+    """Fault recall over all recorded failures, mean selected fraction and the predicted time saved vs the full suite."""
+    faults = sum(r["faults"] for r in rows)
+    caught = sum(r["caught"] for r in rows)
+    failing = [r for r in rows if r["faults"]]
+    planned = sum(r["planned_seconds"] for r in rows)
+    return {
+        "commits": len(rows),
+        "faults": faults,
+        "caught": caught,
+        "fault_recall": round(caught / faults, 4) if faults else None,
+        "commits_detected": round(sum(1 for r in failing if r["caught"]) / len(failing), 4) if failing else None,
+        "selected_fraction": round(sum(r["selected"] for r in rows) / (len(rows) * tests), 4) if rows and tests else 0.0,
+        "planned_seconds": round(planned, 2),
+        "full_seconds": round(full_seconds * len(rows), 2),
+        "time_saved_fraction": round(max(1 - planned / (full_seconds * len(rows)), 0.0), 4) if rows and full_seconds else 0.0,
+    }
+
+def replay(state_dir: str, cases: List[Dict[str, Any]], configs: List[Dict[str, Any]], jobs: int = 0,
+           solver_time_limit: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Rank every case under every config; one result (summary + per-commit rows) per config.
+    Commits are split into chunks over a process pool (`jobs`, default CPU count), each worker loading the
+    history and index once; jobs=1 runs in this process.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(cases)) or 1
+    if jobs == 1:
+        _init_worker(state_dir, configs, solver_time_limit, pooled=False)
+        try:
+            chunks = [_replay_cases(cases)]
+            hist, durations = _WORKER["hist"], _WORKER["durations"]
+        finally:
+            _WORKER.clear()
+    else:
+        size = -(-len(cases) // (jobs * 4))   # a few chunks per worker evens out slow commits
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(state_dir, configs, solver_time_limit)) as pool:
+            chunks = list(pool.map(_replay_cases, [cases[i:i + size] for i in range(0, len(cases), size)]))
+        hist = load_history(state_dir, runs=False, maps=False)
+        durations = {m: estimate_all(hist.tests, m) for m in {c["duration_estimate"] for c in configs}}
+    results = []
+    for k, config in enumerate(configs):
+        rows = [row for chunk in chunks for row in chunk[k]]
+        full = planned_seconds(hist.tests, durations[config["duration_estimate"]], hist.file_overhead)
+        results.append({"config": config, "summary": summarize(rows, len(hist.tests), full), "commits": rows})
+    return results
@@ -1,17 +1,88 @@
 
 from __future__ import annotations
-import os, json, time
-from typing import Dict, Any
-from .storage import ensure_dir
+import os, json, gzip, time, shutil
+from typing import Dict, Any, List
+from .config import settings
+from .storage import ensure_dir, load_runs
+from .timing import snapshot, span
 
-def write_report(state_dir: str, report_dir: str, selection: Dict[str, Any] | None = None, explanations: Dict[str, Any] | None = None) -> str:
+FORMAT = 2
+COLUMNS = ["nodeid", "affected", "fail_rate", "flaky_rate", "runtime_norm", "score", "included", "reason"]
+RECENT_RUNS = 50  # inlined in the summary for the timing trends
+
+def write_report(state_dir: str, report_dir: str, selection: Dict[str, Any] | None = None, explanations: Dict[str, Any] | None = None,
+                 page_size: int = settings.report_page_size, compress: bool = settings.report_gzip) -> str:
+    """
+    latest.json is a small summary; explanations and run records go into compact pages under
+    report_dir/pages-<id>/ that the dashboard fetches on demand. Explanation rows are pre-split into
+    views (all, affected, excluded, one per reason) so a filter only downloads matching pages.
+    The summary is replaced atomically after its pages exist; older page dirs are removed last.
+    """
     ensure_dir(report_dir)
+    page_size = max(1, page_size)
+    with span("report") as s:
+        runs = load_runs(state_dir)
+        pages_id = f"pages-{int(time.time() * 1000):x}-{os.getpid()}"
+        pages_dir = os.path.join(report_dir, pages_id)
+        ensure_dir(pages_dir)
+        ext = ".json.gz" if compress else ".json"
+
+        reasons: List[str] = []
+        reason_ids: Dict[str, int] = {}
+        rows = []
+        for nodeid, e in sorted((explanations or {}).items(), key=lambda kv: -(kv[1].get("score") or 0)):
+            reason = e.get("reason", "")
+            if reason not in reason_ids:
+                reason_ids[reason] = len(reasons)
+                reasons.append(reason)
+            rows.append([nodeid, int(bool(e.get("affected"))), e.get("fail_rate", 0), e.get("flaky_rate", 0),
+                         e.get("runtime_norm", 0), e.get("score", 0), int(bool(e.get("included"))), reason_ids[reason]])
+        views: Dict[str, List[list]] = {"all": rows, "affected": [r for r in rows if r[1]], "excluded": [r for r in rows if not r[6]]}
+        for i in range(len(reasons)):
+            views[f"reason-{i}"] = [r for r in rows if r[7] == i]
+        view_meta = {name: {"count": len(vrows), "pages": _write_pages(pages_dir, name, vrows, page_size, ext)}
+                     for name, vrows in views.items()}
+        newest_first = runs[::-1]
+        run_pages = _write_pages(pages_dir, "runs", newest_first, page_size, ext)
+
+        sel = dict(selection or {})
+        sel["selected_count"] = len(sel.pop("selected", None) or [])
+        sel["cached_pass_count"] = len(sel.pop("cached_pass", None) or [])
+        sel.pop("priority", None)  # per-test run order; selection.json has it
+        first = next(iter((explanations or {}).values()), {})
+        s["counts"].update(tests=len(rows), runs=len(runs), pages=run_pages + sum(v["pages"] for v in view_meta.values()))
     data = {
+        "format": FORMAT,
         "generated_at": int(time.time()),
-        "selection": selection or {},
-        "explanations": explanations or {},
-        "history": json.loads(open(os.path.join(state_dir, "history.json"), "r", encoding="utf-8").read()) if os.path.exists(os.path.join(state_dir, "history.json")) else {}
+        "pages": pages_id,
+        "ext": ext,
+        "page_size": page_size,
+        "selection": sel,
+        "explanations": {"columns": COLUMNS, "total": len(rows), "reasons": reasons,
+                         "weights": first.get("weights", {}), "views": view_meta},
+        "history": {"runs": len(runs), "pages": run_pages, "recent": newest_first[:RECENT_RUNS]},
+        "timings": snapshot(),  # phases of this invocation; the summary write below is the one step not included
     }
     out = os.path.join(report_dir, "latest.json")
-    open(out, "w", encoding="utf-8").write(json.dumps(data, indent=2))
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, out)
+    for name in os.listdir(report_dir):
+        if name.startswith("pages-") and name != pages_id:
+            shutil.rmtree(os.path.join(report_dir, name), ignore_errors=True)
     return out
+
+def _write_pages(pages_dir: str, name: str, items: List[Any], page_size: int, ext: str) -> int:
+    """`name`-00000<ext>, `name`-00001<ext>, ... as compact JSON arrays; returns the page count."""
+    n = 0
+    for n, start in enumerate(range(0, len(items), page_size), start=1):
+        path = os.path.join(pages_dir, f"{name}-{n - 1:05d}{ext}")
+        text = json.dumps(items[start:start + page_size], separators=(",", ":"))
+        if ext.endswith(".gz"):
+            with gzip.open(path, "wt", encoding="utf-8", compresslevel=5) as f:
+                f.write(text)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+    return n
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import os, sys, json, time, hashlib
+from typing import Dict, Iterable, List, Mapping, Tuple
+from .storage import _connect, history_path
+from .timing import span
+
+CONFIG_FILES = ("pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini", "conftest.py")
+MISSING = "-"
+
+class FileHasher:
+    """
+    sha1 of file contents, cached in history.db by (path, mtime_ns, size): a file is read again only
+    when its stat changes, and at most once per run. A rebuilt file with the same bytes keeps its digest.
+    """
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.known: Dict[str, Tuple[int, int, str]] = {}
+        self.seen: Dict[str, str] = {}
+        self.changed: Dict[str, Tuple[int, int, str]] = {}
+        self.hashed = 0
+        if os.path.exists(history_path(state_dir)):
+            con = _connect(state_dir)
+            try:
+                self.known = {p: (m, n, sha) for p, m, n, sha in con.execute("SELECT path, mtime_ns, size, sha FROM file_hashes")}
+            finally:
+                con.close()
+
+    def sha(self, path: str) -> str:
+        hit = self.seen.get(path)
+        if hit is not None:
+            return hit
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.seen[path] = MISSING
+            return MISSING
+        entry = self.known.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            sha = entry[2]
+        else:
+            with open(path, "rb") as f:
+                sha = hashlib.sha1(f.read()).hexdigest()
+            self.changed[path] = (st.st_mtime_ns, st.st_size, sha)
+            self.hashed += 1
+        self.seen[path] = sha
+        return sha
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        con = _connect(self.state_dir)
+        try:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO file_hashes (path, mtime_ns, size, sha) VALUES (?, ?, ?, ?)",
+                                ((p, m, n, sha) for p, (m, n, sha) in self.changed.items()))
+        finally:
+            con.close()
+        self.known.update(self.changed)
+        self.changed = {}
+
+def env_digest(hasher: FileHasher, pytest_opts: str, project_path: str) -> str:
+    """What every cached result depends on besides its own files: interpreter, pytest options, config files."""
+    configs = sorted({os.path.normpath(os.path.join(d, name)).replace("\\", "/")
+                      for d in (".", project_path) for name in CONFIG_FILES})
+    parts = {
+        "python": sys.version,
+        "implementation": sys.implementation.name,
+        "pytest_opts": pytest_opts.split(),
+        "configs": {p: hasher.sha(p) for p in configs},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def dependencies(nodeid: str, files: Iterable[str]) -> List[str]:
+    """The test's mapped files plus its own file and the conftest.py files on the way up to it."""
+    test_file = nodeid.split("::", 1)[0]
+    deps = set(files)
+    deps.add(test_file)
+    parts = test_file.split("/")[:-1]
+    deps.update("/".join(parts[:i] + ["conftest.py"]) for i in range(len(parts) + 1))
+    return sorted(deps)
+
+def result_digest(hasher: FileHasher, env: str, deps: List[str]) -> str:
+    h = hashlib.sha256(env.encode())
+    for p in deps:
+        h.update(f"\0{p}\0{hasher.sha(p)}".encode())
+    return h.hexdigest()
+
+def record_results(state_dir: str, tests: Dict[str, Dict], test_to_files: Mapping[str, List[str]],
+                   pytest_opts: str, project_path: str) -> Tuple[int, int]:
+    """
+    Store a digest for each passing test of a pytest report and drop the entries of tests that
+    did not pass. Returns (stored, dropped).
+    """
+    with span("result_cache", tests=len(tests)) as s:
+        hasher = FileHasher(state_dir)
+        env = env_digest(hasher, pytest_opts, project_path)
+        now = time.time()
+        rows, dropped = [], []
+        for nodeid, info in tests.items():
+            if info.get("outcome") != "passed":
+                dropped.append((nodeid,))
+                continue
+            deps = dependencies(nodeid, test_to_files.get(nodeid, ()))
+            rows.append((nodeid, result_digest(hasher, env, deps), json.dumps(deps, separators=(",", ":")), now))
+        con = _connect(state_dir)
+        try:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO result_cache (nodeid, digest, files, at) VALUES (?, ?, ?, ?)", rows)
+                con.executemany("DELETE FROM result_cache WHERE nodeid = ?", dropped)
+        finally:
+            con.close()
+        hasher.save()
+        s["counts"].update(stored=len(rows), dropped=len(dropped), hashed=hasher.hashed)
+    return len(rows), len(dropped)
+
+def cached_passes(state_dir: str, nodeids: List[str], pytest_opts: str, project_path: str) -> List[str]:
+    """
+    Tests whose last recorded pass had the same digest as now: none of the files it depended on
+    (as stored with that pass), its test file, conftests, config or interpreter changed since.
+    """
+    if not nodeids or not os.path.exists(history_path(state_dir)):
+        return []
+    with span("result_cache", tests=len(nodeids)) as s:
+        con = _connect(state_dir)
+        try:
+            stored: Dict[str, Tuple[str, str]] = {}
+            wanted = list(dict.fromkeys(nodeids))
+            for i in range(0, len(wanted), 500):
+                chunk = wanted[i:i + 500]
+                stored.update((n, (d, f)) for n, d, f in con.execute(
+                    f"SELECT nodeid, digest, files FROM result_cache WHERE nodeid IN ({','.join('?' * len(chunk))})", chunk))
+        finally:
+            con.close()
+        hasher = FileHasher(state_dir)
+        env = env_digest(hasher, pytest_opts, project_path)
+        hits = [n for n in nodeids if n in stored and result_digest(hasher, env, json.loads(stored[n][1])) == stored[n][0]]
+        hasher.save()
+        s["counts"].update(cached=len(stored), hits=len(hits), hashed=hasher.hashed)
+    return hits
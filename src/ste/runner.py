@@ -1,11 +1,20 @@
 from __future__ import annotations
-import os, sys, subprocess
+import os, sys, subprocess, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from .sharding import fragment_name
+from .coverage_map import TRACE_FILE
+from .daemon import run_in_daemon
+from .timing import span
 
-def run_pytest_with_coverage(project_path: str, state_dir: str, pytest_opts: str = "") -> int:
+def run_pytest_with_coverage(project_path: str, state_dir: str, pytest_opts: str = "", export_json: bool = False,
+                             targets: Optional[List[str]] = None) -> int:
     """
     Windows-safe:
-    1) run pytest with pytest-cov and per-test contexts (--cov-context=test)
-    2) export coverage JSON with contexts via coverage API -> state/coverage.json
+    1) run pytest with pytest-cov and per-test contexts (--cov-context=test) -> state/.coverage
+       over `targets` (nodeids/paths; default: the whole project)
+    2) only if export_json: export coverage JSON with contexts via coverage API -> state/coverage.json
+       (the default db backend reads state/.coverage directly, see coverage_map.build_maps)
     """
     os.makedirs(state_dir, exist_ok=True)
     env = os.environ.copy()
@@ -18,12 +27,16 @@ def run_pytest_with_coverage(project_path: str, state_dir: str, pytest_opts: str
         sys.executable, "-m", "pytest", "-q",
         "-p", "src.ste.pytest_plugin",
         f"--cov={project_path}", "--cov-branch", "--cov-context=test",
-        project_path,
+        *(targets or [project_path]),
     ]
     if pytest_opts:
         cmd.extend(pytest_opts.split())
     print("[run]", " ".join(cmd))
-    code = subprocess.call(cmd, env=env)
+    with span("pytest", coverage=1):
+        code = subprocess.call(cmd, env=env)
+
+    if not export_json:
+        return code
 
     # 2) export JSON *with contexts* via coverage API (no shell quoting issues)
     export_code = (
@@ -33,18 +46,84 @@ def run_pytest_with_coverage(project_path: str, state_dir: str, pytest_opts: str
         f"cov.json_report(outfile=r'{os.path.join(state_dir, 'coverage.json')}', show_contexts=True, pretty_print=True)"
     )
     print("[run] coverage API -> state/coverage.json")
-    _ = subprocess.call([sys.executable, "-c", export_code], env=env)
+    with span("coverage_export"):
+        _ = subprocess.call([sys.executable, "-c", export_code], env=env)
 
     return code
 
-def run_selected_tests(project_path: str, selected, pytest_opts: str = "") -> int:
+def run_pytest_with_tracer(project_path: str, state_dir: str, pytest_opts: str = "",
+                           targets: Optional[List[str]] = None) -> int:
+    """
+    pytest with the STE tracer plugin instead of coverage: per-test file lists go straight
+    to state/trace_map.json (see trace_plugin and coverage_map.trace_maps).
+    """
+    os.makedirs(state_dir, exist_ok=True)
     env = os.environ.copy()
     env["PYTHONPATH"] = os.getcwd() + os.pathsep + env.get("PYTHONPATH", "")
-    if not selected:
-        cmd = [sys.executable, "-m", "pytest", "-q", "-p", "src.ste.pytest_plugin", project_path]
-    else:
-        cmd = [sys.executable, "-m", "pytest", "-q", "-p", "src.ste.pytest_plugin", *selected]
+    env["STE_TRACE_OUT"] = os.path.join(state_dir, TRACE_FILE)
+    env["STE_TRACE_SOURCE"] = project_path
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "src.ste.pytest_plugin", "-p", "src.ste.trace_plugin",
+           *(targets or [project_path])]
     if pytest_opts:
         cmd.extend(pytest_opts.split())
     print("[run]", " ".join(cmd))
-    return subprocess.call(cmd, env=env)
+    with span("pytest", tracer=1):
+        return subprocess.call(cmd, env=env)
+
+def run_selected_tests(project_path: str, selected, pytest_opts: str = "", extra_env: Optional[Dict[str, str]] = None,
+                       order: bool = False, fail_fast: bool = False) -> int:
+    with span("pytest", selected=len(selected or [])):
+        return _run_selected(project_path, selected, pytest_opts, extra_env, order, fail_fast)
+
+def _run_selected(project_path: str, selected, pytest_opts: str, extra_env: Optional[Dict[str, str]],
+                  order: bool, fail_fast: bool) -> int:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.getcwd() + os.pathsep + env.get("PYTHONPATH", "")
+    env.update(extra_env or {})
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "src.ste.pytest_plugin", project_path]
+    sel_file = None
+    if selected:
+        # nodeids go through a file, not argv: no ARG_MAX limit and one set lookup per item
+        state_dir = env.get("STATE_DIR", "state")
+        os.makedirs(state_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=state_dir, prefix="ste_selection_",
+                                         suffix=".txt", delete=False) as f:
+            f.write("\n".join(selected))
+        sel_file = f.name
+        cmd.append(f"--ste-selection={sel_file}")
+    if order:
+        cmd.append("--ste-order")
+    if fail_fast:
+        cmd.append("-x")
+    if pytest_opts:
+        cmd.extend(pytest_opts.split())
+    print("[run]", " ".join(cmd) + (f"  ({len(selected)} selected)" if selected else ""))
+    try:
+        warm = run_in_daemon(env.get("STATE_DIR", "state"), cmd[3:], env)
+        if warm is not None:
+            print(f"[run] served by the STE daemon; startup saved ~{warm[1]:.2f}s")
+            return warm[0]
+        return subprocess.call(cmd, env=env)
+    finally:
+        if sel_file:
+            os.remove(sel_file)
+
+def shard_env(shard) -> Dict[str, str]:
+    """Env that makes the STE plugin write a per-shard report fragment."""
+    return {
+        "STE_REPORT_FILE": fragment_name(shard.index),
+        "STE_SHARD_INDEX": str(shard.index),
+        "STE_SHARD_PREDICTED": f"{shard.predicted_seconds:.3f}",
+    }
+
+def run_shards(project_path: str, shards, pytest_opts: str = "", order: bool = False, fail_fast: bool = False) -> int:
+    """Run shards concurrently (one pytest process each); returns the worst exit code."""
+    shards = [s for s in shards if s.tests]
+    if not shards:
+        return 0
+    # one span for all shards: the worker threads must not open spans of their own
+    with span("pytest", shards=len(shards), selected=sum(len(s.tests) for s in shards)), \
+            ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        codes = list(pool.map(lambda s: _run_selected(project_path, s.tests, pytest_opts, shard_env(s), order, fail_fast), shards))
+    failing = [c for c in codes if c not in (0, 5)]  # 5 = nothing collected
+    return failing[0] if failing else max(codes)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import os, json, time, hashlib
+from typing import Any, Dict, List, Optional, Tuple
+from .storage import _connect, history_path
+
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def selection_key(meta: Dict[str, str], changed: List[str], hunks: Optional[Dict[str, List[Tuple[int, int]]]],
+                  cfg, granularity: str, renames: Optional[Dict[str, str]] = None) -> str:
+    """
+    Everything a selection depends on: map and stats versions, the change set (hunks and
+    renames too), project, budgets, weights, strategy, duration estimate and explanation cap.
+    """
+    parts = {
+        "maps_version": meta.get("maps_version", "0"),
+        "stats_version": meta.get("stats_version", "0"),
+        "changed": sorted(changed),
+        "hunks": {f: sorted(r) for f, r in sorted(hunks.items())} if hunks is not None else None,
+        "renames": sorted((renames or {}).items()),
+        "granularity": granularity,
+        "project_path": os.path.abspath(cfg.project_path),
+        "budget_tests": cfg.budget_tests,
+        "budget_time_seconds": cfg.budget_time_seconds,
+        "strategy": cfg.strategy,
+        "duration_estimate": cfg.duration_estimate,
+        "solver_time_limit": cfg.solver_time_limit,
+        "explain_top_excluded": cfg.explain_top_excluded,
+        "weights": [cfg.weight_affected, cfg.weight_fail_rate, cfg.weight_flaky_rate, cfg.weight_runtime],
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def cache_get(state_dir: str, key: str) -> Optional[Dict[str, Any]]:
+    """Cached value or None; counts the hit or miss either way. No history yet: None, and nothing is created."""
+    if not os.path.exists(history_path(state_dir)):
+        return None
+    con = _connect(state_dir, create=False)
+    try:
+        with con:
+            row = con.execute("SELECT data FROM selection_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                con.execute("UPDATE selection_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            _count(con, "cache_hits" if row is not None else "cache_misses")
+        return json.loads(row[0]) if row is not None else None
+    finally:
+        con.close()
+
+def cache_put(state_dir: str, key: str, value: Dict[str, Any]) -> None:
+    """Store, then evict least-recently-used entries beyond the entry and byte bounds (skipped while there is no history)."""
+    if not os.path.exists(history_path(state_dir)):
+        return
+    data = json.dumps(value, separators=(",", ":"))
+    con = _connect(state_dir, create=False)
+    try:
+        with con:
+            con.execute("INSERT OR REPLACE INTO selection_cache (key, data, bytes, used_at) VALUES (?, ?, ?, ?)",
+                        (key, data, len(data), time.time()))
+            kept, total = 0, 0
+            evict = []
+            for k, n in con.execute("SELECT key, bytes FROM selection_cache ORDER BY used_at DESC"):
+                kept += 1
+                total += n
+                if kept > CACHE_MAX_ENTRIES or (total > CACHE_MAX_BYTES and kept > 1):
+                    evict.append((k,))
+            con.executemany("DELETE FROM selection_cache WHERE key = ?", evict)
+    finally:
+        con.close()
+
+def cache_stats(state_dir: str) -> Dict[str, int]:
+    if not os.path.exists(history_path(state_dir)):
+        return {"hits": 0, "misses": 0, "entries": 0}
+    con = _connect(state_dir, create=False)
+    try:
+        meta = dict(con.execute("SELECT key, value FROM meta WHERE key IN ('cache_hits', 'cache_misses')"))
+        entries = con.execute("SELECT COUNT(*) FROM selection_cache").fetchone()[0]
+    finally:
+        con.close()
+    return {"hits": int(meta.get("cache_hits", 0)), "misses": int(meta.get("cache_misses", 0)), "entries": entries}
+
+def _count(con, counter: str) -> None:
+    con.execute("INSERT INTO meta (key, value) VALUES (?, '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1", (counter,))
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import os, copy
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+from .storage import HISTORY_DB, history_path, load_history, load_maps, load_meta, remap_nodeid, remap_path, rename_paths
+from .path_index import INDEX_FILE as PATH_INDEX_FILE, build_path_index, load_path_index, remap_path_index, renamed_index
+from .line_index import INDEX_FILE as LINE_INDEX_FILE, LineIndex, load_line_index, remap_line_index, renamed_line_index
+from .durations import estimate_all, planned_seconds
+from .agent import Explanations, affected_for_hunks, failure_priorities, rank_with_explanations
+from .timing import span
+
+WATCHED = (HISTORY_DB, HISTORY_DB + "-wal", PATH_INDEX_FILE, LINE_INDEX_FILE)
+
+def state_signature(state_dir: str) -> Tuple[Tuple[str, int, int], ...]:
+    """(name, mtime_ns, size) of the files a selection reads; a cheap first check before re-reading versions."""
+    out = []
+    for name in WATCHED:
+        try:
+            st = os.stat(os.path.join(state_dir, name))
+            out.append((name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return tuple(out)
+
+def _indexes(signature) -> tuple:
+    return tuple(s for s in signature if s[0] in (PATH_INDEX_FILE, LINE_INDEX_FILE))
+
+def versions(meta: Dict[str, str]) -> Tuple[str, str]:
+    return meta.get("maps_version", "0"), meta.get("stats_version", "0")
+
+def apply_renames(state_dir: str, renames: Dict[str, str]) -> int:
+    """
+    Persist renamed/moved files (old -> new path) into the stored maps, stats, path index and line index,
+    so later selections need no per-request remap and nothing is re-recorded (the `remap` command).
+    Returns paths and nodeids moved.
+    """
+    if not renames:
+        return 0
+    with span("renames", renames=len(renames)) as s:
+        before = int(load_meta(state_dir).get("maps_version", 0))
+        lines = remap_line_index(state_dir, renames)
+        moved = rename_paths(state_dir, renames, bump=bool(lines))
+        if moved or lines:
+            remap_path_index(state_dir, renames, before, before + 1)
+        s["counts"]["moved"] = max(moved, lines)
+    return max(moved, lines)
+
+class Snapshot:
+    """
+    What ranking needs from a state dir, loaded once: stats, the path index (built from the maps if the
+    stored one is stale) and, on first use below file granularity, the line index. `select` loads one per
+    call; `serve` keeps one and swaps it when the state changes.
+    """
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.signature = state_signature(state_dir)
+        self.meta = load_meta(state_dir)
+        self.hist = load_history(state_dir, maps=False, runs=False)
+        with span("path_index"):
+            self.index = load_path_index(state_dir, self.hist.maps_version)
+            if self.index is None:
+                self.index = build_path_index(load_maps(state_dir, self.hist))
+        self.index_signature = _indexes(self.signature)
+        self._line_index: Optional[LineIndex] = None
+        self._line_loaded = False
+        self._durations: Dict[str, Dict[str, float]] = {}
+        self.renames: Dict[str, str] = {}
+        self._base: Optional[Snapshot] = None
+
+    def renamed(self, renames: Dict[str, str]) -> "Snapshot":
+        """
+        A view for one selection with renamed files, and tests in renamed test files, under their new paths;
+        the stored state and this snapshot are left as they are.
+        """
+        if not renames:
+            return self
+        view = copy.copy(self)
+        view.renames = dict(renames)
+        view.index = renamed_index(self.index, renames)
+        tests = {t: remap_nodeid(t, renames) for t in self.hist.tests}
+        if any(t != n for t, n in tests.items()):
+            view.hist = replace(self.hist, tests={n: replace(self.hist.tests[t], nodeid=n) for t, n in tests.items()},
+                                file_overhead={remap_path(f, renames): v for f, v in self.hist.file_overhead.items()})
+            view._durations = {}
+        view._base, view._line_index, view._line_loaded = self, None, False
+        return view
+
+    def line_index(self) -> Optional[LineIndex]:
+        if not self._line_loaded:
+            if self._base is not None:
+                base = self._base.line_index()   # loaded once by the snapshot, renamed per view
+                self._line_index = renamed_line_index(base, self.renames) if base is not None else None
+            else:
+                with span("line_index"):
+                    self._line_index = load_line_index(self.state_dir)
+            self._line_loaded = True
+        return self._line_index
+
+    def durations(self, mode: str) -> Dict[str, float]:
+        if mode not in self._durations:
+            self._durations[mode] = estimate_all(self.hist.tests, mode)
+        return self._durations[mode]
+
+    def stale(self) -> bool:
+        """History versions or index files changed since loading (counters such as cache hits do not count)."""
+        signature = state_signature(self.state_dir)
+        if signature == self.signature:
+            return False
+        if _indexes(signature) != self.index_signature:
+            return True
+        if not os.path.exists(history_path(self.state_dir)):
+            return bool(self.hist.tests)
+        if versions(load_meta(self.state_dir)) != versions(self.meta):
+            return True
+        self.signature = signature   # only unrelated writes; skip the version read until the next change
+        return False
+
+def rank(cfg, snap: Snapshot, files: List[str], hunks, granularity: str) -> Tuple[List[str], Explanations, str, Dict[str, float]]:
+    """Selected, lazy explanations, effective granularity (file when there is no line index) and planning durations."""
+    affected = None
+    if granularity != "file":
+        line_index = snap.line_index()
+        if line_index is None:
+            granularity = "file"
+        else:
+            with span("line_index", granularity=granularity):
+                affected = affected_for_hunks(snap.hist, hunks, line_index, granularity, snap.index)
+    durations = snap.durations(cfg.duration_estimate)
+    selected, explanations = rank_with_explanations(snap.hist, files, cfg.budget_tests, cfg.budget_time_seconds,
+                                                    index=snap.index, affected=affected, strategy=cfg.strategy,
+                                                    solver_time_limit=cfg.solver_time_limit,
+                                                    durations=durations, file_overhead=snap.hist.file_overhead)
+    return selected, explanations, granularity, durations
+
+def compute_selection(cfg, snap: Snapshot, files: List[str], hunks, granularity: str) -> Dict[str, Any]:
+    """The cacheable selection result: selected, explanations, priority, effective granularity and planned seconds."""
+    selected, explanations, granularity, durations = rank(cfg, snap, files, hunks, granularity)
+    affected_selected = {t for t in selected if explanations[t]["affected"]}
+    return {
+        "selected": selected,
+        "explanations": explanations.materialized(cfg.explain_top_excluded),  # the rest: `explain <nodeid>`
+        "ranked": len(explanations),
+        "priority": failure_priorities(snap.hist, selected, affected_selected),
+        "granularity": granularity,
+        "planned_seconds": round(planned_seconds(selected, durations, snap.hist.file_overhead), 3),
+    }
@@ -0,0 +1,262 @@
+from __future__ import annotations
+import os, json, time, signal, socket, asyncio, threading
+import http.client, urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http import HTTPStatus
+from typing import Any, Deque, Dict, Optional, Tuple
+from .selector import Snapshot, compute_selection, versions
+from .selection_cache import CACHE_MAX_ENTRIES, selection_key
+from .git_diff import changes, changed_hunks, renamed
+from .knapsack import STRATEGIES
+from .durations import ESTIMATES
+from .line_index import GRANULARITIES
+from . import timing
+
+SOCKET_NAME = "ste_serve.sock"
+LATENCY_WINDOW = 1024            # recent /select latencies kept for the percentiles
+MAX_BODY = 64 * 1024 * 1024
+OVERRIDES = ("budget_tests", "budget_time_seconds", "strategy", "duration_estimate", "solver_time_limit", "explain_top_excluded",
+             "weight_affected", "weight_fail_rate", "weight_flaky_rate", "weight_runtime")  # per request, typed like the settings
+
+def socket_path(state_dir: str) -> str:
+    return os.path.join(state_dir, SOCKET_NAME)
+
+class SelectionService:
+    """
+    One loaded Snapshot of the state dir plus an in-memory LRU of selection results keyed like the
+    SQLite selection cache. Selections (git, ranking) run one at a time on a worker thread, so the
+    event loop keeps answering /healthz and /metrics; the snapshot is swapped (and the LRU dropped)
+    under a lock when the history versions or index files change.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ste-select")  # timing spans are process-global
+        self.started = time.time()
+        self.results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "selections": 0, "errors": 0, "cache_hits": 0, "cache_misses": 0, "reloads": 0}
+        self.snap = self._load()
+
+    def _load(self) -> Snapshot:
+        t0 = time.perf_counter()
+        snap = Snapshot(self.cfg.state_dir)
+        self.load_seconds = round(time.perf_counter() - t0, 3)
+        self.loaded_at = int(time.time())
+        return snap
+
+    def reload_if_stale(self) -> Snapshot:
+        """The current snapshot, reloaded first if the state changed."""
+        with self.lock:
+            if self.snap.stale():
+                self.snap = self._load()
+                self.results.clear()
+                self.counters["reloads"] += 1
+                print(f"[serve] state changed; reloaded {len(self.snap.hist.tests)} tests in {self.load_seconds:.2f}s", flush=True)
+            return self.snap
+
+    def select(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST /select: `changed_files` (+ `hunks` below file granularity, `renames` old -> new) or `base`/`head`
+        refs, optional budget overrides. Renames apply to this selection only; the state dir is never written.
+        """
+        timing.reset("serve")
+        t0 = time.perf_counter()
+        if req.get("state_dir") and os.path.realpath(req["state_dir"]) != os.path.realpath(self.cfg.state_dir):
+            raise ValueError(f"this server ranks against {self.cfg.state_dir}, not {req['state_dir']}")
+        cfg = replace(self.cfg, **{k: type(getattr(self.cfg, k))(req[k]) for k in OVERRIDES if req.get(k) is not None})
+        granularity = req.get("granularity") or "file"
+        if cfg.strategy not in STRATEGIES or cfg.duration_estimate not in ESTIMATES or granularity not in GRANULARITIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, duration_estimate one of {ESTIMATES}, "
+                             f"granularity one of {GRANULARITIES}")
+        if "changed_files" in req:
+            files = list(req["changed_files"])
+            if granularity != "file" and req.get("hunks") is None:
+                raise ValueError("hunks are required below file granularity")
+            hunks = {f: [tuple(r) for r in rs] for f, rs in req["hunks"].items()} if granularity != "file" else None
+            moves = dict(req.get("renames") or {})
+            if not all(isinstance(k, str) and isinstance(v, str) for k, v in moves.items()):
+                raise ValueError("renames maps old paths to new paths")
+        elif req.get("base"):
+            head = req.get("head") or "HEAD"
+            diff = changes(req["base"], head)
+            files, moves = [c.path for c in diff], renamed(diff)
+            hunks = changed_hunks(req["base"], head) if granularity != "file" else None
+        else:
+            raise ValueError("send changed_files or base (and head) refs")
+        snap = self.reload_if_stale()
+
+        key = selection_key(snap.meta, files, hunks, cfg, granularity, moves)
+        result = None if req.get("no_cache") else self.results.get(key)
+        hit = result is not None
+        if hit:
+            self.results.move_to_end(key)
+            self.counters["cache_hits"] += 1
+        else:
+            self.counters["cache_misses"] += 1
+            result = compute_selection(cfg, snap.renamed(moves), files, hunks, granularity)
+            if not req.get("no_cache"):
+                self.results[key] = result
+                while len(self.results) > CACHE_MAX_ENTRIES:
+                    self.results.popitem(last=False)
+        seconds = time.perf_counter() - t0
+        self.latencies.append(seconds)
+        self.counters["selections"] += 1
+        maps_version, stats_version = versions(snap.meta)
+        return {**result, "changed_files": files, "renames": moves, "cache_hit": hit, "cache": self._cache_stats(),
+                "maps_version": maps_version, "stats_version": stats_version,
+                "server_seconds": round(seconds, 4), "phases": timing.snapshot()["phases"]}
+
+    def _cache_stats(self) -> Dict[str, int]:
+        return {"hits": self.counters["cache_hits"], "misses": self.counters["cache_misses"], "entries": len(self.results)}
+
+    def metrics(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2) if lat else None
+        maps_version, stats_version = versions(self.snap.meta)
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "state_dir": self.cfg.state_dir,
+            "tests": len(self.snap.hist.tests),
+            "maps_version": maps_version,
+            "stats_version": stats_version,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            **self.counters,
+            "cache": self._cache_stats(),
+            "latency_ms": {"window": len(lat), "mean": round(sum(lat) / len(lat) * 1000, 2) if lat else None,
+                           "p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": round(lat[-1] * 1000, 2) if lat else None},
+        }
+
+    def route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        self.counters["requests"] += 1
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "GET" and path == "/healthz":
+            return 200, {"ok": True, "tests": len(self.snap.hist.tests)}
+        if method != "POST" or path != "/select":
+            return 404, {"error": f"no route {method} {path}"}
+        try:
+            return 200, self.select(json.loads(body or b"{}"))
+        except (ValueError, TypeError, KeyError) as e:
+            self.counters["errors"] += 1
+            return 400, {"error": str(e)}
+        except Exception as e:  # keep serving; the client falls back to selecting locally
+            self.counters["errors"] += 1
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Minimal HTTP/1.1: one request per connection, JSON in and out."""
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+            headers: Dict[str, str] = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY:
+                status, payload = 413, {"error": "request body too large"}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                path = target.split("?", 1)[0]
+                if path == "/select":
+                    status, payload = await asyncio.get_running_loop().run_in_executor(self.pool, self.route, method, path, body)
+                else:
+                    status, payload = self.route(method, path, body)
+            data = json.dumps(payload, separators=(",", ":")).encode()
+            writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def watch(self, interval: float) -> None:
+        """Reload ahead of the next request when record-run or a bundle restore rewrote the state."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.pool, self.reload_if_stale)
+            except Exception as e:
+                print(f"[serve] reload failed, keeping the loaded state: {e}", flush=True)
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(cfg, host: str = "127.0.0.1", port: Optional[int] = None, reload_interval: float = 1.0) -> None:
+    """Serve selections over TCP (`port`) or, by default, the Unix socket <state>/ste_serve.sock. Blocks until Ctrl+C/SIGTERM."""
+    if port is None and not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Unix sockets are not available here; pass a TCP port")
+    service = SelectionService(cfg)
+    path = socket_path(cfg.state_dir)
+
+    async def main() -> None:
+        if port is None:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(service.handle, path=path)
+            where = f"unix:{path}"
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+            where = f"http://{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"[serve] loaded {len(service.snap.hist.tests)} tests in {service.load_seconds:.2f}s; listening on {where}", flush=True)
+        watcher = asyncio.create_task(service.watch(reload_interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("[serve] stopped", flush=True)
+    finally:
+        service.pool.shutdown(wait=False, cancel_futures=True)
+        if port is None and os.path.exists(path):
+            os.remove(path)
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+def server_url(cfg) -> str:
+    """SELECTION_SERVER, else the state dir's socket if a server has created it; '' when there is none."""
+    if cfg.selection_server:
+        return cfg.selection_server
+    path = socket_path(cfg.state_dir)
+    return f"unix:{path}" if hasattr(socket, "AF_UNIX") and os.path.exists(path) else ""
+
+def call(url: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None, timeout: float = 60.0) -> Dict[str, Any]:
+    """One request to a selection server (`unix:/path` or `http://host:port`); OSError if unreachable, RuntimeError on an error reply."""
+    if url.startswith("unix:"):
+        conn: http.client.HTTPConnection = _UnixConnection(url[len("unix:"):], timeout)
+    else:
+        parts = urllib.parse.urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname or "127.0.0.1", parts.port or 80, timeout=timeout)
+    try:
+        body = json.dumps(payload).encode() if payload is not None else None
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"} if body is not None else {})
+        resp = conn.getresponse()
+        data = json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(data.get("error") or f"HTTP {resp.status}")
+    return data
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import os, json, glob, heapq
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+from .storage import TestStats
+
+REPORT_FILE = "last_pytest_report.json"
+FRAGMENT_GLOB = "last_pytest_report.shard-*.json"
+DEFAULT_UNKNOWN_SECONDS = 1.0
+
+@dataclass
+class Shard:
+    index: int
+    tests: List[str] = field(default_factory=list)
+    predicted_seconds: float = 0.0
+
+def fragment_name(index: int) -> str:
+    return f"last_pytest_report.shard-{index}.json"
+
+def estimate_durations(selected: List[str], stats: Dict[str, TestStats]) -> Dict[str, float]:
+    """Historical avg_duration; tests without history get the median of the known ones."""
+    known = sorted(stats[t].avg_duration for t in selected if t in stats and stats[t].avg_duration > 0)
+    unknown = known[len(known) // 2] if known else DEFAULT_UNKNOWN_SECONDS
+    return {t: stats[t].avg_duration if t in stats and stats[t].avg_duration > 0 else unknown for t in selected}
+
+def partition(selected: List[str], stats: Dict[str, TestStats], n: int) -> List[Shard]:
+    """
+    Longest-processing-time bin packing: tests by descending duration, each to the
+    currently lightest shard. Ties break on nodeid so every CI node computes the same plan.
+    """
+    n = max(1, n)
+    durations = estimate_durations(selected, stats)
+    shards = [Shard(index=i) for i in range(n)]
+    heap: List[Tuple[float, int]] = [(0.0, i) for i in range(n)]
+    for t in sorted(selected, key=lambda t: (-durations[t], t)):
+        load, i = heapq.heappop(heap)
+        shards[i].tests.append(t)
+        shards[i].predicted_seconds = load + durations[t]
+        heapq.heappush(heap, (shards[i].predicted_seconds, i))
+    return shards
+
+def apfd(outcomes) -> float | None:
+    """
+    Average Percentage of Faults Detected, counting each failing test as one fault:
+    1 - sum(positions of failures) / (n * m) + 1 / (2n).
+    """
+    n = len(outcomes)
+    positions = [i for i, o in enumerate(outcomes, 1) if o == "failed"]
+    if not n or not positions:
+        return None
+    return round(1 - sum(positions) / (n * len(positions)) + 1 / (2 * n), 4)
+
+def _finish_times(rpt: Dict[str, Any]) -> Dict[str, float]:
+    """When each test of a fragment finished: its shard's start plus the tests run before it (report order is run order)."""
+    t = rpt.get("first_test_at", rpt.get("started_at", 0.0))
+    out = {}
+    for nodeid, info in rpt.get("tests", {}).items():
+        t += info.get("setup", 0.0) + info.get("duration", 0.0) + info.get("teardown", 0.0)
+        out[nodeid] = t
+    return out
+
+def merge_reports(state_dir: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Combine shard fragments into one last_pytest_report.json-shaped dict.
+    Returns (merged report, per-shard summary with predicted vs actual seconds).
+    """
+    merged: Dict[str, Any] = {"tests": {}, "shards": []}
+    summary: List[Dict[str, Any]] = []
+    finished: Dict[str, float] = {}
+    fragments = [json.loads(open(p, "r", encoding="utf-8").read()) for p in glob.glob(os.path.join(state_dir, FRAGMENT_GLOB))]
+    for rpt in sorted(fragments, key=lambda r: r.get("shard_index", 0)):
+        merged["tests"].update(rpt.get("tests", {}))
+        finished.update(_finish_times(rpt))
+        for k, pick in (("started_at", min), ("finished_at", max)):
+            if k in rpt:
+                merged[k] = pick(merged.get(k, rpt[k]), rpt[k])
+        if rpt.get("time_to_first_failure") is not None:
+            # shards run concurrently, so the earliest shard-local failure is the run's first
+            merged["time_to_first_failure"] = min(merged.get("time_to_first_failure", rpt["time_to_first_failure"]), rpt["time_to_first_failure"])
+        merged["order"] = rpt.get("order", "default")
+        if rpt.get("exitstatus"):
+            merged["exitstatus"] = merged.get("exitstatus") or rpt["exitstatus"]
+        summary.append({
+            "index": rpt.get("shard_index"),
+            "count": len(rpt.get("tests", {})),
+            "predicted_seconds": rpt.get("predicted_seconds"),
+            "actual_seconds": round(rpt.get("finished_at", 0.0) - rpt.get("started_at", 0.0), 3),
+        })
+    merged.setdefault("exitstatus", 0)
+    # shards run concurrently: faults count in the order the tests finished across all of them
+    merged["apfd"] = apfd([merged["tests"][t]["outcome"] for t in sorted(finished, key=finished.get)])
+    merged["shards"] = summary
+    return merged, summary
+
+def write_merged_report(state_dir: str, merged: Dict[str, Any]) -> str:
+    out = os.path.join(state_dir, REPORT_FILE)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+    return out
+
+def clear_fragments(state_dir: str) -> None:
+    for p in glob.glob(os.path.join(state_dir, FRAGMENT_GLOB)):
+        os.remove(p)
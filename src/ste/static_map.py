@@ -0,0 +1,259 @@
+from __future__ import annotations
+import os, ast, json, hashlib
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from .storage import ensure_dir
+
+CACHE_FILE = "static_imports.json"
+MAPPERS = ("coverage", "static", "union", "trace")
+
+def _rel(path: str, root: str) -> str:
+    return os.path.relpath(path, root).replace("\\", "/")
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+def parse_file(source: bytes) -> Dict[str, list]:
+    """
+    Raw import statements ([level, module, [names]]) and pytest-style test ids of one file.
+    Literal importlib.import_module("x") / __import__("x") calls count as imports.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return {"imports": [], "tests": []}
+    imports: List[list] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend([0, a.name, []] for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append([node.level, node.module or "", [a.name for a in node.names]])
+        elif isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant) \
+                and isinstance(node.args[0].value, str):
+            fn = node.func
+            name = fn.attr if isinstance(fn, ast.Attribute) else fn.id if isinstance(fn, ast.Name) else ""
+            if name in ("import_module", "__import__"):
+                imports.append([0, node.args[0].value, []])
+    tests: List[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            tests.append(node.name)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            tests.extend(f"{node.name}::{m.name}" for m in node.body
+                         if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and m.name.startswith("test"))
+    return {"imports": imports, "tests": tests}
+
+class ImportGraph:
+    """
+    Module-level import graph of a source tree, resolved without executing anything.
+    Per-file parse results are cached by content hash in state/static_imports.json.
+    """
+    def __init__(self, root: str, state_dir: str):
+        self.root = os.path.abspath(root)
+        self.state_dir = state_dir
+        self.cache: Dict[str, Dict[str, list]] = {}
+        self.parsed: Dict[str, Dict[str, list]] = {}
+        self.deps: Dict[str, List[str]] = {}
+        self.closures: Dict[str, FrozenSet[str]] = {}
+        self.modules: Dict[str, Optional[str]] = {}
+        self.reparsed = 0
+        p = os.path.join(state_dir, CACHE_FILE)
+        if os.path.exists(p):
+            data = json.loads(open(p, "r", encoding="utf-8").read())
+            if data.get("version") == 1:
+                self.cache = data.get("files", {})
+
+    def save(self) -> str:
+        ensure_dir(self.state_dir)
+        out = os.path.join(self.state_dir, CACHE_FILE)
+        data = {"version": 1, "files": self.parsed}
+        open(out, "w", encoding="utf-8").write(json.dumps(data, separators=(",", ":")))
+        return out
+
+    def info(self, rel: str) -> Dict[str, list]:
+        hit = self.parsed.get(rel)
+        if hit is not None:
+            return hit
+        source = open(os.path.join(self.root, rel), "rb").read()
+        sha = hashlib.sha1(source).hexdigest()
+        entry = self.cache.get(rel)
+        if entry is None or entry.get("sha") != sha:
+            entry = dict(parse_file(source), sha=sha)
+            self.reparsed += 1
+        self.parsed[rel] = entry
+        return entry
+
+    def _module_file(self, dotted: str) -> Optional[str]:
+        if dotted not in self.modules:
+            found = None
+            rel = dotted.replace(".", "/")
+            for cand in (rel + ".py", rel + "/__init__.py"):
+                if os.path.isfile(os.path.join(self.root, cand)):
+                    found = cand
+                    break
+            self.modules[dotted] = found
+        return self.modules[dotted]
+
+    def _packages(self, dotted: str) -> List[str]:
+        """Files executed by importing `dotted`: every package __init__ on the way plus the module."""
+        parts = dotted.split(".")
+        out = []
+        for i in range(1, len(parts) + 1):
+            f = self._module_file(".".join(parts[:i]))
+            if f:
+                out.append(f)
+        return out
+
+    def _resolve(self, rel: str, level: int, module: str, names: List[str]) -> Set[str]:
+        pkg = rel.split("/")[:-1]
+        if level:
+            if level - 1 > len(pkg):
+                return set()
+            anchors = [".".join(pkg[:len(pkg) - (level - 1)])]
+        else:
+            # root-relative first, then relative to each ancestor directory (pytest's rootdir/basedir insertion)
+            anchors = [""] + [".".join(pkg[:i]) for i in range(len(pkg), 0, -1)]
+        for anchor in anchors:
+            dotted = ".".join(p for p in (anchor, module) if p)
+            if not dotted:
+                continue
+            mod = self._module_file(dotted)
+            subs = {f for f in (self._module_file(f"{dotted}.{n}") for n in names) if f}  # `from pkg import submodule`
+            if mod is None and not subs:
+                continue
+            return set(self._packages(dotted)) | subs
+        return set()
+
+    def direct(self, rel: str) -> List[str]:
+        deps = self.deps.get(rel)
+        if deps is None:
+            found: Set[str] = set()
+            for level, module, names in self.info(rel)["imports"]:
+                found |= self._resolve(rel, level, module, names)
+            found.discard(rel)
+            deps = self.deps[rel] = sorted(found)
+        return deps
+
+    def closure(self, rel: str) -> FrozenSet[str]:
+        """Every file reachable from `rel` (itself included), memoized per strongly connected component."""
+        if rel not in self.closures:
+            self._close_from(rel)
+        return self.closures[rel]
+
+    def _close_from(self, start: str) -> None:
+        # iterative Tarjan: components pop in reverse topological order, so every dependency
+        # outside the current component already has its closure when the component closes
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        work = [(start, iter(self.direct(start)))]
+        index[start] = low[start] = 0
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, deps = work[-1]
+            advanced = False
+            for dep in deps:
+                if dep in self.closures:
+                    continue
+                if dep not in index:
+                    index[dep] = low[dep] = len(index)
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(self.direct(dep))))
+                    advanced = True
+                    break
+                if dep in on_stack:
+                    low[node] = min(low[node], index[dep])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component: List[str] = []
+                while True:
+                    n = stack.pop()
+                    on_stack.discard(n)
+                    component.append(n)
+                    if n == node:
+                        break
+                reach: Set[str] = set(component)
+                for n in component:
+                    for dep in self.direct(n):
+                        if dep not in reach:
+                            reach |= self.closures[dep]
+                frozen = frozenset(reach)
+                for n in component:
+                    self.closures[n] = frozen
+
+    def conftests(self, rel: str) -> List[str]:
+        parts = rel.split("/")[:-1]
+        out = []
+        for i in range(len(parts), -1, -1):
+            c = "/".join(parts[:i] + ["conftest.py"])
+            if os.path.isfile(os.path.join(self.root, c)):
+                out.append(c)
+        return out
+
+def static_maps(project_path: str, state_dir: str, project_root: str) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    Map every statically discovered test (path::name) to the transitive import closure of its
+    test file and of the conftest.py files above it. Same shapes as coverage_map.build_maps.
+    """
+    graph = ImportGraph(project_root, state_dir)
+    test_files = static_file_closures(graph, project_path)
+    file_to_tests: Dict[str, Set[str]] = {}
+    test_to_files: Dict[str, List[str]] = {}
+    for rel, files in test_files.items():
+        for name in graph.info(rel)["tests"]:
+            nodeid = f"{rel}::{name}"
+            test_to_files[nodeid] = files
+            for f in files:
+                file_to_tests.setdefault(f, set()).add(nodeid)
+    graph.save()
+    return {k: sorted(v) for k, v in file_to_tests.items()}, test_to_files
+
+def static_file_closures(graph: ImportGraph, project_path: str) -> Dict[str, List[str]]:
+    """test file -> sorted files it depends on (itself included)."""
+    out: Dict[str, List[str]] = {}
+    for dirpath, dirnames, filenames in os.walk(os.path.join(graph.root, project_path)):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+        for fn in sorted(filenames):
+            if not is_test_file(fn):
+                continue
+            rel = _rel(os.path.join(dirpath, fn), graph.root)
+            files: Set[str] = set()
+            for start in [rel] + graph.conftests(rel):
+                files |= graph.closure(start)
+            out[rel] = sorted(files)
+    return out
+
+def union_maps(file_to_tests: Dict[str, List[str]], test_to_files: Dict[str, List[str]],
+               project_path: str, state_dir: str, project_root: str,
+               known_tests: Iterable[str] = ()) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    Add static import edges to measured maps. Measured tests get their file's import closure added,
+    parametrized ids included; test files nobody measured or knows get static nodeids. `known_tests`
+    (history tests that did not run this time) only keep their files from getting static nodeids:
+    they get no edges here, so an incremental merge_maps keeps their recorded ones.
+    """
+    graph = ImportGraph(project_root, state_dir)
+    closures = static_file_closures(graph, project_path)
+    known = set(known_tests) - set(test_to_files)
+    by_file: Dict[str, List[str]] = {}
+    for nodeid in set(test_to_files) | known:
+        by_file.setdefault(nodeid.split("::", 1)[0], []).append(nodeid)
+    f2t = {f: set(ts) for f, ts in file_to_tests.items()}
+    t2f = {t: set(fs) for t, fs in test_to_files.items()}
+    for rel, files in closures.items():
+        for nodeid in by_file.get(rel) or [f"{rel}::{name}" for name in graph.info(rel)["tests"]]:
+            if nodeid in known:
+                continue
+            t2f.setdefault(nodeid, set()).update(files)
+            for f in files:
+                f2t.setdefault(f, set()).add(nodeid)
+    graph.save()
+    return {k: sorted(v) for k, v in f2t.items()}, {k: sorted(v) for k, v in t2f.items()}
@@ -1,19 +1,25 @@
 
 from __future__ import annotations
-import os, json, time
-from dataclasses import dataclass, asdict
-from typing import Dict, List, Any
+import os, json, sqlite3, time
+from array import array
+from urllib.parse import quote
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+from .compact import CompactMaps
+from .timing import count, timed
 
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
-@dataclass
+@dataclass(slots=True)
 class TestStats:
     nodeid: str
     runs: int = 0
     fails: int = 0
     flaky: int = 0
     avg_duration: float = 0.0
+    ewma_duration: float = 0.0
+    samples: array = field(default_factory=lambda: array("f"))  # most recent durations (float32), see durations.WINDOW
 
     @property
     def fail_rate(self) -> float:
@@ -23,36 +29,329 @@ class TestStats:
     def flaky_rate(self) -> float:
         return self.flaky / self.runs if self.runs else 0.0
 
+@dataclass
+class Stored:
+    """What history.db held when a History was loaded (or last saved), so save_history writes only the difference."""
+    stats: Dict[str, tuple] = field(default_factory=dict)        # nodeid -> its `tests` row
+    overhead: Dict[str, float] = field(default_factory=dict)
+    mapped_at: Dict[str, str] = field(default_factory=dict)
+    edges: Optional[Mapping[str, List[str]]] = None              # nodeid -> files; None while maps are not loaded
+
 @dataclass
 class History:
     tests: Dict[str, TestStats]
-    coverage_map: Dict[str, List[str]]  # file -> [nodeid]
-    test_to_files: Dict[str, List[str]]
+    coverage_map: Mapping[str, List[str]]   # file -> [nodeid]; a read-only compact.MapView when loaded from disk
+    test_to_files: Mapping[str, List[str]]
     runs: List[Dict[str, Any]]
+    mapped_at: Dict[str, str] = field(default_factory=dict)  # nodeid -> commit its edges were measured at
+    version: int = 0                                           # bumped by every save_history
+    maps_version: int = 0                                      # bumped when the edges are rewritten
+    stats_version: int = 0                                     # bumped when test stats are written
+    partial: Set[str] = field(default_factory=set)             # parts not loaded: "maps" and/or "runs"
+    stored_runs: int = 0                                       # runs[:stored_runs] are already on disk
+    file_overhead: Dict[str, float] = field(default_factory=dict)  # test file -> module/class fixture seconds
+    stored: Optional[Stored] = None                            # None: not loaded from history.db, saves write everything
+
+HISTORY_DB = "history.db"
+LEGACY_HISTORY_JSON = "history.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tests (
+    nodeid TEXT PRIMARY KEY, runs INTEGER, fails INTEGER, flaky INTEGER, avg_duration REAL
+);
+CREATE TABLE IF NOT EXISTS edges (file TEXT, nodeid TEXT, PRIMARY KEY (file, nodeid)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mapped_at (nodeid TEXT PRIMARY KEY, commit_sha TEXT);
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, data TEXT);
+CREATE TABLE IF NOT EXISTS file_overhead (file TEXT PRIMARY KEY, seconds REAL);
+CREATE TABLE IF NOT EXISTS selection_cache (key TEXT PRIMARY KEY, data TEXT, bytes INTEGER, used_at REAL);
+CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha TEXT);
+CREATE TABLE IF NOT EXISTS result_cache (nodeid TEXT PRIMARY KEY, digest TEXT, files TEXT, at REAL);
+"""
+
+def history_path(state_dir: str) -> str:
+    return os.path.join(state_dir, HISTORY_DB)
+
+def _connect(state_dir: str, create: bool = True) -> sqlite3.Connection:
+    """`create=False` opens an existing history.db and raises sqlite3.OperationalError if there is none."""
+    if create:
+        ensure_dir(state_dir)
+        con = sqlite3.connect(history_path(state_dir))
+    else:
+        con = sqlite3.connect(f"file:{quote(os.path.abspath(history_path(state_dir)))}?mode=rw", uri=True)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(_SCHEMA)
+    cols = {row[1] for row in con.execute("PRAGMA table_info(tests)")}
+    for col, decl in (("ewma", "REAL DEFAULT 0"), ("samples", "BLOB")):
+        if col not in cols:
+            con.execute(f"ALTER TABLE tests ADD COLUMN {col} {decl}")
+    return con
+
+def _pack(samples) -> bytes:
+    return array("f", samples).tobytes()  # 4 bytes per sample
+
+def _unpack(blob: bytes | None) -> array:
+    a = array("f")
+    if blob:
+        a.frombytes(blob)
+    return a
+
+@timed("load_history")
+def load_history(state_dir: str, maps: bool = True, runs: bool = True) -> History:
+    """
+    Load from state/history.db (SQLite, WAL). `maps=False` / `runs=False` skip those
+    tables entirely; save_history then leaves them untouched (new runs are still appended).
+    A legacy state/history.json is migrated on first use.
+    """
+    if not os.path.exists(history_path(state_dir)):
+        legacy = os.path.join(state_dir, LEGACY_HISTORY_JSON)
+        if not os.path.exists(legacy):
+            return History(tests={}, coverage_map={}, test_to_files={}, runs=[])
+        migrate_json_history(state_dir)
+
+    con = _connect(state_dir)
+    try:
+        h = History(tests={}, coverage_map={}, test_to_files={}, runs=[])
+        meta = dict(con.execute("SELECT key, value FROM meta"))
+        h.version = int(meta.get("version", 0))
+        h.maps_version = int(meta.get("maps_version", 0))
+        h.stats_version = int(meta.get("stats_version", 0))
+        h.stored = Stored()
+        for nodeid, n, fails, flaky, avg, ewma, samples in con.execute(
+                "SELECT nodeid, runs, fails, flaky, avg_duration, ewma, samples FROM tests"):
+            st = TestStats(nodeid=nodeid, runs=n, fails=fails, flaky=flaky, avg_duration=avg,
+                           ewma_duration=ewma or 0.0, samples=_unpack(samples))
+            h.tests[nodeid] = st
+            h.stored.stats[nodeid] = _row(st)
+        h.file_overhead = dict(con.execute("SELECT file, seconds FROM file_overhead"))
+        h.mapped_at = dict(con.execute("SELECT nodeid, commit_sha FROM mapped_at"))
+        h.stored.overhead, h.stored.mapped_at = dict(h.file_overhead), dict(h.mapped_at)
+        if maps:
+            _load_maps(con, h)
+        else:
+            h.partial.add("maps")
+        if runs:
+            h.runs = [json.loads(d) for (d,) in con.execute("SELECT data FROM runs ORDER BY id")]
+            h.stored_runs = len(h.runs)
+        else:
+            h.partial.add("runs")
+        count(tests=len(h.tests), runs=len(h.runs))
+        if maps:
+            count(files=len(h.coverage_map))
+        return h
+    finally:
+        con.close()
+
+@timed("load_runs")
+def load_runs(state_dir: str) -> List[Dict[str, Any]]:
+    """Just the run records, oldest first (the dashboard report needs nothing else)."""
+    if not os.path.exists(history_path(state_dir)):
+        return load_history(state_dir, maps=False).runs  # empty, or migrates a legacy history.json
+    con = _connect(state_dir)
+    try:
+        runs = [json.loads(d) for (d,) in con.execute("SELECT data FROM runs ORDER BY id")]
+    finally:
+        con.close()
+    count(runs=len(runs))
+    return runs
+
+def load_meta(state_dir: str) -> Dict[str, str]:
+    """Just the meta table (versions, counters); cheap enough to call on every select."""
+    if not os.path.exists(history_path(state_dir)):
+        return {}
+    con = _connect(state_dir, create=False)
+    try:
+        return dict(con.execute("SELECT key, value FROM meta"))
+    finally:
+        con.close()
 
-def load_history(state_dir: str) -> History:
-    path = os.path.join(state_dir, "history.json")
-    if not os.path.exists(path):
-        return History(tests={}, coverage_map={}, test_to_files={}, runs=[])
-    data = json.loads(open(path, "r", encoding="utf-8").read())
-    tests = {k: TestStats(**v) for k, v in data.get("tests", {}).items()}
-    return History(
-        tests=tests,
+@timed("load_maps")
+def load_maps(state_dir: str, h: History) -> History:
+    """Fill in the maps of a History loaded with maps=False."""
+    if "maps" not in h.partial:
+        return h
+    con = _connect(state_dir)
+    try:
+        _load_maps(con, h)
+    finally:
+        con.close()
+    h.partial.discard("maps")
+    return h
+
+def _load_maps(con: sqlite3.Connection, h: History) -> None:
+    """Interned ids and CSR arrays instead of two dicts of string lists; same Mapping interface."""
+    maps = CompactMaps.from_edges(con.execute("SELECT file, nodeid FROM edges ORDER BY file, nodeid"))
+    h.coverage_map = maps.coverage_map
+    h.test_to_files = maps.test_to_files
+    if h.stored is not None:
+        h.stored.edges = maps.test_to_files
+
+def _row(s: TestStats) -> tuple:
+    return (s.nodeid, s.runs, s.fails, s.flaky, s.avg_duration, s.ewma_duration, _pack(s.samples))
+
+def _changes(old: Mapping[str, Any], new: Mapping[str, Any]) -> Tuple[List[Tuple[str, Any]], List[Tuple[str]]]:
+    """(key, value) pairs that are new or differ, and (key,) of the keys that are gone."""
+    return [(k, v) for k, v in new.items() if k not in old or old[k] != v], [(k,) for k in old if k not in new]
+
+@timed("save_history")
+def save_history(state_dir: str, h: History, stats: bool = True) -> None:
+    """
+    `stats=False` appends runs (and maps, if loaded) without rewriting test stats.
+    A History loaded from history.db writes only what changed since: the stats rows and edges of the tests
+    that ran or were re-mapped; rows of tests and files it no longer holds are deleted. The map and stats
+    versions are bumped only when those parts changed.
+    """
+    stored = h.stored
+    con = _connect(state_dir)
+    try:
+        with con:
+            rows = None
+            if stats:
+                rows = {s.nodeid: _row(s) for s in h.tests.values()}
+                write, gone = _changes(stored.stats if stored else {}, rows)
+                con.executemany("DELETE FROM tests WHERE nodeid = ?", gone)
+                con.executemany(
+                    "INSERT OR REPLACE INTO tests (nodeid, runs, fails, flaky, avg_duration, ewma, samples) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (r for _, r in write),
+                )
+                overhead, dropped = _changes(stored.overhead if stored else {}, h.file_overhead)
+                con.executemany("DELETE FROM file_overhead WHERE file = ?", dropped)
+                con.executemany("INSERT OR REPLACE INTO file_overhead (file, seconds) VALUES (?, ?)", overhead)
+                count(tests=len(write) + len(gone))
+                if write or gone or overhead or dropped:
+                    h.stats_version += 1
+                    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats_version', ?)", (str(h.stats_version),))
+            edges = None
+            if "maps" not in h.partial:
+                edges = _edges_by_test(h)
+                if stored is not None and stored.edges is not None:
+                    added, removed = _edge_changes(stored.edges, edges)
+                    con.executemany("DELETE FROM edges WHERE file = ? AND nodeid = ?", removed)
+                else:
+                    added, removed = sorted((f, n) for n, files in edges.items() for f in files), []
+                    con.execute("DELETE FROM edges")
+                con.executemany("INSERT OR REPLACE INTO edges (file, nodeid) VALUES (?, ?)", added)
+                count(edges=len(added) + len(removed))
+                if added or removed:
+                    h.maps_version += 1
+                    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('maps_version', ?)", (str(h.maps_version),))
+            if stored is not None:
+                mapped, unmapped = _changes(stored.mapped_at, h.mapped_at)
+                con.executemany("DELETE FROM mapped_at WHERE nodeid = ?", unmapped)
+            else:
+                mapped = list(h.mapped_at.items())
+                if edges is not None:
+                    con.execute("DELETE FROM mapped_at")
+            con.executemany("INSERT OR REPLACE INTO mapped_at (nodeid, commit_sha) VALUES (?, ?)", mapped)
+            con.executemany("INSERT INTO runs (data) VALUES (?)", ((json.dumps(r),) for r in h.runs[h.stored_runs:]))
+            h.version += 1
+            con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(h.version),))
+            con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (str(int(time.time())),))
+        h.stored_runs = len(h.runs)
+        if stored is not None:
+            if rows is not None:
+                stored.stats, stored.overhead = rows, dict(h.file_overhead)
+            if edges is not None:
+                stored.edges = edges
+            stored.mapped_at = dict(h.mapped_at)
+    finally:
+        con.close()
+
+def remap_path(path: str, renames: Mapping[str, str]) -> str:
+    """`path` after the renames: an exact old path, or one it ends with (map keys may carry a longer prefix)."""
+    if path in renames:
+        return renames[path]
+    for old, new in renames.items():
+        if path.endswith("/" + old):
+            return path[:-len(old)] + new
+    return path
+
+def remap_nodeid(nodeid: str, renames: Mapping[str, str]) -> str:
+    """A nodeid under its test file's new path, if that file was renamed."""
+    path, sep, rest = nodeid.partition("::")
+    new = remap_path(path, renames)
+    return new + sep + rest if new != path else nodeid
+
+def _rekey(con: sqlite3.Connection, table: str, column: str, fn) -> int:
+    """Rewrite `column` through fn where it changes; deleted before re-inserting, so swapped names don't collide."""
+    changed = {k: n for (k,) in con.execute(f"SELECT DISTINCT {column} FROM {table}") for n in (fn(k),) if n != k}
+    if not changed:
+        return 0
+    cols = [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+    at = cols.index(column)
+    rows = []
+    for k in changed:
+        rows.extend(con.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE {column} = ?", (k,)))
+        con.execute(f"DELETE FROM {table} WHERE {column} = ?", (k,))
+    con.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                    (r[:at] + (changed[r[at]],) + r[at + 1:] for r in rows))
+    return len(changed)
+
+@timed("rename_paths")
+def rename_paths(state_dir: str, renames: Mapping[str, str], bump: bool = False) -> int:
+    """
+    Move renamed files to their new paths in place (no re-record): edges, and the nodeids of tests in
+    renamed test files (stats, mapped_at, result cache, fixture overhead). Returns the number of paths
+    and nodeids moved. Bumps the map and stats versions when something moved (or `bump`), so caches and
+    indexes keyed on them refresh.
+    """
+    if not renames or not os.path.exists(history_path(state_dir)):
+        return 0
+    path = lambda f: remap_path(f, renames)
+    nodeid = lambda n: remap_nodeid(n, renames)
+    con = _connect(state_dir)
+    try:
+        with con:
+            moved = _rekey(con, "edges", "file", path)
+            tests = _rekey(con, "edges", "nodeid", nodeid)
+            for table in ("tests", "mapped_at", "result_cache"):
+                tests = max(tests, _rekey(con, table, "nodeid", nodeid))
+            _rekey(con, "file_overhead", "file", path)
+            count(files=moved, tests=tests)
+            if moved or tests or bump:
+                meta = dict(con.execute("SELECT key, value FROM meta"))
+                for key in ("maps_version", "stats_version", "version"):
+                    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(int(meta.get(key, 0)) + 1)))
+        return moved + tests
+    finally:
+        con.close()
+
+def _edges_by_test(h: History) -> Dict[str, List[str]]:
+    """Both map directions as nodeid -> sorted files (what the edges table holds)."""
+    by_test: Dict[str, Set[str]] = {nodeid: set(files) for nodeid, files in h.test_to_files.items()}
+    for f, nodeids in h.coverage_map.items():
+        for nodeid in nodeids:
+            by_test.setdefault(nodeid, set()).add(f)
+    return {nodeid: sorted(files) for nodeid, files in by_test.items() if files}
+
+def _edge_changes(old: Mapping[str, List[str]], new: Mapping[str, List[str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """(file, nodeid) edges to insert and to delete, sorted in primary-key order; unchanged tests cost a list compare."""
+    added: List[Tuple[str, str]] = []
+    removed: List[Tuple[str, str]] = []
+    for nodeid, files in new.items():
+        before = old[nodeid] if nodeid in old else []
+        if before != files:
+            b = set(before)
+            added.extend((f, nodeid) for f in files if f not in b)
+            removed.extend((f, nodeid) for f in b.difference(files))
+    removed.extend((f, nodeid) for nodeid in old if nodeid not in new for f in old[nodeid])
+    return sorted(added), sorted(removed)
+
+def migrate_json_history(state_dir: str) -> None:
+    """One-shot import of state/history.json into history.db; the JSON file is kept as history.json.migrated."""
+    legacy = os.path.join(state_dir, LEGACY_HISTORY_JSON)
+    data = json.loads(open(legacy, "r", encoding="utf-8").read())
+    h = History(
+        tests={k: TestStats(**v) for k, v in data.get("tests", {}).items()},
         coverage_map=data.get("coverage_map", {}),
         test_to_files=data.get("test_to_files", {}),
         runs=data.get("runs", []),
+        mapped_at=data.get("mapped_at", {}),
     )
-
-def save_history(state_dir: str, h: History) -> None:
-    ensure_dir(state_dir)
-    data = {
-        "tests": {k: asdict(v) for k, v in h.tests.items()},
-        "coverage_map": h.coverage_map,
-        "test_to_files": h.test_to_files,
-        "runs": h.runs,
-        "updated_at": int(time.time())
-    }
-    open(os.path.join(state_dir, "history.json"), "w", encoding="utf-8").write(json.dumps(data, indent=2))
+    save_history(state_dir, h)
+    os.replace(legacy, legacy + ".migrated")
 
 def load_last_pytest_report(state_dir: str) -> Dict[str, Any]:
     p = os.path.join(state_dir, "last_pytest_report.json")
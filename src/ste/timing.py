@@ -0,0 +1,85 @@
+from __future__ import annotations
+import os, sys, time, functools
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Phases of the current CLI invocation, in start order. Spans nest; `depth` keeps the tree.
+_PHASES: List[Dict[str, Any]] = []
+_OPEN: List[Dict[str, Any]] = []
+_STATE = {"command": None, "started": time.perf_counter()}
+
+def reset(command: Optional[str] = None) -> None:
+    _PHASES.clear()
+    _OPEN.clear()
+    _STATE.update(command=command, started=time.perf_counter())
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """Peak resident set size of this process (or of its reaped children) in MB; None where unsupported."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB elsewhere
+
+@contextmanager
+def span(name: str, **counts) -> Iterator[Dict[str, Any]]:
+    """Time a phase. Item counts can be passed up front, set later with count(), or on the yielded record."""
+    rec: Dict[str, Any] = {"name": name, "depth": len(_OPEN), "counts": dict(counts)}
+    _PHASES.append(rec)
+    _OPEN.append(rec)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec["seconds"] = round(time.perf_counter() - t0, 4)
+        rec["peak_rss_mb"] = peak_rss_mb()
+        _OPEN.remove(rec)
+
+def timed(name: str) -> Callable:
+    """Decorator form of span()."""
+    def wrap(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def count(**counts) -> None:
+    """Attach item counts to the innermost open span."""
+    if _OPEN:
+        _OPEN[-1]["counts"].update(counts)
+
+def snapshot() -> Dict[str, Any]:
+    """Finished phases so far, for latest.json."""
+    return {
+        "command": _STATE["command"],
+        "total_seconds": round(time.perf_counter() - _STATE["started"], 4),
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": peak_rss_mb(children=True),
+        "phases": [{k: v for k, v in p.items() if k != "counts" or v} for p in _PHASES if "seconds" in p],
+    }
+
+def phase_seconds() -> Dict[str, float]:
+    """Finished top-level phases as name -> seconds, compact enough to keep on every run record."""
+    out: Dict[str, float] = {}
+    for p in _PHASES:
+        if "seconds" in p and p["depth"] == 0:
+            out[p["name"]] = round(out.get(p["name"], 0.0) + p["seconds"], 4)
+    return out
+
+@contextmanager
+def profiled(path: str, top: int = 25) -> Iterator[None]:
+    """cProfile the block, dump pstats to `path` and print the hottest functions by cumulative time."""
+    import cProfile, pstats
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        prof.dump_stats(path)
+        pstats.Stats(prof, stream=sys.stderr).sort_stats("cumulative").print_stats(top)
+        print(f"[profile] wrote {path} (python -m pstats {path})", file=sys.stderr)
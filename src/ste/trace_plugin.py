@@ -0,0 +1,117 @@
+# src/ste/trace_plugin.py
+"""
+pytest plugin behind `record-run --mapper trace`: records which files each test runs code in,
+without coverage.py, and writes the per-test file lists directly.
+
+Python 3.12+: a sys.monitoring PY_START callback that returns DISABLE, so every code object
+costs one callback per test; restart_events() re-arms them when the next test starts.
+Older Pythons: a sys.settrace call hook that returns no local tracer (no line events) and
+skips code objects already seen in the current test.
+
+Env:
+  STE_TRACE_SOURCE  only files under this path are kept (default: the current directory)
+  STE_TRACE_OUT     JSON file to write {"tracer": ..., "tests": {nodeid: [files]}} to
+"""
+from __future__ import annotations
+import os, sys, json, threading
+from typing import Dict, Optional, Set
+import pytest
+
+_MODULE_CTX = "|collect"
+_HITS: Dict[str, Set[str]] = {}   # context -> co_filename values
+_current: Set[str] = set()
+_seen: Set[object] = set()        # settrace fallback: code objects already recorded in this context
+_TOOL: Optional[int] = None
+
+if hasattr(sys, "monitoring"):
+    _mon = sys.monitoring
+
+    def _on_start(code, offset):
+        _current.add(code.co_filename)
+        return _mon.DISABLE
+
+def _on_call(frame, event, arg):
+    code = frame.f_code
+    if code not in _seen:
+        _seen.add(code)
+        _current.add(code.co_filename)
+    return None
+
+def tracer_name() -> str:
+    return "sys.monitoring" if hasattr(sys, "monitoring") else "settrace"
+
+def _start() -> None:
+    global _TOOL
+    if hasattr(sys, "monitoring"):
+        for tool in (_mon.COVERAGE_ID, _mon.PROFILER_ID, 3, 4):
+            if _mon.get_tool(tool) is None:
+                _TOOL = tool
+                break
+        else:
+            raise RuntimeError("no free sys.monitoring tool id for the STE tracer")
+        _mon.use_tool_id(_TOOL, "ste-trace")
+        _mon.register_callback(_TOOL, _mon.events.PY_START, _on_start)
+        _mon.set_events(_TOOL, _mon.events.PY_START)
+    else:
+        threading.settrace(_on_call)
+        sys.settrace(_on_call)
+
+def _stop() -> None:
+    if _TOOL is not None:
+        _mon.set_events(_TOOL, 0)
+        _mon.register_callback(_TOOL, _mon.events.PY_START, None)
+        _mon.free_tool_id(_TOOL)
+    else:
+        sys.settrace(None)
+        threading.settrace(None)
+
+def _switch(ctx: str) -> None:
+    """Start a fresh file set; every code object reports again on its next first call."""
+    global _current
+    _current = _HITS.setdefault(ctx, set())
+    if _TOOL is not None:
+        _mon.restart_events()
+    else:
+        _seen.clear()
+
+def pytest_sessionstart(session):
+    _switch("|session")
+    _start()
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_make_collect_report(collector):
+    # imports triggered while collecting a test module are attributed to its tests
+    if isinstance(collector, pytest.Module):
+        _switch(collector.nodeid + _MODULE_CTX)
+    yield
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    _switch(item.nodeid)
+    yield
+
+def pytest_sessionfinish(session, exitstatus):
+    _stop()
+    source = os.path.realpath(os.environ.get("STE_TRACE_SOURCE") or ".")
+    cwd = os.getcwd()
+    rel: Dict[str, Optional[str]] = {}
+
+    def keep(fname: str) -> Optional[str]:
+        if fname not in rel:
+            path = os.path.realpath(fname)
+            ok = os.path.isfile(path) and (path == source or path.startswith(source + os.sep))
+            rel[fname] = os.path.relpath(path, cwd).replace("\\", "/") if ok else None
+        return rel[fname]
+
+    files = {ctx: {r for r in map(keep, names) if r} for ctx, names in _HITS.items()}
+    tests = {}
+    for ctx, hit in files.items():
+        if ctx.endswith(_MODULE_CTX) or ctx == "|session":
+            continue
+        module = ctx.split("::", 1)[0]
+        tests[ctx] = sorted(hit | files.get(module + _MODULE_CTX, set()))
+
+    out = os.environ.get("STE_TRACE_OUT")
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"tracer": tracer_name(), "tests": tests}, f)
@@ -0,0 +1,58 @@
+import random
+
+import numpy
+import pytest
+
+from src.ste import agent
+from src.ste.storage import History, TestStats as Stats
+
+def _history(rng, n):
+    tests = {}
+    for i in range(n):
+        runs = rng.randint(0, 20)
+        fails = rng.randint(0, runs)
+        tests[f"tests/test_{i % 7}.py::t{i}"] = Stats(
+            nodeid=f"tests/test_{i % 7}.py::t{i}", runs=runs, fails=fails, flaky=int(0 < fails < runs),
+            avg_duration=rng.choice([0.0, 0.1, 0.5, round(rng.uniform(0.01, 3), 2)]))
+    files = [f"app/m{j}.py" for j in range(20)]
+    test_to_files = {t: rng.sample(files, rng.randint(0, 3)) for t in tests}
+    return History(tests=tests, coverage_map={}, test_to_files=test_to_files, runs=[]), files
+
+def _rank(monkeypatch, np, h, changed, top_excluded=5, **kw):
+    monkeypatch.setattr(agent, "np", np)
+    selected, explanations = agent.rank_with_explanations(h, changed, **kw)
+    return selected, list(explanations.materialized(top_excluded).items()), dict(explanations)
+
+CASES = [
+    dict(budget_tests=10, budget_seconds=0),
+    dict(budget_tests=0, budget_seconds=5),
+    dict(budget_tests=10, budget_seconds=5),
+    dict(budget_tests=0, budget_seconds=0),
+    dict(budget_tests=10, budget_seconds=0, top_excluded=0),
+    dict(budget_tests=10, budget_seconds=5, strategy="ratio"),
+    dict(budget_tests=0, budget_seconds=5, strategy="knapsack"),
+]
+
+@pytest.mark.parametrize("case", CASES)
+def test_numpy_and_pure_python_rankings_agree(monkeypatch, case):
+    rng = random.Random(7)
+    for _ in range(20):
+        h, files = _history(rng, rng.randint(1, 120))
+        changed = rng.sample(files, rng.randint(0, 3))
+        fast = _rank(monkeypatch, numpy, h, changed, **case)
+        slow = _rank(monkeypatch, None, h, changed, **case)
+        assert fast == slow
+
+def test_top_k_matches_the_full_order_with_ties(monkeypatch):
+    rng = random.Random(3)
+    for np in (numpy, None):
+        monkeypatch.setattr(agent, "np", np)
+        for _ in range(200):
+            n = rng.randint(1, 60)
+            aff = [rng.random() < 0.3 for _ in range(n)]
+            scores = [rng.choice([0.0, 0.5, 1.0, 1.5]) for _ in range(n)]  # many ties
+            if np is not None:
+                aff, scores = numpy.array(aff), numpy.array(scores)
+            full = agent._rank_order(aff, scores)
+            k = rng.randint(1, n)
+            assert agent._rank_order(aff, scores, k) == full[:k]
@@ -0,0 +1,9 @@
+from src.ste.coverage_map import _extract_nodeid
+
+def test_extract_nodeid_strips_only_the_phase_suffix():
+    assert _extract_nodeid("tests/t.py::test_a|run") == "tests/t.py::test_a"
+    assert _extract_nodeid("tests/t.py::test_a|teardown") == "tests/t.py::test_a"
+    assert _extract_nodeid("tests/t.py::test_a[a|b]|run") == "tests/t.py::test_a[a|b]"
+    assert _extract_nodeid("tests/t.py::test_a[a|b]") == "tests/t.py::test_a[a|b]"
+    assert _extract_nodeid("test_function: tests/t.py::test_a[x|y]|setup") == "tests/t.py::test_a[x|y]"
+    assert _extract_nodeid("") is None
@@ -0,0 +1,21 @@
+from src.ste.durations import split_overhead
+
+def _t(duration, setup, teardown):
+    return {"outcome": "passed", "duration": duration, "setup": setup, "teardown": teardown}
+
+def test_module_fixture_counts_once_per_file_not_per_test():
+    # module fixture: 2s on the first setup, 1s on the last teardown; every test pays 0.1s + 0.05s
+    tests = {"m.py::a": _t(1.0, 2.1, 0.05), "m.py::b": _t(1.0, 0.1, 0.05), "m.py::c": _t(1.0, 0.1, 1.05)}
+    samples, overhead = split_overhead(tests)
+    assert round(overhead["m.py"], 6) == 3.0
+    assert {t: round(s, 6) for t, s in samples.items()} == {"m.py::a": 1.15, "m.py::b": 1.15, "m.py::c": 1.15}
+    # more tests of the same shape do not grow the overhead
+    more = {**tests, **{f"m.py::x{i}": _t(1.0, 0.1, 0.05) for i in range(20)}}
+    assert round(split_overhead(more)[1]["m.py"], 6) == 3.0
+
+def test_lone_test_uses_the_known_file_overhead():
+    tests = {"m.py::a": _t(1.0, 2.1, 1.05)}
+    samples, overhead = split_overhead(tests, {"m.py": 3.0})
+    assert round(samples["m.py::a"], 6) == 1.15 and overhead == {}
+    samples, overhead = split_overhead(tests)
+    assert round(samples["m.py::a"], 6) == 4.15 and overhead == {"m.py": 0.0}
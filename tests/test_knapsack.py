@@ -0,0 +1,79 @@
+import itertools
+import random
+
+from src.ste import knapsack as ks
+from src.ste.knapsack import knapsack, ratio_fill
+
+def _instance(rng, n):
+    scores = [round(rng.uniform(0, 2), 3) for _ in range(n)]
+    durs = [round(rng.uniform(0.05, 3), 2) for _ in range(n)]
+    return scores, durs
+
+def _value(scores, chosen):
+    return sum(scores[i] for i in chosen)
+
+def _feasible(chosen, durs, budget_tests, budget_seconds):
+    return (not budget_tests or len(chosen) <= budget_tests) and sum(durs[i] for i in chosen) <= budget_seconds + 1e-9
+
+def _brute_force(scores, durs, budget_tests, budget_seconds):
+    best = 0.0
+    for r in range(len(scores) + 1):
+        for combo in itertools.combinations(range(len(scores)), r):
+            if _feasible(combo, durs, budget_tests, budget_seconds):
+                best = max(best, _value(scores, combo))
+    return best
+
+def test_matches_brute_force_on_small_instances():
+    rng = random.Random(42)
+    for _ in range(150):
+        n = rng.randint(1, 11)
+        scores, durs = _instance(rng, n)
+        budget_tests, budget_seconds = rng.choice([0, 1, 3, 5]), round(rng.uniform(0.5, 8), 2)
+        chosen = knapsack(scores, durs, budget_tests, budget_seconds)
+        assert _feasible(chosen, durs, budget_tests, budget_seconds)
+        assert abs(_value(scores, chosen) - _brute_force(scores, durs, budget_tests, budget_seconds)) < 1e-9
+
+def test_core_width_cutoff_fixes_the_prefix_and_never_loses_to_ratio_fill(monkeypatch):
+    monkeypatch.setattr(ks, "CORE_WIDTH", 2)
+    rng = random.Random(5)
+    for _ in range(100):
+        scores, durs = _instance(rng, 40)
+        budget_tests, budget_seconds = rng.choice([0, 15]), round(rng.uniform(5, 30), 2)
+        chosen = knapsack(scores, durs, budget_tests, budget_seconds)
+        order = ks._ratio_order(scores, durs)
+        elapsed, brk = 0.0, len(order)
+        for pos, i in enumerate(order):
+            if (budget_tests and pos >= budget_tests) or elapsed + durs[i] > budget_seconds:
+                brk = pos
+                break
+            elapsed += durs[i]
+        assert set(order[:max(0, brk - 2)]) <= chosen            # well before the break item: fixed in
+        assert _feasible(chosen, durs, budget_tests, budget_seconds)
+        assert _value(scores, chosen) >= _value(scores, ratio_fill(scores, durs, budget_tests, budget_seconds)) - 1e-9
+
+class _Clock:
+    """perf_counter that jumps a minute per call: the first deadline check finds the limit passed."""
+    def __init__(self):
+        self.calls = 0
+
+    def perf_counter(self):
+        self.calls += 1
+        return self.calls * 60.0
+
+def test_time_limit_keeps_the_best_solution_found(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(ks, "time", clock)
+    rng = random.Random(9)
+    # correlated scores and durations: many near-equal ratios, so branch-and-bound needs far more than 1024 nodes
+    durs = [round(rng.uniform(1, 2), 3) for _ in range(120)]
+    scores = [d + round(rng.uniform(0, 0.01), 4) for d in durs]
+    chosen = knapsack(scores, durs, 0, 60.0, time_limit=1.0)
+    assert clock.calls >= 2  # the deadline was checked, i.e. the search was cut off
+    assert _feasible(chosen, durs, 0, 60.0)
+    assert _value(scores, chosen) >= _value(scores, ratio_fill(scores, durs, 0, 60.0)) - 1e-9
+
+def test_no_time_budget_takes_the_top_scores():
+    scores, durs = [0.5, 2.0, 1.0, 2.0, 0.0], [9, 9, 9, 9, 9]
+    assert knapsack(scores, durs, 2, 0) == {1, 3}
+    assert knapsack(scores, durs, 3, 0) == {1, 3, 2}
+    assert knapsack(scores, durs, 0, 0) == {0, 1, 2, 3, 4}
@@ -0,0 +1,102 @@
+import os
+import random
+from typing import List, Set
+
+from benchmarks import synthetic
+from src.ste.storage import History, load_history, save_history
+from src.ste.path_index import build_path_index
+
+def _baseline_affected_tests(h: History, changed_files: List[str]) -> Set[str]:
+    """agent._affected_tests as of the baseline commit, verbatim: the behaviour PathIndex must preserve."""
+    def norm(p: str) -> str:
+        return p.replace("\\", "/")
+
+    affected: Set[str] = set()
+
+    changed_norm = [norm(f) for f in changed_files]
+    changed_basenames = {os.path.basename(f) for f in changed_norm}
+
+    cov_keys_norm = {norm(k): k for k in h.coverage_map.keys()}
+    for f in changed_norm:
+        if f in cov_keys_norm:
+            affected.update(h.coverage_map[cov_keys_norm[f]])
+        for k_norm, k_raw in cov_keys_norm.items():
+            if k_norm == f or k_norm.endswith("/" + f) or os.path.basename(k_norm) in changed_basenames:
+                affected.update(h.coverage_map[k_raw])
+
+    for nodeid, files in h.test_to_files.items():
+        for file_path in files:
+            kn = norm(file_path)
+            if kn in changed_norm or any(kn.endswith("/" + c) for c in changed_norm) or os.path.basename(kn) in changed_basenames:
+                affected.add(nodeid)
+                break
+
+    return affected
+
+def _history(coverage_map, test_to_files=None):
+    return History(tests={}, coverage_map=coverage_map, test_to_files=test_to_files or {}, runs=[])
+
+H = _history({"pkg/a/utils.py": ["t_a"], "pkg/b/utils.py": ["t_b"], "pkg/core.py": ["t_core"], "core.py": ["t_root"]},
+             {"t_extra": ["pkg/b/utils.py"]})
+
+def _check(changed, expected):
+    assert build_path_index(H).affected(changed) == expected
+    assert _baseline_affected_tests(H, changed) == expected
+
+def test_exact_and_suffix_matches_include_same_basename_files():
+    _check(["pkg/a/utils.py"], {"t_a", "t_b", "t_extra"})
+    _check(["a/utils.py"], {"t_a", "t_b", "t_extra"})
+    _check(["pkg/core.py"], {"t_core", "t_root"})
+    _check(["core.py"], {"t_core", "t_root"})
+
+def test_basename_match_without_a_mapped_path():
+    _check(["other/utils.py"], {"t_a", "t_b", "t_extra"})
+    _check(["repo/pkg/core.py"], {"t_core", "t_root"})
+    _check(["new.py"], set())
+
+DIRS = ["", "pkg/", "pkg/a/", "pkg/b/", "src/pkg/a/", "lib\\"]
+NAMES = ["utils.py", "core.py", "models.py", "a.py", "test_x.py"]
+
+def _random_path(rng):
+    return rng.choice(DIRS) + rng.choice(NAMES)
+
+def _random_history(rng):
+    tests = [f"tests/test_{i}.py::t" for i in range(rng.randint(1, 30))]
+    coverage_map = {_random_path(rng): rng.sample(tests, rng.randint(0, min(5, len(tests))))
+                    for _ in range(rng.randint(0, 15))}
+    test_to_files = {t: [_random_path(rng) for _ in range(rng.randint(0, 3))] for t in rng.sample(tests, len(tests) // 2)}
+    return _history(coverage_map, test_to_files)
+
+def _random_diff(rng):
+    return [rng.choice(["repo/", "x/", ""]) + _random_path(rng) for _ in range(rng.randint(0, 4))]
+
+def test_index_matches_baseline_on_random_maps_and_diffs():
+    rng = random.Random(1234)
+    for _ in range(300):
+        h = _random_history(rng)
+        index = build_path_index(h)
+        for _ in range(5):
+            changed = _random_diff(rng)
+            assert index.affected(changed) == _baseline_affected_tests(h, changed), (h, changed)
+
+def test_index_built_from_stored_maps_matches_baseline(tmp_path):
+    rng = random.Random(99)
+    for n in range(20):
+        state = str(tmp_path / str(n))
+        h = _random_history(rng)
+        h.coverage_map = {k.replace("\\", "/"): v for k, v in h.coverage_map.items()}  # history.db stores normalized paths
+        h.test_to_files = {t: [p.replace("\\", "/") for p in fs] for t, fs in h.test_to_files.items()}
+        save_history(state, h)
+        stored = load_history(state)
+        index = build_path_index(stored)
+        for _ in range(5):
+            changed = _random_diff(rng)
+            assert index.affected(changed) == _baseline_affected_tests(h, changed), changed
+
+def test_index_matches_baseline_on_a_synthetic_map(tmp_path):
+    shape = synthetic.Shape(tests=600, files=300, files_per_test=5)
+    h = synthetic.history(shape, str(tmp_path))
+    index = build_path_index(h)
+    files = synthetic.source_files(shape, str(tmp_path))
+    for changed in (synthetic.diff(shape), files[:3], [f"moved/{files[0].rsplit('/', 1)[-1]}"], ["missing.py"]):
+        assert index.affected(changed) == _baseline_affected_tests(h, changed)
@@ -0,0 +1,41 @@
+import os
+
+from src.ste.probe import probe_maps
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+def _project(tmp_path, monkeypatch):
+    _write(tmp_path / "proj" / "conftest.py", "from proj.app import boot\n")
+    _write(tmp_path / "proj" / "app" / "boot.py", "READY = True\n")
+    _write(tmp_path / "proj" / "app" / "shared.py", "def one():\n    return 1\n")
+    _write(tmp_path / "proj" / "app" / "other.py", "def two():\n    return 2\n")
+    _write(tmp_path / "proj" / "tests" / "test_a.py",
+           "from proj.app.shared import one\n\ndef test_a():\n    assert one() == 1\n\n"
+           "def test_a2():\n    open('ran_a2', 'w').close()\n")
+    _write(tmp_path / "proj" / "tests" / "test_b.py",
+           "from proj.app import shared, other\n\ndef test_b():\n    assert other.two() == 2\n")
+    for d in ("proj", "proj/app", "proj/tests"):
+        _write(tmp_path / d / "__init__.py", "")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+    monkeypatch.setenv("STATE_DIR", str(tmp_path / "state"))
+
+def test_conftest_and_shared_imports_reach_every_test(tmp_path, monkeypatch):
+    _project(tmp_path, monkeypatch)
+    _, test_to_files = probe_maps("proj", str(tmp_path / "state"), str(tmp_path), jobs=1)
+    assert set(test_to_files) == {"proj/tests/test_a.py::test_a", "proj/tests/test_a.py::test_a2",
+                                  "proj/tests/test_b.py::test_b"}
+    for nodeid, files in test_to_files.items():
+        assert {"proj/conftest.py", "proj/app/boot.py", "proj/app/shared.py"} <= set(files), nodeid
+    assert "proj/tests/test_a.py" not in test_to_files["proj/tests/test_b.py::test_b"]
+
+def test_targets_run_only_the_named_tests(tmp_path, monkeypatch):
+    _project(tmp_path, monkeypatch)
+    _, test_to_files = probe_maps("proj", str(tmp_path / "state"), str(tmp_path), jobs=1,
+                                  targets=["proj/tests/test_a.py::test_a"])
+    assert list(test_to_files) == ["proj/tests/test_a.py::test_a"]
+    assert not (tmp_path / "ran_a2").exists()  # deselected in the worker, not run and filtered afterwards
@@ -0,0 +1,12 @@
+import pytest
+from src.ste.config import settings
+from src.ste.replay import parse_sweep
+
+def test_sweep_is_the_product_of_its_axes():
+    configs = parse_sweep(["strategy=greedy,ratio", "budget_tests=10,25"], settings)
+    assert sorted((c["strategy"], c["budget_tests"]) for c in configs) == [("greedy", 10), ("greedy", 25), ("ratio", 10), ("ratio", 25)]
+
+@pytest.mark.parametrize("spec", ["strategy=gredy", "duration_estimate=p95", "budget_tests=many", "color=red"])
+def test_bad_sweep_values_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_sweep([spec], settings)
@@ -0,0 +1,24 @@
+import json
+from typer.testing import CliRunner
+from src.cli import ste_cli
+from src.ste.config import settings
+
+def _empty_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "state_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "project_path", "examples/payments")
+    (tmp_path / "selection.json").write_text(json.dumps({"selected": []}), encoding="utf-8")
+
+def test_empty_selection_shards_the_full_suite(tmp_path, monkeypatch):
+    _empty_selection(tmp_path, monkeypatch)
+    ran = []
+    monkeypatch.setattr(ste_cli, "run_selected_tests", lambda project, tests, *a, **k: ran.extend(tests) or 0)
+    for index in (0, 1):
+        result = CliRunner().invoke(ste_cli.app, ["run-selected", "--shards", "2", "--shard-index", str(index)])
+        assert result.exit_code == 0, result.output
+    assert len(ran) == 7 and all("::" in t for t in ran)
+
+def test_empty_selection_without_tests_refuses(tmp_path, monkeypatch):
+    _empty_selection(tmp_path, monkeypatch)
+    monkeypatch.setattr(ste_cli, "collect_nodeids", lambda project: [])
+    result = CliRunner().invoke(ste_cli.app, ["run-selected", "--workers", "2"])
+    assert result.exit_code == 2
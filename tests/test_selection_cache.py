@@ -0,0 +1,35 @@
+from dataclasses import replace
+
+from src.ste.config import Settings
+from src.ste.selection_cache import cache_get, cache_put, cache_stats, selection_key
+from src.ste.storage import History, save_history
+
+META = {"maps_version": "3", "stats_version": "5"}
+
+def _key(cfg, **kw):
+    return selection_key(kw.get("meta", META), ["src/app.py"], None, cfg, "file", kw.get("renames"))
+
+def test_key_covers_every_selection_input():
+    cfg = Settings()
+    base = _key(cfg)
+    assert _key(replace(cfg)) == base
+    assert _key(replace(cfg, project_path="examples/other")) != base
+    assert _key(replace(cfg, explain_top_excluded=cfg.explain_top_excluded + 1)) != base
+    assert _key(replace(cfg, weight_runtime=cfg.weight_runtime + 1)) != base
+    assert _key(cfg, renames={"old.py": "src/app.py"}) != base
+    assert _key(cfg, meta={**META, "maps_version": "4"}) != base
+
+def test_cache_leaves_a_fresh_state_dir_alone(tmp_path):
+    state = str(tmp_path / "state")
+    assert cache_get(state, "k") is None
+    cache_put(state, "k", {"selected": []})
+    assert cache_stats(state) == {"hits": 0, "misses": 0, "entries": 0}
+    assert not (tmp_path / "state").exists()
+
+def test_cache_round_trip_once_history_exists(tmp_path):
+    state = str(tmp_path)
+    save_history(state, History(tests={}, coverage_map={}, test_to_files={}, runs=[]))
+    assert cache_get(state, "k") is None
+    cache_put(state, "k", {"selected": ["t"]})
+    assert cache_get(state, "k") == {"selected": ["t"]}
+    assert cache_stats(state) == {"hits": 1, "misses": 1, "entries": 1}
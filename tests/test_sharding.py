@@ -0,0 +1,15 @@
+import json
+from src.ste.sharding import apfd, fragment_name, merge_reports
+
+def _fragment(state, index, started, tests):
+    rpt = {"shard_index": index, "started_at": started, "finished_at": started + 10, "order": "priority",
+           "tests": {t: {"outcome": o, "duration": d} for t, o, d in tests}}
+    (state / fragment_name(index)).write_text(json.dumps(rpt), encoding="utf-8")
+
+def test_merge_orders_shards_by_index_and_computes_apfd(tmp_path):
+    _fragment(tmp_path, 10, 0.0, [("t::a", "passed", 1.0), ("t::b", "failed", 1.0)])   # b finishes at 2s
+    _fragment(tmp_path, 2, 0.0, [("t::c", "failed", 0.5), ("t::d", "passed", 3.0)])    # c finishes at 0.5s
+    merged, summary = merge_reports(str(tmp_path))
+    assert [s["index"] for s in summary] == [2, 10]
+    # finish order c(fail), a, b(fail), d
+    assert merged["apfd"] == apfd(["failed", "passed", "failed", "passed"]) == 0.625
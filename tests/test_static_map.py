@@ -0,0 +1,23 @@
+from src.ste.static_map import union_maps
+from src.ste.coverage_map import merge_maps
+
+PAYMENTS = "examples/payments/tests/test_payments.py::test_get_payment_ok"
+UTILS = "examples/payments/tests/test_utils.py::test_supported_currency_true"
+
+def test_incremental_union_keeps_edges_of_tests_that_did_not_run(tmp_path):
+    # dyn.py is reached without an import, so only the measurement knows about it
+    old_t2f = {PAYMENTS: ["examples/payments/app/dyn.py", "examples/payments/app/payments.py"],
+               UTILS: ["examples/payments/app/utils.py"]}
+    old_f2t = {}
+    for t, files in old_t2f.items():
+        for f in files:
+            old_f2t.setdefault(f, []).append(t)
+    measured = {UTILS: ["examples/payments/app/utils.py"]}
+
+    _, t2f = union_maps({"examples/payments/app/utils.py": [UTILS]}, measured, "examples/payments",
+                        str(tmp_path), ".", known_tests=old_t2f)
+    assert PAYMENTS not in t2f
+    assert "examples/payments/tests/test_utils.py" in t2f[UTILS]
+
+    _, merged = merge_maps(old_f2t, old_t2f, t2f, {UTILS})
+    assert merged[PAYMENTS] == old_t2f[PAYMENTS]
@@ -0,0 +1,65 @@
+import re
+
+from src.ste import storage
+from src.ste.storage import History, load_history, save_history
+
+def _seed(state):
+    h = History(tests={f"t{i}": storage.TestStats(nodeid=f"t{i}", runs=1) for i in range(50)},
+                coverage_map={}, test_to_files={f"t{i}": [f"m{i % 5}.py", "common.py"] for i in range(50)}, runs=[],
+                mapped_at={f"t{i}": "c0" for i in range(50)}, file_overhead={"t": 0.5})
+    save_history(state, h)
+
+def _writes(monkeypatch):
+    statements = []
+    connect = storage._connect
+    def traced(*args, **kwargs):
+        con = connect(*args, **kwargs)
+        con.set_trace_callback(lambda sql: statements.append(sql) if sql.lstrip().startswith(("INSERT", "DELETE")) else None)
+        return con
+    monkeypatch.setattr(storage, "_connect", traced)
+    return statements
+
+def _meta(state):
+    return {k: v for k, v in storage.load_meta(state).items() if k.endswith("version")}
+
+def test_unchanged_save_writes_no_rows_and_keeps_versions(tmp_path, monkeypatch):
+    state = str(tmp_path)
+    _seed(state)
+    before = _meta(state)
+    h = load_history(state)
+    writes = _writes(monkeypatch)
+    save_history(state, h)
+    assert [s for s in writes if "meta" not in s] == []
+    after = _meta(state)
+    assert after["maps_version"] == before["maps_version"] and after["stats_version"] == before["stats_version"]
+
+def test_incremental_save_writes_only_the_tests_that_changed(tmp_path, monkeypatch):
+    state = str(tmp_path)
+    _seed(state)
+    h = load_history(state)
+    h.tests["t3"].runs += 1
+    merged = dict(h.test_to_files)
+    merged["t3"] = ["m3.py", "new.py"]
+    h.test_to_files, h.coverage_map = merged, {}
+    h.mapped_at["t3"] = "c1"
+    writes = _writes(monkeypatch)
+    save_history(state, h)
+    rows = [re.match(r"(INSERT|DELETE)\b.*?(?:INTO|FROM) (\w+)", s).groups() for s in writes if "meta" not in s]
+    assert sorted(" ".join(r) for r in rows) == [
+        "DELETE edges", "INSERT edges", "INSERT mapped_at", "INSERT tests"]
+    stored = load_history(state)
+    assert stored.test_to_files["t3"] == ["m3.py", "new.py"] and stored.tests["t3"].runs == 2
+    assert stored.test_to_files["t4"] == ["common.py", "m4.py"] and stored.mapped_at["t3"] == "c1"
+
+def test_rows_of_removed_tests_are_deleted(tmp_path):
+    state = str(tmp_path)
+    _seed(state)
+    h = load_history(state)
+    del h.tests["t7"], h.mapped_at["t7"]
+    h.test_to_files = {t: fs for t, fs in h.test_to_files.items() if t != "t7"}
+    h.coverage_map = {}
+    h.file_overhead = {}
+    save_history(state, h)
+    stored = load_history(state)
+    assert "t7" not in stored.tests and "t7" not in stored.test_to_files and "t7" not in stored.mapped_at
+    assert stored.file_overhead == {} and len(stored.tests) == 49
@@ -2,89 +2,224 @@
 async function loadJSON(url) {
   const r = await fetch(url, { cache: "no-store" });
   if (!r.ok) throw new Error(`HTTP ${r.status}`);
+  if (url.endsWith(".gz")) {  // REPORT_GZIP=1 pages are plain .gz files, not Content-Encoding
+    const text = await new Response(r.body.pipeThrough(new DecompressionStream("gzip"))).text();
+    return JSON.parse(text);
+  }
   return await r.json();
 }
 
 function fmtPct(x) { return (x*100).toFixed(1) + "%"; }
 
+// Report pages (see src/ste/report.py) are fetched once and kept while the summary is current.
+let REPORT = null;
+const PAGES = new Map();
+
+function loadPage(name, index) {
+  const url = `./data/${REPORT.pages}/${name}-${String(index).padStart(5, "0")}${REPORT.ext}`;
+  if (!PAGES.has(url)) PAGES.set(url, loadJSON(url));
+  return PAGES.get(url);
+}
+
+// A format-1 latest.json (everything inline, e.g. the committed sample) is turned into in-memory pages.
+function fromLegacy(data) {
+  const size = 1000;
+  const reasons = [];
+  const rows = Object.entries(data.explanations || {}).sort((a, b) => (b[1].score||0) - (a[1].score||0)).map(([nodeid, e]) => {
+    if (!reasons.includes(e.reason || "")) reasons.push(e.reason || "");
+    return [nodeid, e.affected ? 1 : 0, e.fail_rate, e.flaky_rate, e.runtime_norm, e.score, e.included ? 1 : 0, reasons.indexOf(e.reason || "")];
+  });
+  const runs = ((data.history || {}).runs || []).slice().reverse();
+  const views = { all: rows, affected: rows.filter(r => r[1]), excluded: rows.filter(r => !r[6]) };
+  reasons.forEach((_, i) => { views[`reason-${i}`] = rows.filter(r => r[7] === i); });
+  const report = { pages: "legacy", ext: ".json", page_size: size, timings: data.timings,
+    selection: { ...(data.selection || {}), selected_count: ((data.selection || {}).selected || []).length },
+    explanations: { total: rows.length, reasons, views: {} },
+    history: { runs: runs.length, pages: Math.ceil(runs.length / size), recent: runs.slice(0, 50) } };
+  for (const [name, items] of [...Object.entries(views), ["runs", runs]]) {
+    if (name !== "runs") report.explanations.views[name] = { count: items.length, pages: Math.ceil(items.length / size) };
+    for (let p = 0; p * size < items.length; p++) {
+      PAGES.set(`./data/legacy/${name}-${String(p).padStart(5, "0")}.json`, Promise.resolve(items.slice(p * size, (p + 1) * size)));
+    }
+  }
+  return report;
+}
+
 function renderMeta(selection) {
   const div = document.getElementById("meta");
   const sel = selection || {};
   const changed = (sel.changed_files||[]).map(f => `<code>${f}</code>`).join(", ") || "<em>(none)</em>";
   div.innerHTML = `
     <p><strong>Base:</strong> ${sel.base || "-"} &nbsp; <strong>Head:</strong> ${sel.head || "-"}</p>
-    <p><strong>Budget:</strong> ${sel.budget_tests||"-"} tests, ${sel.budget_time_seconds||"-"} seconds</p>
+    <p><strong>Budget:</strong> ${sel.budget_tests||"-"} tests, ${sel.budget_time_seconds||"-"} seconds
+      ${sel.planned_seconds != null ? `&nbsp; <strong>Planned:</strong> ${sel.planned_seconds.toFixed(1)}s (${sel.duration_estimate||"mean"})` : ""}</p>
     <p><strong>Changed files:</strong> ${changed}</p>
-    <p><strong>Selected ${ (sel.selected||[]).length } test(s)</strong></p>
+    <p><strong>Selected ${ sel.selected_count || 0 } test(s)</strong>${sel.ranked != null ? ` of ${sel.ranked} ranked` : ""}${sel.cached_pass_count ? `, ${sel.cached_pass_count} with a cached pass` : ""}</p>
+    ${sel.cache ? `<p><strong>Selection cache:</strong> ${sel.cache.enabled ? (sel.cache.hit ? "hit" : "miss") : "disabled"}
+      (${sel.cache.hits} hits / ${sel.cache.misses} misses, ${sel.cache.entries} entries)</p>` : ""}
   `;
 }
 
-function renderExplanations(explanations, selection) {
+const ROW_HEIGHT = 34;   // px; must match .vt-row in styles.css
+const OVERSCAN = 20;     // rows rendered above/below the viewport
+
+function renderExplanations(expl) {
   const container = document.getElementById("expl");
-  const entries = Object.entries(explanations||{});
-  if (!entries.length) {
+  if (!expl.total) {
     container.textContent = "No explanations yet — run a selection.";
     return;
   }
-  entries.sort((a,b) => (b[1].score||0) - (a[1].score||0));
-  const rows = entries.map(([nodeid, e]) => `
+  const views = expl.views || {};
+  const options = [["all", "All tests"], ["affected", "Affected only"], ["excluded", "Excluded only"],
+    ...expl.reasons.map((r, i) => [`reason-${i}`, `Reason: ${r || "(none)"}`])]
+    .filter(([v]) => views[v])
+    .map(([v, label]) => `<option value="${v}">${label} (${views[v].count})</option>`).join("");
+  container.innerHTML = `
+    <p><select id="expl-view">${options}</select></p>
+    <div class="vt-row vt-head">
+      <div>Test</div><div>Affected?</div><div>Fail rate</div><div>Flaky rate</div>
+      <div>Runtime norm</div><div>Score</div><div>Decision</div><div>Reason</div>
+    </div>
+    <div class="vt-viewport" id="expl-viewport"><div class="vt-spacer" id="expl-spacer"></div></div>
+  `;
+  const viewport = document.getElementById("expl-viewport");
+  const spacer = document.getElementById("expl-spacer");
+  let view = "all";
+
+  const row = (r, top) => r ? `
+    <div class="vt-row" style="top:${top}px">
+      <div><code>${r[0]}</code></div>
+      <div>${r[1] ? '<span class="badge yes">affected</span>' : '<span class="badge no">not affected</span>'}</div>
+      <div>${fmtPct(r[2]||0)}</div>
+      <div>${fmtPct(r[3]||0)}</div>
+      <div>${(r[4]||0).toFixed(2)}</div>
+      <div>${(r[5]||0).toFixed(3)}</div>
+      <div>${r[6] ? '<span class="badge yes">included</span>' : '<span class="badge no">excluded</span>'}</div>
+      <div title="${expl.reasons[r[7]]}">${expl.reasons[r[7]]}</div>
+    </div>` : `<div class="vt-row" style="top:${top}px"><div><em>loading…</em></div></div>`;
+
+  let drawn = 0;  // latest draw wins; older ones still waiting on pages are dropped
+  async function draw() {
+    const seq = ++drawn;
+    const count = views[view].count;
+    const first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(count, Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+    const size = REPORT.page_size;
+    const wanted = [];
+    for (let p = Math.floor(first / size); p * size < last; p++) wanted.push(p);
+    const paint = pages => {
+      let html = "";
+      for (let i = first; i < last; i++) {
+        const page = pages[Math.floor(i / size) - wanted[0]];
+        html += row(page && page[i % size], i * ROW_HEIGHT);
+      }
+      spacer.innerHTML = html;
+    };
+    paint([]);
+    const pages = await Promise.all(wanted.map(p => loadPage(view, p)));
+    if (seq === drawn) paint(pages);
+  }
+  const reset = () => {
+    view = document.getElementById("expl-view").value;
+    spacer.style.height = `${views[view].count * ROW_HEIGHT}px`;
+    viewport.scrollTop = 0;
+    draw();
+  };
+  let pending = false;
+  viewport.addEventListener("scroll", () => {
+    if (pending) return;
+    pending = true;
+    requestAnimationFrame(() => { pending = false; draw(); });
+  });
+  document.getElementById("expl-view").addEventListener("change", reset);
+  reset();
+}
+
+function sparkline(values, w = 160, h = 28) {
+  if (values.length < 2) return "";
+  const max = Math.max(...values) || 1;
+  const pts = values.map((v, i) => `${(i / (values.length - 1) * w).toFixed(1)},${(h - 2 - v / max * (h - 4)).toFixed(1)}`).join(" ");
+  return `<svg class="spark" width="${w}" height="${h}"><polyline points="${pts}"/></svg>`;
+}
+
+function renderTimings(timings, hist) {
+  const container = document.getElementById("timings");
+  const t = timings || {};
+  const phases = t.phases || [];
+  const top = phases.filter(p => p.depth === 0).reduce((s, p) => s + p.seconds, 0) || 1;
+  const counts = c => Object.entries(c || {}).map(([k, v]) => `${k}=${v}`).join(", ");
+  const rows = phases.map(p => `
     <tr>
-      <td><code>${nodeid}</code></td>
-      <td>${e.affected ? '<span class="badge yes">affected</span>' : '<span class="badge no">not affected</span>'}</td>
-      <td>${fmtPct(e.fail_rate||0)}</td>
-      <td>${fmtPct(e.flaky_rate||0)}</td>
-      <td>${(e.runtime_norm||0).toFixed(2)}</td>
-      <td>${(e.score||0).toFixed(3)}</td>
-      <td>${e.included ? '<span class="badge yes">included</span>' : '<span class="badge no">excluded</span>'}</td>
-      <td>${e.reason || ""}</td>
+      <td style="padding-left:${8 + p.depth * 16}px"><code>${p.name}</code></td>
+      <td>${p.seconds.toFixed(3)}</td>
+      <td><span class="bar" style="width:${Math.round(p.seconds / top * 200)}px"></span> ${(p.seconds / top * 100).toFixed(1)}%</td>
+      <td>${counts(p.counts)}</td>
+      <td>${p.peak_rss_mb != null ? p.peak_rss_mb.toFixed(1) : "-"}</td>
     </tr>
   `).join("");
-
+  // trends: top-level phase seconds stored on each run record
+  const runs = (hist.recent || []).filter(r => r.phases).reverse();
+  const names = [...new Set(runs.flatMap(r => Object.keys(r.phases)))];
+  const trends = names.map(name => {
+    const xs = runs.filter(r => name in r.phases).map(r => r.phases[name]);
+    const last = xs[xs.length - 1];
+    const median = [...xs].sort((a, b) => a - b)[Math.floor(xs.length / 2)];
+    return `<tr><td><code>${name}</code></td><td>${sparkline(xs)}</td><td>${last.toFixed(3)}</td><td>${median.toFixed(3)}</td></tr>`;
+  }).join("");
   container.innerHTML = `
-    <table class="table">
-      <thead>
-        <tr>
-          <th>Test</th>
-          <th>Affected?</th>
-          <th>Fail rate</th>
-          <th>Flaky rate</th>
-          <th>Runtime norm</th>
-          <th>Score</th>
-          <th>Decision</th>
-          <th>Reason</th>
-        </tr>
-      </thead>
+    <p><strong>Last command:</strong> ${t.command || "-"} &nbsp; <strong>Total:</strong> ${t.total_seconds != null ? t.total_seconds.toFixed(3) + "s" : "-"}
+      &nbsp; <strong>Peak RSS:</strong> ${t.peak_rss_mb != null ? t.peak_rss_mb + " MB" : "-"}
+      ${t.children_peak_rss_mb != null ? `(children ${t.children_peak_rss_mb} MB)` : ""}</p>
+    ${phases.length ? `<table class="table">
+      <thead><tr><th>Phase</th><th>Seconds</th><th>Share</th><th>Items</th><th>Peak RSS MB</th></tr></thead>
       <tbody>${rows}</tbody>
-    </table>
+    </table>` : "<p><em>No phases recorded.</em></p>"}
+    ${trends ? `<h3>Trends over the last ${runs.length} recorded run(s)</h3>
+    <table class="table">
+      <thead><tr><th>Phase</th><th>Seconds per run</th><th>Last</th><th>Median</th></tr></thead>
+      <tbody>${trends}</tbody>
+    </table>` : ""}
   `;
 }
 
-function renderHistory(hist) {
+async function renderHistory(hist, page = 0) {
   const container = document.getElementById("history");
-  const runs = (hist.runs||[]);
-  if (!runs.length) { container.textContent = "No history yet."; return; }
+  if (!hist.runs) { container.textContent = "No history yet."; return; }
+  const runs = await loadPage("runs", page);
   const rows = runs.map(r => `
     <tr>
       <td>${new Date((r.time||0)*1000).toLocaleString()}</td>
       <td>${r.project}</td>
       <td>${r.count}</td>
       <td>${r.failed}</td>
+      <td>${r.predicted_seconds != null ? r.predicted_seconds.toFixed(2) : "-"}</td>
+      <td>${r.actual_seconds != null ? r.actual_seconds.toFixed(2) : "-"}</td>
     </tr>
   `).join("");
   container.innerHTML = `
+    <p>${hist.runs} run(s), newest first &nbsp;
+      <button id="hist-newer" ${page === 0 ? "disabled" : ""}>Newer</button>
+      page ${page + 1} / ${hist.pages}
+      <button id="hist-older" ${page + 1 >= hist.pages ? "disabled" : ""}>Older</button></p>
     <table class="table">
-      <thead><tr><th>Time</th><th>Project</th><th># Tests</th><th># Failed</th></tr></thead>
+      <thead><tr><th>Time</th><th>Project</th><th># Tests</th><th># Failed</th><th>Predicted s</th><th>Actual s</th></tr></thead>
       <tbody>${rows}</tbody>
     </table>
   `;
+  document.getElementById("hist-newer").addEventListener("click", () => renderHistory(hist, page - 1));
+  document.getElementById("hist-older").addEventListener("click", () => renderHistory(hist, page + 1));
 }
 
 async function render() {
   try {
-    const data = await loadJSON("./data/latest.json");
+    let data = await loadJSON("./data/latest.json");
+    if (!REPORT || REPORT.pages !== data.pages) PAGES.clear();
+    if (!data.format) data = fromLegacy(data);
+    REPORT = data;
     renderMeta(data.selection || {});
-    renderExplanations(data.explanations || {}, data.selection || {});
-    renderHistory(data.history || {});
+    renderExplanations(data.explanations || {});
+    renderTimings(data.timings, data.history || {});
+    await renderHistory(data.history || {});
   } catch (e) {
     document.getElementById("meta").textContent = "Run the CLI to generate web/data/latest.json";
   }